@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+#coding: utf-8
+
+## A local stand-in for pastebin.com serving a synthetic or recorded corpus, so that the crawler can be
+## measured without hitting the real site. Every /archive poll publishes new_per_poll more pastes and lists
+## the archive_size newest ones; some pastes are deleted (404), some responses are slow and some polls
+## return a ban page, each with a configurable probability.
+
+from optparse import OptionParser
+import os
+import sys
+import gzip
+import html
+import random
+import string
+import threading
+import time
+import http.server
+import urllib.parse
+
+
+WORDS = ['the','data','user','server','config','login','value','string','return','function','print','import',
+         'class','error','token','admin','host','port','secret','while','table','select','from','where','list']
+SYNTAXES = ['None','None','None','Python','JavaScript','PHP','SQL','Bash','C++','Java','JSON','Lua']
+
+BAN_PAGE = b'''<html><head><title>Pastebin.com - Access Denied Warning</title></head><body>
+<p>Pastebin.com has blocked your IP because of unatural browsing behavior.</p></body></html>'''
+
+def synthetic_paste(size, rnd):
+    words = []
+    length = 0
+    while length < size:
+        p = rnd.random()
+        if p < 0.002:
+            word = ''.join(rnd.choice(string.ascii_lowercase) for _ in range(8)) + '@example.com'
+        elif p < 0.003:
+            word = 'password=' + ''.join(rnd.choice(string.ascii_letters) for _ in range(10))
+        else:
+            word = rnd.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return ' '.join(words)[:size]
+
+def synthetic_corpus(count, rnd, big_ratio=0.01):
+    corpus = []
+    for n in range(count):
+        paste_id = ''.join(rnd.choice(string.ascii_letters + string.digits) for _ in range(8))
+        size = int(rnd.lognormvariate(7.5, 1.2)) if rnd.random() >= big_ratio else rnd.randint(1024*300, 1024*1024)
+        corpus.append({'id':paste_id, 'title':'Untitled' if rnd.random() < 0.7 else ' '.join(rnd.choice(WORDS) for _ in range(3)),
+                       'syntax':rnd.choice(SYNTAXES), 'body':synthetic_paste(size, rnd)})
+    return corpus
+
+def recorded_corpus(directory, rnd):
+## every <id>.txt file of directory is a paste body
+    corpus = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith('.txt'):
+            with open(os.path.join(directory, name), 'r', encoding='utf-8', errors='replace') as f:
+                corpus.append({'id':name[:-4], 'title':'Untitled', 'syntax':rnd.choice(SYNTAXES), 'body':f.read()})
+    return corpus
+
+class FakePastebin:
+    archive_size = 50
+    new_per_poll = 25
+
+    def __init__(self, corpus, seed=1, missing_ratio=0.02, slow_ratio=0.02, slow_delay=1.0, latency=0.0, ban_ratio=0.0):
+        self.corpus = corpus
+        self.rnd = random.Random(seed)
+        self.missing = set(p['id'] for p in corpus if self.rnd.random() < missing_ratio)
+        self.by_id = {p['id']:p for p in corpus}
+        self.slow_ratio = slow_ratio
+        self.slow_delay = slow_delay
+        self.latency = latency
+        self.ban_ratio = ban_ratio
+        self.published = 0
+        self.started = {}
+        self.lock = threading.Lock()
+        self.requests = {'archive':0, 'paste':0, 'raw':0, 'missing':0, 'banned':0, 'not_modified':0}
+
+    def archive_page(self):
+        rows = []
+        for p in reversed(self.corpus[max(0,self.published-self.archive_size):self.published]):
+            age = int(time.time() - self.started.get(p['id'], time.time()))
+            rows.append('<tr>\n<td><img src="/i/t.gif" class="i_p0" alt="" border="0" /><a href="/{:s}">{:s}</a></td>\n'
+                        '<td class="td_smaller h_800">{:d} sec ago</td>\n<td class="td_smaller h_800"><a href="/archive/{:s}">{:s}</a></td>\n</tr>'.format(
+                        p['id'], html.escape(p['title']), age, p['syntax'].lower(), html.escape(p['syntax'])))
+        return ('<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>Pastes Archive - Pastebin.com</title></head><body>\n'
+                '<table class="maintable">\n<tr class="top">\n<th scope="col" align="left">Name / Title</th>\n<th scope="col" align="left">Posted</th>\n'
+                '<th scope="col" align="left">Syntax</th>\n</tr>\n' + '\n'.join(rows) + '\n</table>\n</body></html>').encode('utf-8')
+
+    def paste_page(self, p):
+        return ('<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>{:s} - Pastebin.com</title></head><body>\n'
+                '<div id="content_left"><div class="paste_box_info">{:s}</div>\n'
+                '<textarea id="paste_code" class="paste_code" name="paste_code">{:s}</textarea></div>\n</body></html>').format(
+                html.escape(p['title']), html.escape(p['syntax']), html.escape(p['body'])).encode('utf-8')
+
+    def handle(self, path, headers):
+## returns (status, content type, body, extra headers)
+        parts = urllib.parse.urlsplit(path)
+        with self.lock:
+            if parts.path == '/archive':
+                self.requests['archive'] += 1
+                if self.rnd.random() < self.ban_ratio:
+                    self.requests['banned'] += 1
+                    return 200, 'text/html; charset=utf-8', BAN_PAGE, {}
+                if headers.get('If-None-Match') == '"{:d}"'.format(self.published) and self.published == len(self.corpus):
+                    self.requests['not_modified'] += 1
+                    return 304, None, b'', {'ETag':'"{:d}"'.format(self.published)}
+                for p in self.corpus[self.published:self.published+self.new_per_poll]:
+                    self.started[p['id']] = time.time()
+                self.published = min(len(self.corpus), self.published + self.new_per_poll)
+                return 200, 'text/html; charset=utf-8', self.archive_page(), {'ETag':'"{:d}"'.format(self.published)}
+
+            if parts.path in ('/raw.php', '/raw') or parts.path.startswith('/raw/'):
+                self.requests['raw'] += 1
+                paste_id = urllib.parse.parse_qs(parts.query).get('i', [''])[0] if parts.path == '/raw.php' else parts.path[len('/raw/'):]
+                raw = True
+            else:
+                self.requests['paste'] += 1
+                paste_id = parts.path.strip('/')
+                raw = False
+            paste_id = paste_id.strip('/')
+            p = self.by_id.get(paste_id)
+            if p is None or paste_id in self.missing:
+                self.requests['missing'] += 1
+                return 404, 'text/html; charset=utf-8', b'<html><body>Not Found (#404)</body></html>', {}
+            slow = self.rnd.random() < self.slow_ratio
+        if slow:
+            time.sleep(self.slow_delay)
+        if raw:
+            return 200, 'text/plain; charset=utf-8', p['body'].encode('utf-8'), {}
+        return 200, 'text/html; charset=utf-8', self.paste_page(p), {}
+
+    def start(self, host='127.0.0.1', port=0):
+        fake = self
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+            def log_message(self, *args):
+                pass
+            def do_GET(self):
+                if fake.latency:
+                    time.sleep(fake.latency)
+                status,content_type,body,extra = fake.handle(self.path, self.headers)
+                if body and 'gzip' in (self.headers.get('Accept-Encoding') or ''):
+                    body = gzip.compress(body, 5)
+                    extra = dict(extra, **{'Content-Encoding':'gzip'})
+                self.send_response(status)
+                if content_type:
+                    self.send_header('Content-Type', content_type)
+                for key,value in extra.items():
+                    self.send_header(key, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+        self.server = http.server.ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name='fake-pastebin', daemon=True)
+        self.thread.start()
+        return 'http://{:s}:{:d}'.format(host, self.server.server_port)
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+def parse_input():
+    parser = OptionParser()
+    parser.add_option('--host', help='Set the address to listen on (default: 127.0.0.1)', dest='host', default='127.0.0.1')
+    parser.add_option('--port', help='Set the port to listen on, 0 for any free port (default: 8080)', dest='port', type='int', default=8080)
+    parser.add_option('--corpus', help='Serve the <id>.txt files of this directory instead of a synthetic corpus', dest='corpus', default=None)
+    parser.add_option('-n', '--pastes', help='Set the number of synthetic pastes (default: 1000)', dest='pastes', type='int', default=1000)
+    parser.add_option('--archive-size', help='Set the number of pastes listed by /archive (default: 50)', dest='archive_size', type='int', default=50)
+    parser.add_option('--new-per-poll', help='Set the number of pastes published by each /archive poll (default: 25)', dest='new_per_poll', type='int', default=25)
+    parser.add_option('--missing-ratio', help='Set the share of pastes answering 404 (default: 0.02)', dest='missing_ratio', type='float', default=0.02)
+    parser.add_option('--slow-ratio', help='Set the share of slow paste responses (default: 0.02)', dest='slow_ratio', type='float', default=0.02)
+    parser.add_option('--slow-delay', help='Set the seconds a slow response takes (default: 1)', dest='slow_delay', type='float', default=1.0)
+    parser.add_option('--latency', help='Set the seconds added to every response (default: 0)', dest='latency', type='float', default=0.0)
+    parser.add_option('--ban-ratio', help='Set the share of /archive polls answered with the ban page (default: 0)', dest='ban_ratio', type='float', default=0.0)
+    parser.add_option('--seed', help='Set the random seed (default: 1)', dest='seed', type='int', default=1)
+    (options, args) = parser.parse_args()
+    return options
+
+def from_options(options):
+    rnd = random.Random(options.seed)
+    corpus = recorded_corpus(options.corpus, rnd) if options.corpus else synthetic_corpus(options.pastes, rnd)
+    fake = FakePastebin(corpus, seed=options.seed, missing_ratio=options.missing_ratio, slow_ratio=options.slow_ratio,
+                        slow_delay=options.slow_delay, latency=options.latency, ban_ratio=options.ban_ratio)
+    fake.archive_size = options.archive_size
+    fake.new_per_poll = options.new_per_poll
+    return fake
+
+
+if __name__ == "__main__":
+    options = parse_input()
+    fake = from_options(options)
+    url = fake.start(options.host, options.port)
+    print('Serving {:d} pastes on {:s}'.format(len(fake.corpus), url))
+    sys.stdout.flush()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        fake.stop()
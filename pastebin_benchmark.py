@@ -0,0 +1,591 @@
+#!/usr/bin/env python3
+#coding: utf-8
+
+from optparse import OptionParser
+import os
+import sys
+import re
+import time
+import random
+import string
+import tempfile
+import subprocess
+import resource
+import bisect
+import collections
+import math
+import itertools
+import base64
+import gzip
+
+from pastebin_crawler import Crawler, RuleSet, Prefilter, RateController, Scheduler, ArchiveEntry, HttpResponse, Logger, get_timestamp
+from fake_pastebin import synthetic_paste, synthetic_corpus, FakePastebin, WORDS, SYNTAXES
+from pyquery import PyQuery
+
+
+def synthetic_rules(base, count, rnd):
+## pads base with rules made of the words of synthetic_paste, so that their literals occur in the pastes and
+## the literal prefilter keeps them as candidates: most of them match somewhere, some never do
+    rules = list(base)
+    while len(rules) < count:
+        n = len(rules)
+        first,second = rnd.choice(WORDS),rnd.choice(WORDS)
+        regex = rnd.choice(['\\b{:s}\\s+{:s}\\b', '({:s}|{:s})_key\\b', '{:s}\\W+(\\w+\\W+)?{:s}\\s+[a-z]{{4}}\\b']).format(first,second)
+        rules.append([regex, 'synthetic{:d}.txt'.format(n), 'synthetic{:d}'.format(n)])
+    return rules
+
+def legacy_scan(rules, paste_txt, first_only):
+## the per-rule loop used by Crawler.check_paste before RuleSet
+    found = []
+    for regex,file,directory in rules:
+        r = re.search(regex, paste_txt, re.IGNORECASE)
+        if r:
+            found.append(([regex,file,directory], r[0]))
+            if first_only:
+                break
+    return found
+
+def benchmark_rules(count, rnd):
+## the shipped rules padded to count, read next to this script whatever the working directory
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), Crawler.REGEXES_FILE), 'r') as f:
+        return synthetic_rules(Crawler.parse_regexes(f.readlines()), count, rnd)
+
+def timed(func, pastes):
+    start = time.perf_counter()
+    results = [func(paste) for paste in pastes]
+    return time.perf_counter() - start, results
+
+def bench_rules(options):
+    rnd = random.Random(options.seed)
+    rules = benchmark_rules(options.rules, rnd)
+    pastes = [synthetic_paste(options.size, rnd) for _ in range(options.pastes)]
+
+    start = time.perf_counter()
+    ruleset = RuleSet(rules, engine=options.rule_engine)
+    build = time.perf_counter() - start
+
+    first_time, _ = timed(lambda p: legacy_scan(rules, p, True), pastes)
+    all_time, expected = timed(lambda p: legacy_scan(rules, p, False), pastes)
+    set_time, results = timed(ruleset.scan, pastes)
+
+    mismatches = sum(1 for a,b in zip(expected, results) if [r for r,t in a] != [r for r,t in b])
+    print('{:d} rules, {:d} pastes of {:d} KB, {:s} engine (built in {:.3f}s)'.format(len(rules), len(pastes), options.size//1024, ruleset.engine, build))
+    print('  legacy loop, first match : {:8.2f} ms/paste'.format(first_time*1000/len(pastes)))
+    print('  legacy loop, all matches : {:8.2f} ms/paste'.format(all_time*1000/len(pastes)))
+    print('  RuleSet.scan             : {:8.2f} ms/paste ({:.1f}x faster than all matches)'.format(set_time*1000/len(pastes), all_time/set_time if set_time else 0))
+    print('  pastes with different matches: {:d}'.format(mismatches))
+
+PLANTED = 'pbmk'
+PLANTED_RULE = [PLANTED + '[0-9a-f]{24}', 'planted.txt', 'planted']
+
+def prefilter_corpus(options, rnd):
+## a paste stream with reposts, binary dumps and secrets hidden in base64, gzip+base64 or hex blobs. The
+## secrets are PLANTED tokens, found nowhere else, so that only the decoded blobs can match PLANTED_RULE.
+## Returns the pastes and the number of them with a secret.
+    pastes = []
+    planted = []
+    for n in range(options.pastes):
+        p = rnd.random()
+        if pastes and p < options.duplicate_ratio:
+            k = rnd.randrange(len(pastes))
+            pastes.append(pastes[k])
+            planted.append(planted[k])
+        elif p < options.duplicate_ratio + options.binary_ratio:
+            pastes.append(''.join(chr(rnd.randrange(0,256)) for _ in range(options.size)))
+            planted.append(False)
+        else:
+            paste = synthetic_paste(options.size, rnd)
+            planted.append(rnd.random() < options.encoded_ratio)
+            if planted[-1]:
+                secret = 'api_key=' + PLANTED + ''.join(rnd.choice('0123456789abcdef') for _ in range(24))
+                blob = rnd.choice([base64.b64encode(secret.encode()).decode(), base64.b64encode(gzip.compress(secret.encode())).decode(), secret.encode().hex()])
+                paste = paste[:len(paste)//2] + ' ' + blob + ' ' + paste[len(paste)//2:]
+            pastes.append(paste)
+    return pastes, sum(planted)
+
+def bench_prefilter(options):
+    rnd = random.Random(options.seed)
+    rules = benchmark_rules(options.rules - 1, rnd) + [PLANTED_RULE]
+    ruleset = RuleSet(rules, engine=options.rule_engine)
+    pastes,planted = prefilter_corpus(options, rnd)
+
+    plain_time, expected = timed(ruleset.scan, pastes)
+    prefilter = Prefilter()
+    def scan(paste_txt):
+        verdict,texts,matches = prefilter.prepare(paste_txt, ruleset.version)
+        if matches is None:
+            start = time.perf_counter()
+            found,decoded = ruleset.search_texts(texts)
+            matches = [(ruleset.rules[i], found[i]) for i in sorted(found)]
+            prefilter.scanned(paste_txt, ruleset.version, matches, time.perf_counter() - start, len(decoded))
+        return matches
+    prefilter_time, results = timed(scan, pastes)
+
+    found = sum(len(m) for m in expected)
+    print('{:d} rules, {:d} pastes of {:d} KB, {:.0f}% reposts, {:.0f}% binary, {:.0f}% of the others with an encoded secret'.format(
+        len(rules), len(pastes), options.size//1024, options.duplicate_ratio*100, options.binary_ratio*100, options.encoded_ratio*100))
+    print('  rules only        : {:8.2f} ms/paste, {:d} matches'.format(plain_time*1000/len(pastes), found))
+    print('  prefilter + rules : {:8.2f} ms/paste, {:d} matches ({:.1f}x faster)'.format(prefilter_time*1000/len(pastes), sum(len(m) for m in results), plain_time/prefilter_time if prefilter_time else 0))
+    print('  pastes missing matches found by the rules only: {:d}'.format(sum(1 for a,b in zip(expected, results) if {r[1] for r,t in a} - {r[1] for r,t in b})))
+    print('  planted secrets found in decoded blobs: {:d} of {:d} (rules only: {:d})'.format(
+        sum(1 for m in results if PLANTED_RULE in [r for r,t in m]), planted, sum(1 for m in expected if PLANTED_RULE in [r for r,t in m])))
+    print('  ' + prefilter.summary())
+
+def legacy_log(logfile, message, is_bold):
+## Logger.log before the shared handle: reopen the log, look for its last line and rewrite it if it is the status
+    messages = '[{:s}] '.format(get_timestamp()) + message
+    if not is_bold:
+        messages = 'Status:' + messages
+    if not os.path.exists(logfile):
+        with open(logfile,'a+') as logf:
+            logf.write('Status: \n')
+    with open(logfile,'rb+') as logf:	# to replace
+        pos = logf.seek(0, os.SEEK_END) - 1
+        while pos >= 0:
+            a = logf.read(1)
+            if a == b'\n':
+                pos += 1	# move to next chat to '\n'
+                break;
+            pos = (pos - 1) if pos > 1 else 0
+            logf.seek(pos, os.SEEK_SET)
+        logf.seek(pos, os.SEEK_SET)
+        a = logf.read(7) or ''
+        if a != b'Status:':
+            logf.seek(0, os.SEEK_END)	# append to the end of file
+        else:
+            logf.seek(pos, os.SEEK_SET)	# overwrite the last line to continuously update status w/o increase log file
+        logf.truncate()
+        logf.write((messages+os.linesep).encode('utf-8'))
+
+def bench_logger(options):
+    rnd = random.Random(options.seed)
+    calls = [(rnd.random() < options.bold_ratio) for _ in range(options.calls)]
+    message = 'Start to match /AbCdEfGh against 300 rules ...'
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            with open('legacy.log', 'w') as f:	# a log with some history, like a long running crawler has
+                f.write(('[2019/01/01 00:00:00] ' + message + os.linesep) * 10000 + 'Status: ' + os.linesep)
+            start = time.perf_counter()
+            for is_bold in calls:
+                legacy_log('legacy.log', message, is_bold)
+            legacy = time.perf_counter() - start
+
+            Logger.logfile = 'pastebin_crawler.log'
+            Logger.statusfile = 'pastebin_crawler.status'
+            start = time.perf_counter()
+            for is_bold in calls:
+                Logger().log(message, is_bold)
+            Logger.flush()
+            current = time.perf_counter() - start
+        finally:
+            os.chdir(cwd)
+    print('{:d} log calls, {:.0f}% of them bold'.format(len(calls), options.bold_ratio*100))
+    print('  legacy Logger.log : {:10.0f} calls/s'.format(len(calls)/legacy))
+    print('  Logger.log        : {:10.0f} calls/s ({:.1f}x)'.format(len(calls)/current, legacy/current))
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values)-1, int(len(values)*p))] if values else 0
+
+def bench_replay(options):
+## drive get_pastes/check_paste/save_result against fake_pastebin.py, run as a separate process
+    here = os.path.dirname(os.path.abspath(__file__))
+    server = subprocess.Popen([sys.executable, os.path.join(here, 'fake_pastebin.py'), '--port', '0', '-n', str(options.pastes),
+                               '--latency', str(options.latency), '--missing-ratio', str(options.missing_ratio), '--slow-ratio', str(options.slow_ratio),
+                               '--ban-ratio', str(options.ban_ratio), '--seed', str(options.seed)], stdout=subprocess.PIPE, universal_newlines=True)
+    cwd = os.getcwd()
+    try:
+        url = server.stdout.readline().split()[-1]
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            os.mkdir('data')
+            crawler = Crawler(seen_db='', checkpoint='', base_url=url, fetch_mode=options.fetch_mode, workers=options.workers, scan_processes=options.scan_processes, rule_engine=options.rule_engine,
+                              storage=options.storage, writer_fsync=options.writer_fsync, max_rate=options.max_rate or 1000)
+            crawler.REGEXES_FILE = os.path.join(here, Crawler.REGEXES_FILE)
+            crawler.conclude_on_delete = False
+            crawler.read_regexes()
+
+            latencies = []
+            fetch_paste = crawler.fetch_paste
+            def timed_fetch(paste_id):
+                start = time.perf_counter()
+                try:
+                    return fetch_paste(paste_id)
+                finally:
+                    latencies.append(time.perf_counter() - start)
+            crawler.fetch_paste = timed_fetch
+            crawler.start_workers(0)
+
+            start = time.perf_counter()
+            polls = banned = 0
+            while True:
+                status,pastes = crawler.get_pastes()
+                polls += 1
+                if status == Crawler.ACCESS_DENIED:
+                    banned += 1
+                    continue
+                if status != Crawler.OK:
+                    break
+                new = [paste_id for paste_id in (paste.id for paste in pastes) if paste_id not in crawler.seen]
+                if not new:
+                    break
+                for paste_id in new:
+                    crawler.seen.add(paste_id)
+                    if crawler.workers > 1:
+                        crawler.dispatch_paste(paste_id)
+                    else:
+                        crawler.check_paste(paste_id)
+                if crawler.workers > 1:
+                    crawler.drain_workers()
+                else:
+                    crawler.wait_scans()
+            crawler.writer.close()
+            elapsed = time.perf_counter() - start
+            total = crawler.http.totals
+            stored = crawler.store.summary() if crawler.store is not None else '{:d} files'.format(sum(len(files) for _,_,files in os.walk('data')))
+            if crawler.scan_pool is not None:
+                crawler.scan_pool.close()
+    finally:
+        os.chdir(cwd)
+        server.terminate()
+        server.wait()
+
+    print('{:d} pastes in {:d} archive polls ({:d} banned), {:s} fetch, {:d} workers, {:d} scanning processes'.format(
+        crawler.totalpastes, polls, banned, options.fetch_mode, options.workers, options.scan_processes))
+    print('  throughput : {:8.1f} pastes/s, {:8.1f} KB/s'.format(crawler.totalpastes/elapsed, total['bytes']/1024/elapsed))
+    print('  latency    : p50 {:.1f} ms, p90 {:.1f} ms, p99 {:.1f} ms, max {:.1f} ms'.format(
+        percentile(latencies,0.5)*1000, percentile(latencies,0.9)*1000, percentile(latencies,0.99)*1000, max(latencies or [0])*1000))
+    print('  results    : {:d} recorded, {:d} errors'.format(crawler.validpastes, crawler.totalerrors))
+    print('  storage    : ' + stored)
+    print('  writer     : ' + crawler.writer.summary())
+    print('  prefilter  : ' + crawler.prefilter.summary())
+    print('  memory     : {:.1f} MB high-water mark'.format(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024))
+
+def archive_snapshots(options):
+## the pages saved by pastebin_crawler.py --archive-snapshots, or pages of a synthetic corpus
+    if options.snapshots:
+        pages = []
+        for name in sorted(os.listdir(options.snapshots)):
+            if name.endswith('.html'):
+                with open(os.path.join(options.snapshots, name), 'rb') as f:
+                    pages.append(f.read())
+        return pages
+    rnd = random.Random(options.seed)
+    fake = FakePastebin(synthetic_corpus(FakePastebin.archive_size + options.pastes*FakePastebin.new_per_poll, rnd, big_ratio=0), seed=options.seed)
+    pages = []
+    for n in range(options.pastes):
+        fake.handle('/archive', {})
+        pages.append(fake.archive_page())
+    return pages
+
+def bench_archive(options):
+    pages = archive_snapshots(options)
+    crawler = Crawler(seen_db='', checkpoint='')
+    crawler.conclude_on_delete = False	# the statistics of a crawler that fetched nothing
+    responses = [HttpResponse(Crawler.PASTES_URL, 200, 'OK', None, page, None) for page in pages]
+
+    fast_time, fast = timed(lambda response: Crawler.parse_archive(response.body), responses)
+    dom_time, dom = timed(lambda response: crawler.dom_archive(response)[1], responses)
+
+    rows = sum(len(entries) for entries in dom)
+    different = sum(1 for a,b in zip(fast, dom) for x,y in itertools.zip_longest(a, b) if x is None or y is None or (x.id, x.syntax, x.age) != (y.id, y.syntax, y.age))
+    print('{:d} archive pages, {:d} pastes listed ({:s})'.format(len(pages), rows, options.snapshots or 'synthetic'))
+    print('  PyQuery DOM   : {:8.3f} ms/page'.format(dom_time*1000/len(pages)))
+    print('  parse_archive : {:8.3f} ms/page ({:.1f}x faster)'.format(fast_time*1000/len(pages), dom_time/fast_time if fast_time else 0))
+    print('  pages the fast path could not parse: {:d}, pastes with different id/syntax/age: {:d}'.format(sum(1 for entries in fast if not entries), different))
+
+class SimulatedSite:
+## pastebin as seen by the rate controller: pastes arrive as a poisson process following a daily cycle, more
+## than soft_limit requests/s over 10s are answered 429 and more than ban_limit over a minute get a ban.
+## Arrivals have their own random generator, so every policy faces the same pastes.
+    archive_size = 50
+
+    def __init__(self, seed, arrival, ban_limit, soft_limit, ban_minutes=30, latency=0.2):
+        self.arrivals = random.Random(seed)
+        self.rnd = random.Random(seed + 1)	# latencies, drawn per request
+        self.arrival = arrival
+        self.ban_limit = ban_limit
+        self.soft_limit = soft_limit
+        self.ban_minutes = ban_minutes
+        self.latency = latency
+        self.pastes = []
+        self.times = []	# arrival time of each paste
+        self.next_paste = 0.0
+        self.requests = collections.deque()
+        self.banned_until = 0
+        self.counters = collections.Counter()
+
+    def advance(self, now):
+        while self.next_paste <= now:
+            self.pastes.append(len(self.pastes))
+            self.times.append(self.next_paste)
+            rate = self.arrival*(1 + 0.5*math.sin(2*math.pi*self.next_paste/86400))
+            self.next_paste += self.arrivals.expovariate(rate)
+
+    def window(self, now, span):
+        return sum(1 for t in self.requests if t > now - span)/span
+
+    def request(self, now):
+        self.requests.append(now)
+        while self.requests and self.requests[0] < now - 60:
+            self.requests.popleft()
+        if now < self.banned_until:
+            self.counters['banned'] += 1
+            return 'ban', self.latency
+        recent = self.window(now, 60)
+        if recent > self.ban_limit:
+            self.banned_until = now + self.ban_minutes*60
+            self.counters['bans'] += 1
+            return 'ban', self.latency
+        if self.window(now, 10) > self.soft_limit:
+            self.counters['429'] += 1
+            return 429, self.latency
+        return 200, self.latency*(1 + (recent/self.ban_limit)**4)*self.rnd.lognormvariate(0, 0.3)
+
+    def archive(self, now):
+        self.advance(now)
+        status,latency = self.request(now)
+        return status, latency, self.pastes[-self.archive_size:]
+
+class DelayFactor:
+## the pacing before RateController: the delay times a factor adjusted after each archive page, up by 0.04
+## per paste already checked on it (caught up), else down by 0.24, within [0.5, 1.6] and reset by a ban.
+## The refresh time is constant and the delay is jittered by 0.6-1.1 instead of 0.7-1.2.
+    jitter = (0.6, 1.1)
+    min_factor = 0.5
+    max_factor = 1.6
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.factor = 1
+    def interval(self): return self.delay*self.factor
+    def rate(self): return 1/self.interval()
+    def refresh(self, refresh_time): return refresh_time
+    def success(self, latency): pass
+    def throttled(self, code): pass
+    def banned(self): self.factor = 1
+    def error(self): pass
+    def archive(self, listed, new):
+        if new < listed:	# caught up, slow down a little bit
+            self.factor = self.max_factor if self.factor >= self.max_factor else self.factor + 0.04*(listed - new)
+        else:	# speed up a little bit
+            self.factor = self.min_factor if self.factor <= self.min_factor else self.factor - 0.24
+    def summary(self): return 'delay factor {:.2f}, {:.2f}s between pastes'.format(self.factor, self.interval())
+
+def simulate_rate(options, policy):
+    rnd = random.Random(options.seed + 2)	# the policy's own draws, the site has its own
+    clock = [0.0]
+    site = SimulatedSite(options.seed, options.arrival, options.ban_limit, options.ban_limit*0.8)
+    pace = RateController(options.delay, max_rate=options.max_rate or 2, clock=lambda: clock[0]) if policy == 'adaptive' else DelayFactor(options.delay)
+    jitter = getattr(pace, 'jitter', (0.7, 1.2))
+    seen = set()
+    fetched = 0
+    end = options.hours*3600
+    trace = []
+    while clock[0] < end:
+        status,latency,listed = site.archive(clock[0])
+        clock[0] += latency
+        if status == 'ban':
+            pace.banned()
+            clock[0] += min(60, math.ceil(options.ban_wait*rnd.gauss(1.2,0.2)))*60
+            continue
+        new = [paste for paste in listed if paste not in seen]
+        pace.archive(len(listed), len(new))
+        start = clock[0]
+        for paste in new:
+            seen.add(paste)
+            status,latency = site.request(clock[0])
+            clock[0] += latency
+            if status == 200:
+                pace.success(latency)
+                fetched += 1
+            elif status == 429:	# forgotten, fetched again if the next archive page still lists it
+                pace.throttled(429)
+                seen.discard(paste)
+            else:
+                pace.banned()
+                break
+            clock[0] += max(0, pace.interval()*rnd.uniform(*jitter) - latency)	# requests start interval apart, like RateLimiter
+        clock[0] = max(clock[0], start + pace.refresh(options.refresh_time)*rnd.gauss(1,0.2))
+        if options.trace and int(clock[0]//3600) > len(trace):
+            trace.append('  {:4d}h {:s}'.format(len(trace)+1, pace.summary()))
+    site.advance(end)
+    arrived = bisect.bisect_right(site.times, end)	# the run overshoots end by a different time for each policy
+    print('{:s}: {:d} pastes arrived in {:.0f}h, {:d} fetched, {:d} missed ({:.1f}%), {:d} bans, {:d} requests while banned, {:d} answered 429'.format(
+        policy, arrived, options.hours, fetched, arrived - fetched, (arrived - fetched)*100/arrived if arrived else 0, site.counters['bans'], site.counters['banned'], site.counters['429']))
+    for line in trace:
+        print(line)
+    print('  ' + pace.summary())
+
+def bench_rate(options):
+## offline simulation of the pacing policies against SimulatedSite, to tune RateController without being banned
+    for policy in (('adaptive', 'legacy') if options.policy == 'both' else (options.policy,)):
+        simulate_rate(options, policy)
+
+class SimulatedArchive:
+## pastes with archive rows arriving as a poisson process, for the scheduling policies. Whether a paste
+## matches the rules and when it is deleted depend on its row: titles like 'db dump' are leaks, matching
+## and reported often; untitled plain text is mostly spam, removed quickly; some pastes expire after 10 min
+    archive_size = 50
+    LEAKS = ['db dump', 'combo list', 'leaked accounts', 'smtp config', 'api keys', 'mail pass']
+
+    def __init__(self, rnd, arrival):
+        self.rnd = rnd
+        self.arrival = arrival
+        self.pastes = collections.OrderedDict()	# id -> (row, created, deleted at, matches)
+        self.next_paste = 0.0
+
+    def advance(self, now):
+        rnd = self.rnd
+        while self.next_paste <= now:
+            paste_id = 'p{:07d}'.format(len(self.pastes))
+            syntax = rnd.choice(SYNTAXES)
+            leak = rnd.random() < 0.08
+            title = rnd.choice(self.LEAKS) if leak else ('Untitled' if rnd.random() < 0.75 else ' '.join(rnd.choice(WORDS) for _ in range(3)))
+            size = int(rnd.lognormvariate(7.5, 1.2))
+            spam = title == 'Untitled' and syntax == 'None'
+            matches = rnd.random() < (0.5 if leak else 0.04) + (0.1 if size > 8*1024 else 0)
+            lifetime = float('inf')
+            if leak and rnd.random() < 0.5:
+                lifetime = rnd.expovariate(1/900)
+            elif spam and rnd.random() < 0.3:
+                lifetime = rnd.expovariate(1/300)
+            elif rnd.random() < 0.05:
+                lifetime = 600
+            self.pastes[paste_id] = (ArchiveEntry(paste_id, title, syntax, None, size), self.next_paste, self.next_paste + lifetime, matches)
+            self.next_paste += rnd.expovariate(self.arrival)
+
+    def listed(self, now):
+        self.advance(now)
+        return [row._replace(age=int(now - created)) for row,created,deleted,matches in reversed(list(self.pastes.values())[-self.archive_size:])]
+
+def simulate_schedule(options, policy, deadline=True):
+## one simulated day of a policy; with deadline, what is not fetched within the refresh time (the measured
+## interval between polls, see RateController.deadline) is left to an early re-poll, as Crawler.start does
+    rnd = random.Random(options.seed)
+    clock = [0.0]
+    site = SimulatedArchive(random.Random(options.seed), options.arrival)	# the same pastes for every policy
+    scheduler = Scheduler(policy, urgency=options.urgency, clock=lambda: clock[0])
+    seen = set()
+    pending = collections.OrderedDict()	# like Crawler.take_backlog
+    counters = collections.Counter()
+    end = options.hours*3600
+    while clock[0] < end:
+        polled = clock[0]
+        listed = site.listed(clock[0])
+        ids = set(row.id for row in listed)
+        backlog = []
+        for paste_id,attempts in list(pending.items()):
+            if paste_id in ids:
+                continue
+            if attempts >= Crawler.PENDING_RETRIES:
+                del pending[paste_id]
+                continue
+            pending[paste_id] = attempts + 1
+            backlog.append(ArchiveEntry(paste_id, None, None, None, None))
+        new = [row for row in listed if row.id not in seen]
+        for row in new:
+            pending.setdefault(row.id, 0)
+        until = polled + options.refresh_time if deadline else None
+        for row in scheduler.order(backlog + new):
+            if until is not None and clock[0] > until:
+                scheduler.deferred(row.id)
+                continue
+            seen.add(row.id)
+            del pending[row.id]
+            created,deleted,matches = site.pastes[row.id][1:]
+            outcome = 'gone' if clock[0] >= deleted else ('matched' if matches else 'clean')
+            scheduler.outcome(row.id, outcome)
+            counters[outcome] += 1
+            if outcome != 'gone' and deleted < float('inf'):
+                counters['saved'] += 1
+                counters['saved_matching'] += matches
+            clock[0] += rnd.uniform(0.7,1.2)/options.fetch_rate
+        if until is None or clock[0] <= until:
+            clock[0] = max(clock[0], polled + options.refresh_time*rnd.gauss(1,0.2))
+        else:	# like Crawler.start, pastes were left over: re-poll once the pace allows another request
+            clock[0] += rnd.uniform(0.7,1.2)/options.fetch_rate
+    site.advance(end)
+    pastes = [paste for paste in site.pastes.values() if paste[1] < end]
+    deleted = sum(1 for paste in pastes if paste[2] < float('inf'))
+    matching = sum(1 for paste in pastes if paste[3])
+    fetched = counters['matched'] + counters['clean']
+    print('{:s}{:s}: {:d} pastes arrived in {:.0f}h, {:d} fetched, {:d} answered 404, {:d} never fetched; {:d} matching pastes caught out of {:d}'.format(
+        policy, ' with a deadline' if deadline else '', len(pastes), options.hours, fetched, counters['gone'], len(pastes) - fetched - counters['gone'], counters['matched'], matching))
+    print('  saved from 404: {:d} of the {:d} deleted pastes, {:d} of them matching'.format(counters['saved'], deleted, counters['saved_matching']))
+    print('  ' + scheduler.summary())
+    return counters
+
+def bench_schedule(options):
+## offline simulation of the scheduling policies when the crawler falls behind the archive
+## page order is also played without a deadline, the way the crawler runs it, so that the gain of the
+## order is told apart from the one of the deadline
+    policies = Scheduler.POLICIES if options.schedule == 'both' else (options.schedule,)
+    results = {(policy, True):simulate_schedule(options, policy) for policy in policies}
+    if 'page' in policies:
+        results['page', False] = simulate_schedule(options, 'page', deadline=False)
+    def compare(label, a, b):
+        print('{:s}: {:+d} pastes saved from 404 ({:+d} matching), {:+d} matching pastes caught'.format(
+            label, a['saved'] - b['saved'], a['saved_matching'] - b['saved_matching'], a['matched'] - b['matched']))
+    if ('priority', True) in results and ('page', True) in results:
+        compare('priority against page order, both with the deadline', results['priority', True], results['page', True])
+    if ('page', False) in results:
+        compare('page order with the deadline against without', results['page', True], results['page', False])
+        if ('priority', True) in results:
+            compare('priority with the deadline against page order without', results['priority', True], results['page', False])
+
+BENCHMARKS = {
+    'rules': bench_rules,
+    'logger': bench_logger,
+    'replay': bench_replay,
+    'rate': bench_rate,
+    'archive': bench_archive,
+    'prefilter': bench_prefilter,
+    'schedule': bench_schedule,
+}
+
+def parse_input():
+    parser = OptionParser(usage='%prog [options] {:s}'.format('|'.join(sorted(BENCHMARKS))))
+    parser.add_option('-n', '--pastes', help='Set the number of synthetic pastes (default: 50)', dest='pastes', type='int', default=50)
+    parser.add_option('-s', '--size', help='Set the size of each synthetic paste in bytes (default: 262144)', dest='size', type='int', default=1024*256)
+    parser.add_option('--rules', help='Pad regexes.txt with synthetic rules up to this count (default: 300)', dest='rules', type='int', default=300)
+    parser.add_option('--rule-engine', help='Set the regex matching engine: auto, python or hyperscan (default: auto)', dest='rule_engine', type='choice', choices=RuleSet.ENGINES, default='auto')
+    parser.add_option('--calls', help='Set the number of log calls (default: 20000)', dest='calls', type='int', default=20000)
+    parser.add_option('--bold-ratio', help='Set the share of bold log calls, the others update the status (default: 0.1)', dest='bold_ratio', type='float', default=0.1)
+    parser.add_option('--latency', help='replay: Set the seconds the fake pastebin adds to every response (default: 0.01)', dest='latency', type='float', default=0.01)
+    parser.add_option('--missing-ratio', help='replay: Set the share of pastes answering 404 (default: 0.02)', dest='missing_ratio', type='float', default=0.02)
+    parser.add_option('--slow-ratio', help='replay: Set the share of slow paste responses (default: 0.02)', dest='slow_ratio', type='float', default=0.02)
+    parser.add_option('--ban-ratio', help='replay: Set the share of archive polls answered with the ban page (default: 0)', dest='ban_ratio', type='float', default=0.0)
+    parser.add_option('--fetch-mode', help='replay: Set how pastes are fetched, raw or html (default: raw)', dest='fetch_mode', type='choice', choices=Crawler.FETCH_MODES, default='raw')
+    parser.add_option('-w', '--workers', help='replay: Set the number of pastes fetched concurrently (default: 1)', dest='workers', type='int', default=1)
+    parser.add_option('-p', '--scan-processes', help='replay: Set the number of processes matching pastes (default: 0)', dest='scan_processes', type='int', default=0)
+    parser.add_option('--storage', help='replay: Set how matching pastes are saved, files or store (default: files)', dest='storage', type='choice', choices=Crawler.STORAGES, default='files')
+    parser.add_option('--writer-fsync', help='replay: Set when written results are synced to disk, none or batch (default: none)', dest='writer_fsync', type='choice', choices=('none','batch'), default='none')
+    parser.add_option('--max-rate', help='replay/rate: Set the most pastes fetched per second (default: unlimited for replay, 2 for rate)', dest='max_rate', type='float', default=None)
+    parser.add_option('--policy', help='rate: Set the pacing policy to simulate: adaptive, legacy (the delay factor it replaced) or both (default: both)', dest='policy', type='choice', choices=('adaptive','legacy','both'), default='both')
+    parser.add_option('--hours', help='rate/schedule: Set the simulated hours (default: 24)', dest='hours', type='float', default=24)
+    parser.add_option('--arrival', help='rate/schedule: Set the average number of new pastes per second (default: 0.3)', dest='arrival', type='float', default=0.3)
+    parser.add_option('--ban-limit', help='rate: Set the requests per second over a minute that get the crawler banned (default: 1)', dest='ban_limit', type='float', default=1.0)
+    parser.add_option('--delay', help='rate: Set the initial delay between pastes (default: 5)', dest='delay', type='float', default=5)
+    parser.add_option('--refresh-time', help='rate/schedule: Set the refresh time (default: 200)', dest='refresh_time', type='int', default=200)
+    parser.add_option('--ban-wait', help='rate: Set the ban wait time in minutes (default: 30)', dest='ban_wait', type='int', default=30)
+    parser.add_option('--schedule', help='schedule: Set the scheduling policy to simulate: priority, page or both (default: both)', dest='schedule', type='choice', choices=Scheduler.POLICIES + ('both',), default='both')
+    parser.add_option('--fetch-rate', help='schedule: Set the pastes fetched per second, below --arrival the crawler falls behind (default: 0.2)', dest='fetch_rate', type='float', default=0.2)
+    parser.add_option('--urgency', help='schedule: Set the weight of the deletion risk in the priority schedule (default: 2)', dest='urgency', type='float', default=2.0)
+    parser.add_option('--trace', help='rate: Print the controller state every simulated hour', dest='trace', action='store_true', default=False)
+    parser.add_option('--snapshots', help='archive: Parse the .html pages of this directory, e.g. saved by pastebin_crawler.py --archive-snapshots (default: -n synthetic pages)', dest='snapshots', default=None)
+    parser.add_option('--duplicate-ratio', help='prefilter: Set the share of reposted pastes (default: 0.2)', dest='duplicate_ratio', type='float', default=0.2)
+    parser.add_option('--binary-ratio', help='prefilter: Set the share of binary pastes (default: 0.05)', dest='binary_ratio', type='float', default=0.05)
+    parser.add_option('--encoded-ratio', help='prefilter: Set the share of the other pastes hiding a secret in a base64, gzip or hex blob (default: 0.1)', dest='encoded_ratio', type='float', default=0.1)
+    parser.add_option('--seed', help='Set the random seed (default: 1)', dest='seed', type='int', default=1)
+    (options, args) = parser.parse_args()
+    if len(args) != 1 or args[0] not in BENCHMARKS:
+        parser.error('choose one benchmark: {:s}'.format(', '.join(sorted(BENCHMARKS))))
+    return options, args[0]
+
+
+if __name__ == "__main__":
+    options, name = parse_input()
+    BENCHMARKS[name](options)
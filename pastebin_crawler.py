@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 #coding: utf-8
 
-from math import ceil,fmod,fabs
+from math import ceil,fmod,log2
 from optparse import OptionParser
 import os
 import sys
@@ -11,13 +11,63 @@ import dateutil.relativedelta
 import sys
 import urllib
 import urllib.request
+import urllib.error
+import urllib.parse
+import http.client
+import http.server
+import zlib
+import codecs
+import collections
+import itertools
+import multiprocessing
+from multiprocessing import shared_memory
+import tempfile
+import shutil
+import sqlite3
 import tarfile
 import random
+import string
 import signal
 import base64
+import html
+import json
+import socket
+import hashlib
+import hmac
+import bisect
+import heapq
+import struct
+import mmap
+import atexit
+import threading
+import queue
+import concurrent.futures
 
 from pyquery import PyQuery
 
+try:	# private CPython modules, only used to derive the literals of the rules
+    import re._parser as sre_parse
+except ImportError:	# python < 3.11
+    try:
+        import sre_parse
+    except ImportError:	# every rule is then a candidate, matched on its own
+        sre_parse = None
+
+try:
+    import hyperscan
+except ImportError:	# optional backend, fall back to pure python matching
+    hyperscan = None
+
+try:
+    import zstandard
+except ImportError:	# optional, the paste store compresses with gzip instead
+    zstandard = None
+
+try:
+    import fcntl
+except ImportError:	# not on windows, the data directories and the paste store are then not locked
+    fcntl = None
+
 
 def get_timestamp():
     return time.strftime('%Y/%m/%d %H:%M:%S')
@@ -119,6 +169,10 @@ def all_python_encodings():
 
 
 class Logger:
+## All Logger instances share one long-lived buffered handle on the log file. Messages that are neither
+## verbose nor bold only update the status line, which is kept in its own small file and rewritten in place.
+## Verbose messages are flushed by the next write or by a timer, at most flush_interval seconds later. When the
+## log grows over max_size it is renamed and compressed by a background thread.
     verbose = False
     shell_mod = {
         '':'',
@@ -133,6 +187,17 @@ class Logger:
        'UNDERLINE' : '\033[4m',
        'RESET' : '\033[0m'
     }
+    logfile = 'pastebin_crawler.log'
+    statusfile = 'pastebin_crawler.status'
+    max_size = 1024*1024*128	# rotate and compress the log once it reaches 128MB
+    flush_interval = 1	# seconds verbose messages may stay in the buffer
+    lock = threading.RLock()
+    handle = None
+    size = 0
+    last_flush = 0
+    timer = None	# pending flush of the messages written since the last one
+    status_handle = None
+
     def __init__(self,verbose=False,journal=False):
         self.verbose = verbose
         self.journal = journal
@@ -140,7 +205,6 @@ class Logger:
     def log ( self, message, is_bold=False, color='', log_time=True):
         prefix = ''
         suffix = ''
-        logfile = 'pastebin_crawler.log'
 
         if log_time:
             prefix += '[{:s}] '.format(get_timestamp())
@@ -157,42 +221,70 @@ class Logger:
         #sys.stdout.flush()
 
         if (self.verbose == True) or (is_bold == True):
-## tar log files if the size reachs 128MB
-            if os.path.exists(logfile) and os.path.getsize(logfile) > 1024*1024*128:
-                tarf = logfile+'.gz'
-                mode='w:gz'
-                with tarfile.open(tarf,mode) as out:
-                    out.add(logfile)
-                os.remove(logfile)
+            Logger.write(messages, flush=is_bold)
         else:
-            messages = 'Status:' + messages
-
-        if not os.path.exists(logfile):
-            with open(logfile,'a+') as logf:
-                logf.write('Status: \n')
-        with open(logfile,'rb+') as logf:	# to replace
-            pos = logf.seek(0, os.SEEK_END) - 1
-            while pos >= 0:
-                a = logf.read(1)
-                if a == b'\n':
-                    pos += 1	# move to next chat to '\n'
-                    break;
-                pos = (pos - 1) if pos > 1 else 0
-                logf.seek(pos, os.SEEK_SET)
-                #print(pos)
-            logf.seek(pos, os.SEEK_SET)
-            a = logf.read(7) or ''
-            if a != b'Status:':
-                logf.seek(0, os.SEEK_END)	# append to the end of file
-            else:
-                logf.seek(pos, os.SEEK_SET)	# overwrite the last line to continuously update status w/o increase log file
-            logf.truncate()
-            logf.write((messages+os.linesep).encode('utf-8'))
+            Logger.write_status(messages)
 
         if self.journal:
             sys.stdout.write(message+os.linesep)
             sys.stdout.flush()
 
+    @classmethod
+    def write(cls, messages, flush=False):
+        data = (messages+os.linesep).encode('utf-8')
+        with cls.lock:
+            if cls.handle is None:
+                cls.handle = open(cls.logfile, 'ab', buffering=1024*64)
+                cls.size = cls.handle.tell()
+            cls.handle.write(data)
+            cls.size += len(data)
+            now = time.time()
+            if flush or now - cls.last_flush > cls.flush_interval:
+                cls.handle.flush()
+                cls.last_flush = now
+            elif cls.timer is None:	# flushed even if nothing else is written meanwhile
+                cls.timer = threading.Timer(cls.flush_interval, cls.flush)
+                cls.timer.daemon = True
+                cls.timer.start()
+            if cls.size > cls.max_size:
+                cls.rotate()
+
+    @classmethod
+    def write_status(cls, messages):
+        data = ('Status:'+messages+os.linesep).encode('utf-8')
+        with cls.lock:
+            if cls.status_handle is None:
+                cls.status_handle = open(cls.statusfile, 'wb', buffering=0)
+            cls.status_handle.seek(0)
+            cls.status_handle.write(data)
+            cls.status_handle.truncate()
+
+    @classmethod
+    def rotate(cls):
+        cls.handle.close()
+        cls.handle = None
+        rotated = '{:s}.{:s}'.format(cls.logfile, time.strftime('%Y%m%d%H%M%S'))
+        n = 0
+        while os.path.exists(rotated) or os.path.exists(rotated+'.gz'):
+            n += 1
+            rotated = '{:s}.{:s}.{:d}'.format(cls.logfile, time.strftime('%Y%m%d%H%M%S'), n)
+        os.replace(cls.logfile, rotated)
+        threading.Thread(target=cls.compress, args=(rotated,), name='log-compress').start()
+
+    @staticmethod
+    def compress(rotated):
+        with tarfile.open(rotated+'.gz','w:gz') as out:
+            out.add(rotated)
+        os.remove(rotated)
+
+    @classmethod
+    def flush(cls):
+        with cls.lock:
+            cls.timer = None
+            if cls.handle is not None:
+                cls.handle.flush()
+                cls.last_flush = time.time()
+
     def match(self, err):
         self.log(err, True, 'CYAN')
 
@@ -206,6 +298,1890 @@ class Logger:
         self.error(err)
         exit()
 
+atexit.register(Logger.flush)
+
+class RuleTimeout(Exception):
+    pass
+
+def guarded(budget, func, *args):
+## call func under a time budget: a SIGALRM timer interrupts it (re checks for signals while matching) with
+## RuleTimeout. Signals are only delivered to the main thread, elsewhere func runs unguarded.
+    if not budget or threading.current_thread() is not threading.main_thread():
+        return func(*args)
+    def alarm(signum, frame):
+        raise RuleTimeout()
+    previous = signal.signal(signal.SIGALRM, alarm)
+    signal.setitimer(signal.ITIMER_REAL, budget)
+    try:
+        return func(*args)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+class RuleProfiler:
+## per-rule performance counters, keyed by pattern text so that they survive reloads of regexes.txt:
+## cumulative time, checks, matches, latency percentiles over the last samples, the slowest pastes and
+## the number of time budget overruns. A rule overrunning its budget max_timeouts times is quarantined.
+    samples = 1000
+    slowest = 5
+    max_timeouts = 3
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.rules = {}
+
+    def record(self, rule, paste_id, elapsed, matched, timed_out):
+        regex,file,directory = rule
+        with self.lock:
+            stat = self.rules.get(regex)
+            if stat is None:
+                stat = self.rules[regex] = {'file':file, 'time':0.0, 'checks':0, 'matches':0, 'timeouts':0,
+                                            'latencies':collections.deque(maxlen=self.samples), 'slowest':[]}
+            stat['time'] += elapsed
+            stat['checks'] += 1
+            stat['matches'] += 1 if matched else 0
+            stat['timeouts'] += 1 if timed_out else 0
+            stat['latencies'].append(elapsed)
+            stat['slowest'] = sorted(stat['slowest'] + [(elapsed, paste_id)], reverse=True)[:self.slowest]
+            return stat['timeouts']
+
+    def quarantined(self, rules):
+        with self.lock:
+            return {i for i,(regex,file,directory) in enumerate(rules) if regex in self.rules and self.rules[regex]['timeouts'] >= self.max_timeouts}
+
+    def report(self):
+        lines = []
+        with self.lock:
+            stats = sorted(self.rules.items(), key=lambda item: item[1]['time'], reverse=True)
+            for regex,stat in stats:
+                latencies = sorted(stat['latencies'])
+                p50 = latencies[int(len(latencies)*0.5)] if latencies else 0
+                p99 = latencies[min(len(latencies)-1, int(len(latencies)*0.99))] if latencies else 0
+                lines.append('{:s} ({:s}): {:.2f}s in {:d} checks, {:d} matches, p50 {:.2f}ms, p99 {:.2f}ms, {:d} timeouts, slowest {:s}'.format(
+                    regex[:40], stat['file'], stat['time'], stat['checks'], stat['matches'], p50*1000, p99*1000, stat['timeouts'],
+                    ', '.join('{:s} ({:.2f}s)'.format(paste_id, elapsed) for elapsed,paste_id in stat['slowest'])))
+        return lines
+
+class RuleSet:
+## Compiled form of the regexes.txt rules, built once per reload. A literal prefilter drops the rules that
+## cannot match a paste. The rules are also combined into one alternation, compiled once: a single pass with
+## it tells a paste no rule matches, which is the common case, and gives the leftmost matching rule. The other
+## candidates are then searched with their own pattern, so that every matching rule is reported: a rule that
+## starts with one of a few literals is only tried where one of them occurs in the paste (see search_rule).
+    ENGINES = ('auto', 'python', 'hyperscan')
+    ANCHOR_SPAN = 64	# characters of paste per literal occurrence a rule is tried at, before it searches the rest
+    REPEATS = (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) + ((sre_parse.POSSESSIVE_REPEAT,) if hasattr(sre_parse,'POSSESSIVE_REPEAT') else ()) if sre_parse else ()
+
+    def __init__(self, rules, engine='auto', budget=0, profile=False, sample=0.0, disabled=(), version=0, cache=None):
+        self.rules = rules
+        self.version = version	# tells the scanning processes when to rebuild their copy
+        self.budget = budget	# seconds a rule may run on a paste before it is aborted, 0 for no limit
+        self.profile = profile	# run the rules one by one so that each of them can be timed
+        self.sample = sample	# share of the searches run one by one all the same, so that the profile is never empty
+        self.disabled = set(disabled)	# indexes of rules not to run, e.g. quarantined for backtracking
+        self.cache = {}	# pattern text -> (compiled, literals, combinable), handed to the next reload
+        self.recompiled = 0	# rules not found in the cache of the previous reload
+        for regex,file,directory in rules:
+            if regex in self.cache:
+                continue
+            if cache is not None and regex in cache:
+                self.cache[regex] = cache[regex]
+            else:
+                self.cache[regex] = self.compile_rule(regex)
+                self.recompiled += 1
+        self.patterns = [self.cache[regex][0] for regex,file,directory in rules]
+        self.literals = [self.cache[regex][1] for regex,file,directory in rules]
+        self.combinable = [self.cache[regex][2] for regex,file,directory in rules]
+        self.leading = [self.cache[regex][3] for regex,file,directory in rules]
+        self.combined = None	# alternation of the combinable rules
+        try:
+            indexes = [i for i in range(len(rules)) if self.combinable[i]]
+            if indexes:
+                self.combined = re.compile('|'.join('(?P<r{:d}>{:s})'.format(i,self.rules[i][0]) for i in indexes), re.IGNORECASE)
+        except re.error:	# e.g. duplicated group names across rules, scan them one by one
+            self.combinable = [False] * len(rules)
+
+        self.hs_db = None
+        self.hs_ids = set()
+        if engine == 'hyperscan' or (engine == 'auto' and hyperscan is not None):
+            self.init_hyperscan()
+        self.engine = 'hyperscan' if self.hs_db is not None else 'python'
+
+    @classmethod
+    def compile_rule(cls, regex):
+        return re.compile(regex, re.IGNORECASE), cls.required_literals(regex), cls.is_combinable(regex), cls.leading_literals(regex)
+
+    def init_hyperscan(self):
+        if hyperscan is None:
+            Logger().warn('hyperscan is not installed, falling back to the python rule engine.')
+            return
+        flags = hyperscan.HS_FLAG_CASELESS | hyperscan.HS_FLAG_SINGLEMATCH | hyperscan.HS_FLAG_UTF8 | hyperscan.HS_FLAG_UCP
+        ids = []
+        for i,(regex,file,directory) in enumerate(self.rules):
+            try:	# hyperscan lacks some python re features (backrefs, lookarounds...), keep those in python
+                hyperscan.Database().compile(expressions=[regex.encode('utf-8')], ids=[i], elements=1, flags=[flags])
+                ids.append(i)
+            except KeyboardInterrupt:
+                raise
+            except:
+                pass
+        if ids:
+            self.hs_db = hyperscan.Database()
+            self.hs_db.compile(expressions=[self.rules[i][0].encode('utf-8') for i in ids], ids=ids, elements=len(ids), flags=[flags]*len(ids))
+            self.hs_ids = set(ids)
+
+    @staticmethod
+    def walk(subpattern):
+        for op,av in subpattern:
+            yield op,av
+            if op == sre_parse.SUBPATTERN:
+                yield from RuleSet.walk(av[-1])
+            elif op == sre_parse.BRANCH:
+                for alt in av[1]:
+                    yield from RuleSet.walk(alt)
+            elif op in RuleSet.REPEATS:
+                yield from RuleSet.walk(av[2])
+            elif op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+                yield from RuleSet.walk(av[1])
+
+    @staticmethod
+    def is_combinable(regex):
+## backreferences would be renumbered inside the alternation and global flags must lead the pattern
+        try:
+            parsed = sre_parse.parse(regex, re.IGNORECASE)
+            re.compile('(?P<r0>' + regex + ')', re.IGNORECASE)
+            if parsed.state.groupdict:
+                return False
+            return not any(op in (sre_parse.GROUPREF, sre_parse.GROUPREF_EXISTS) for op,av in RuleSet.walk(parsed))
+        except Exception:	# re.error, or sre_parse missing or changed
+            return False
+
+    @staticmethod
+    def required_literals(regex):
+## returns a set of casefolded strings of which at least one must appear in any text the regex matches,
+## or None when no such set can be derived
+        def score(lits):
+            return (min(len(l) for l in lits), -len(lits))
+
+        def from_sequence(subpattern):
+            best = None
+            run = ''
+            for op,av in list(subpattern) + [(None,None)]:
+                if op == sre_parse.LITERAL:
+                    run += chr(av)
+                    continue
+                if run:
+                    cand = {run.casefold()}
+                    if best is None or score(cand) > score(best):
+                        best = cand
+                    run = ''
+                cand = None
+                if op == sre_parse.SUBPATTERN:
+                    cand = from_sequence(av[-1])
+                elif op == sre_parse.BRANCH:
+                    cand = set()
+                    for alt in av[1]:
+                        lits = from_sequence(alt)
+                        if lits is None:
+                            cand = None
+                            break
+                        cand |= lits
+                elif op in RuleSet.REPEATS and av[0] >= 1:
+                    cand = from_sequence(av[2])
+                if cand and (best is None or score(cand) > score(best)):
+                    best = cand
+            return best
+
+        try:
+            return from_sequence(sre_parse.parse(regex, re.IGNORECASE))
+        except Exception:	# re.error, or sre_parse missing or changed: no literals, always a candidate
+            return None
+
+    @staticmethod
+    def leading_literals(regex):
+## returns a set of casefolded strings one of which every match of the regex starts with, anchors such as \b
+## aside, or None when there is no such set
+        def leading(subpattern):
+            items = list(itertools.dropwhile(lambda item: item[0] == sre_parse.AT, subpattern))	# zero width, the match starts at what follows
+            if not items:
+                return None
+            op,av = items[0]
+            if op == sre_parse.LITERAL:
+                run = ''.join(chr(av) for op,av in itertools.takewhile(lambda item: item[0] == sre_parse.LITERAL, items))
+                return {run.casefold()} if len(run.casefold()) == len(run) else None
+            if op == sre_parse.SUBPATTERN:
+                return leading(av[-1])
+            if op == sre_parse.BRANCH:
+                lits = set()
+                for alt in av[1]:
+                    alt_lits = leading(alt)
+                    if not alt_lits:
+                        return None
+                    lits |= alt_lits
+                return lits
+            return None
+
+        try:
+            return leading(sre_parse.parse(regex, re.IGNORECASE))
+        except Exception:
+            return None
+
+    def candidates(self, paste_txt, skip=()):
+        folded = paste_txt.casefold()
+        return [i for i in range(len(self.rules)) if i not in skip and i not in self.disabled and (self.literals[i] is None or any(l in folded for l in self.literals[i]))]
+
+    def scan(self, paste_txt, skip=(), timings=None):
+## returns [(rule, matched text), ...] for every rule matching paste_txt, in regexes.txt order
+        found = self.search(paste_txt, skip, timings)
+        return [(self.rules[i], found[i]) for i in sorted(found)]
+
+    def scan_stream(self, chunks, window=1024*256, overlap=1024*4, stop=(), timings=None):
+## same as scan() for a text given as an iterable of chunks, which is matched window by window. Consecutive
+## windows overlap, and each window is searched with overlap characters of context on both sides. The regex
+## engine takes the end of that context for the end of the text, so a hit is only kept if it starts in the
+## window and ends before the context does, or at the real end: $, \Z, \b or a greedy repeat never match at
+## a cut. A match shorter than overlap is found whole, across window boundaries too; a longer one may be
+## missed. Scanning stops as soon as every category (directory) listed in stop has been hit, leaving the rest
+## of chunks unread.
+        found = {}
+        stop = set(stop)
+        buf = ''
+        scanned = 0	# length of the head of buf already matched by the previous window, kept as context
+        def confirm(end, cut, last=False):
+            for i in self.search(buf[:end], found, timings):	# the hits of buf[:end] include those of the window
+                r = self.patterns[i].search(buf, scanned, end)
+                if r and r.start() < cut and (last or r.end() < end):	# else left to the next window, which sees it whole
+                    found[i] = r[0]
+        for chunk in chunks:
+            buf += chunk
+            while len(buf) - scanned >= window + overlap:
+                cut = scanned + window
+                confirm(cut + overlap, cut)
+                buf = buf[cut-overlap:] if overlap else buf[cut:]
+                scanned = min(overlap, len(buf))
+                if stop and stop <= {self.rules[i][2] for i in found}:
+                    return [(self.rules[i], found[i]) for i in sorted(found)]
+        if len(buf) > scanned:
+            confirm(len(buf), len(buf), True)
+        return [(self.rules[i], found[i]) for i in sorted(found)]
+
+    def search(self, paste_txt, skip=(), timings=None):
+## returns {rule index: matched text} for every rule not in skip that matches paste_txt. When the rules are
+## profiled, for a sample of the searches timings are asked for, or when the single pass overruns the time
+## budget, they are run one by one, each under its own budget, and (index, seconds, matched, timed out) is
+## appended to timings for each of them.
+        candidates = self.candidates(paste_txt, skip)
+        if self.profile or (timings is not None and self.sample and random.random() < self.sample):
+            return self.search_each(paste_txt, candidates, timings)
+        try:
+            return guarded(self.budget, self.search_all, paste_txt, candidates)
+        except RuleTimeout:	# find out which rule is to blame
+            return self.search_each(paste_txt, candidates, timings)
+
+    def search_texts(self, texts, timings=None):
+## search() over a paste and the blobs decoded from it (see Prefilter.prepare), each text on its own so that
+## no anchor sees where one ends and the next starts and no match runs from one into the other. Returns
+## {rule index: matched text}, the paste's own match first, and the indexes found only in the blobs.
+        found = self.search(texts[0], timings=timings)
+        decoded = set()
+        for text in texts[1:]:
+            more = self.search(text, skip=found, timings=timings)
+            found.update(more)
+            decoded.update(more)
+        return found, decoded
+
+    @staticmethod
+    def fold(paste_txt):
+## the casefolded paste search_rule finds the literals in, '' when folding moves the characters around
+        folded = paste_txt.casefold()
+        return folded if len(folded) == len(paste_txt) else ''
+
+    def search_rule(self, i, paste_txt, folded, pos=0):
+## the leftmost match of rule i at or after pos, as its own search finds. A rule starting with one of a few
+## literals is only tried with match() where one of them occurs in folded: str.find skips the rest of the
+## paste at C speed, while the regex engine would try the rule at every character. A rule whose literals
+## are so common that the tries would cost more than a search, one per ANCHOR_SPAN characters, searches on.
+        pattern = self.patterns[i]
+        if not self.leading[i] or not folded:
+            return pattern.search(paste_txt, pos)
+        heap = [(folded.find(l, pos), l) for l in self.leading[i]]
+        heap = [(start,l) for start,l in heap if start >= 0]
+        heapq.heapify(heap)
+        tries = len(paste_txt)//self.ANCHOR_SPAN + 1
+        while heap:
+            start = heap[0][0]
+            if tries == 0:
+                return pattern.search(paste_txt, start)
+            r = pattern.match(paste_txt, start)
+            if r:
+                return r
+            tries -= 1
+            while heap and heap[0][0] == start:	# the other literals occurring there too
+                l = heap[0][1]
+                following = folded.find(l, start + 1)
+                if following < 0:
+                    heapq.heappop(heap)
+                else:
+                    heapq.heapreplace(heap, (following, l))
+        return None
+
+    def search_each(self, paste_txt, candidates, timings):
+        found = {}
+        folded = self.fold(paste_txt)
+        for i in candidates:
+            start = time.perf_counter()
+            try:
+                r = guarded(self.budget, self.search_rule, i, paste_txt, folded)
+                timed_out = False
+            except RuleTimeout:
+                r = None
+                timed_out = True
+            if timings is not None:
+                timings.append((i, time.perf_counter() - start, r is not None, timed_out))
+            if r:
+                found[i] = r[0]
+        return found
+
+    def search_all(self, paste_txt, candidates):
+        found = {}
+
+        if self.hs_db is not None:
+            hits = set()
+            def on_match(id, start, end, flags, context):
+                hits.add(id)
+            self.hs_db.scan(paste_txt.encode('utf-8', 'replace'), match_event_handler=on_match)
+            for i in [i for i in candidates if i in self.hs_ids]:
+                r = self.patterns[i].search(paste_txt) if i in hits else None	# confirm with python semantics
+                if r:
+                    found[i] = r[0]
+            candidates = [i for i in candidates if i not in self.hs_ids]
+
+        remaining = candidates
+        first = 0	# where the combinable rules may start matching
+        if self.combined is not None and not any(self.combinable[i] for i in self.disabled):	# a quarantined rule may backtrack
+            combinable = [i for i in candidates if self.combinable[i]]
+            if combinable:
+                r = self.combined.search(paste_txt)
+                if r:	# the leftmost match, the same as the rule's own search finds
+                    i = int(r.lastgroup[1:]) if r.lastgroup else int(next(k for k,v in r.groupdict().items() if v is not None)[1:])
+                    if i in combinable:
+                        found[i] = r[0]
+                    first = r.start()	# none of them matches before
+                    remaining = [i for i in candidates if i not in found]
+                else:	# none of the combinable rules matches
+                    remaining = [i for i in candidates if not self.combinable[i]]
+
+        folded = self.fold(paste_txt) if remaining else ''
+        for i in remaining:
+            r = self.search_rule(i, paste_txt, folded, first if self.combinable[i] else 0)
+            if r:
+                found[i] = r[0]
+
+        return found
+
+class Prefilter:
+## Cheap pass over a paste before the rules. Empty pastes are not matched at all, binary ones only when asked
+## to, and neither is content matched lately under another paste id: its matches are reused. Base64 and hex
+## blobs, gzip or zlib compressed or not, are decoded and matched as texts of their own next to the paste, so
+## that encoded secrets are found too. Everything works on the utf-8 bytes with C-speed primitives
+## (translate, find, hashing) so that the regex work is only done around blobs.
+    BLOB_CHARS = (string.ascii_letters + string.digits + '+/-_').encode('ascii')	# standard and url-safe base64
+    BLOB_MASK = bytes.maketrans(BLOB_CHARS, b'a' * len(BLOB_CHARS))	# blob characters -> a, the others never become a
+    BLOB = re.compile(rb'[A-Za-z0-9+/_-]+={0,2}')
+    HEX = re.compile(rb'(?:[0-9a-fA-F]{2})+')
+    CONTROL = bytes(range(0,9)) + b'\x0b\x0c' + bytes(range(14,32)) + b'\x7f'
+    LETTERS = string.ascii_letters.encode('ascii')
+    DIGITS = string.digits.encode('ascii')
+    SPACES = string.whitespace.encode('ascii')
+    JUNK = dict.fromkeys(list(range(0,9)) + [0x0b, 0x0c] + list(range(14,32)) + [0x7f, 0xfffd])	# control and undecodable characters
+    VERDICTS = ('text', 'encoded', 'empty', 'binary', 'duplicate')
+    sample = 1024	# bytes the character classes and entropy are measured on
+    min_blob = 40	# shortest run of base64/hex characters decoded
+    glue = 12	# decoded characters at the head of a blob that may come from the word it is glued to
+
+    def __init__(self, enabled=True, decode=True, duplicates=10000, max_blobs=16, max_decoded=1024*1024, depth=2, skip_binary=False):
+        self.enabled = enabled
+        self.skip_binary = skip_binary	# do not match binary pastes, off by default: a terminal log full of escape codes may hold credentials
+        self.decode_blobs = decode
+        self.duplicates = duplicates	# digests of recently matched pastes kept with their matches
+        self.max_blobs = max_blobs	# blobs decoded per paste
+        self.max_decoded = max_decoded	# bytes decoded per paste
+        self.depth = depth	# levels of blobs decoded from decoded blobs
+        self.recent = collections.OrderedDict()	# digest -> (rules version, matches)
+        self.lock = threading.Lock()
+        self.counters = dict({verdict:0 for verdict in self.VERDICTS}, bytes=0, skipped=0, skipped_bytes=0, scanned_bytes=0, scan_time=0.0,
+                             base64=0, hex=0, compressed=0, decoded_bytes=0, decoded_matches=0)
+
+    @staticmethod
+    def digest(data):
+        return hashlib.blake2b(data, digest_size=16).digest()
+
+    @classmethod
+    def stats(cls, data):
+## share of letters, digits, whitespace, control characters and other symbols, and entropy in bits per byte
+        data = data[:cls.sample]
+        n = len(data) or 1
+        stats = {'entropy':-sum(c/n*log2(c/n) for c in collections.Counter(data).values())}
+        for name,chars in (('letters',cls.LETTERS), ('digits',cls.DIGITS), ('spaces',cls.SPACES), ('control',cls.CONTROL)):
+            stats[name] = (len(data) - len(data.translate(None, chars)))/n
+        stats['symbols'] = max(0.0, 1 - stats['letters'] - stats['digits'] - stats['spaces'] - stats['control'])
+        return stats
+
+    @classmethod
+    def classify(cls, data):
+        if not data.strip():
+            return 'empty'
+        stats = cls.stats(data)
+        if b'\x00' in data[:cls.sample] or stats['control'] > 0.05:
+            return 'binary'
+        if stats['entropy'] > 5 and stats['spaces'] < 0.02:	# one long blob rather than text
+            return 'encoded'
+        return 'text'
+
+    def printable(self, data):
+## the text of decoded bytes, None unless it is mostly printable. The head is not measured, it may be the
+## garbage decoded from the word a blob is glued to, nor are the last characters, decoded from the next one
+        text = data.decode('utf-8', 'replace')
+        body = text[self.glue:self.glue+self.sample] if len(text) > self.glue + 16 else text
+        body = body[:-4] if len(body) > 16 else body
+        if len(text.strip()) < 8 or (len(body) - len(body.translate(self.JUNK)))/len(body) > 0.05:
+            return None
+        return text
+
+    def unpack(self, blob):
+## (kind, decoded bytes, compressed, text) of a base64 or hex blob, None if it hides no text. Base64 may be
+## url-safe, unpadded or glued to the word before it, so each of the four alignments of its start is tried
+        if self.HEX.fullmatch(blob):
+            kind,offsets = 'hex',(0,)
+        else:
+            kind,offsets = 'base64',range(4)
+            altchars = b'-_' if b'-' in blob or b'_' in blob else None
+            blob = blob.rstrip(b'=')
+        for offset in offsets:
+            try:
+                if kind == 'hex':
+                    data = bytes.fromhex(blob.decode('ascii'))
+                else:
+                    part = blob[offset:]
+                    part = part[:-1] if len(part) % 4 == 1 else part	# a lone last character holds no byte
+                    data = base64.b64decode(part + b'=' * (-len(part) % 4), altchars)
+            except ValueError:
+                continue
+            compressed = data[:2] == b'\x1f\x8b' or (len(data) > 2 and data[0] == 0x78 and int.from_bytes(data[:2], 'big') % 31 == 0)
+            if compressed:
+                try:
+                    data = zlib.decompressobj(32 + zlib.MAX_WBITS).decompress(data, self.max_decoded)	# gzip or zlib header
+                except zlib.error:
+                    continue
+            text = self.printable(data)
+            if text is not None:
+                return kind, data, compressed, text
+        return None
+
+    def decode(self, data, depth=None, budget=None):
+## returns the text of the base64/hex blobs of data, along with the blobs found in them down to depth
+        depth = self.depth if depth is None else depth
+        budget = [self.max_decoded, self.max_blobs] if budget is None else budget
+        blobs = []
+        mask = data.translate(self.BLOB_MASK)
+        run = b'a' * self.min_blob
+        pos = mask.find(run)
+        while pos >= 0 and budget[0] > 0 and budget[1] > 0:
+            m = self.BLOB.match(data, pos)
+            pos = mask.find(run, m.end())
+            unpacked = self.unpack(m[0])
+            if unpacked is None:
+                continue
+            kind,blob,compressed,text = unpacked
+            budget[0] -= len(blob)
+            budget[1] -= 1
+            with self.lock:
+                self.counters[kind] += 1
+                self.counters['compressed'] += compressed
+                self.counters['decoded_bytes'] += len(blob)
+            blobs.append(text)
+            if depth > 1:
+                blobs.extend(self.decode(blob, depth - 1, budget))
+        return blobs
+
+    def prepare(self, paste_txt, version):
+## returns (verdict, texts to match, matches): the paste followed by its decoded blobs, each of them to be
+## matched on its own (see RuleSet.search_texts). matches is not None when the rules need not run: [] for
+## junk, the matches of the same content when it was seen lately with the same rules
+        if not self.enabled:
+            return 'text', [paste_txt], None
+        data = paste_txt.encode('utf-8', 'surrogatepass')
+        verdict = self.classify(data)
+        matches = None
+        if verdict == 'empty' or (verdict == 'binary' and self.skip_binary):
+            matches = []
+        elif self.duplicates:
+            with self.lock:
+                recent = self.recent.get(self.digest(data))
+            if recent is not None and recent[0] == version:
+                verdict,matches = 'duplicate',recent[1]
+        with self.lock:
+            self.counters[verdict] += 1
+            self.counters['bytes'] += len(paste_txt)
+            if matches is not None:
+                self.counters['skipped'] += 1
+                self.counters['skipped_bytes'] += len(paste_txt)
+        if matches is not None or not self.decode_blobs:
+            return verdict, [paste_txt], matches
+        return verdict, [paste_txt] + self.decode(data), None
+
+    def scanned(self, paste_txt, version, matches, elapsed, decoded=0):
+## account a paste matched by the rules after prepare(), decoded of its matches found only in the blobs,
+## remembering its matches for its duplicates
+        digest = self.digest(paste_txt.encode('utf-8', 'surrogatepass')) if self.enabled and self.duplicates else None
+        with self.lock:
+            self.counters['decoded_matches'] += decoded
+            self.counters['scanned_bytes'] += len(paste_txt)
+            self.counters['scan_time'] += elapsed
+            if digest is not None:
+                self.recent[digest] = (version, matches)
+                self.recent.move_to_end(digest)
+                while len(self.recent) > self.duplicates:
+                    self.recent.popitem(last=False)
+
+    def saved(self):
+## estimated seconds of matching saved by the skipped pastes, at the average matching speed
+        c = self.counters
+        return c['skipped_bytes'] * c['scan_time'] / c['scanned_bytes'] if c['scanned_bytes'] else 0.0
+
+    def summary(self):
+        c = dict(self.counters)
+        return '{:s}; {:d} pastes ({:.1f} MB) not matched, about {:.1f}s of matching saved; {:d} base64 and {:d} hex blobs decoded ({:d} compressed), {:.1f} KB more matched, {:d} matches found only in decoded blobs'.format(
+            ', '.join('{:d} {:s}'.format(c[verdict], verdict) for verdict in self.VERDICTS), c['skipped'], c['skipped_bytes']/1024/1024, self.saved(),
+            c['base64'], c['hex'], c['compressed'], c['decoded_bytes']/1024, c['decoded_matches'])
+
+scan_process_ruleset = None	# (version, RuleSet) cached by each scanning process
+
+def scan_process_init():
+    signal.signal(signal.SIGINT, signal.SIG_IGN)	# the crawler process decides when scanning stops
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+def scan_shared(name, sizes, version, rules, engine, budget, profile, sample, disabled):
+## runs in a ScanPool process: match the paste and its decoded blobs stored one after the other, sizes bytes
+## each, in shared memory block name
+    global scan_process_ruleset
+    if scan_process_ruleset is None or scan_process_ruleset[0] != version:
+        scan_process_ruleset = (version, RuleSet(rules, engine=engine, budget=budget, profile=profile, sample=sample, version=version,
+                                                 cache=scan_process_ruleset[1].cache if scan_process_ruleset else None))
+    scan_process_ruleset[1].disabled = set(disabled)
+    shm = shared_memory.SharedMemory(name=name)	# the crawler process owns and unlinks the block
+    try:
+        data = bytes(shm.buf[:sum(sizes)])
+    finally:
+        shm.close()
+    texts = []
+    offset = 0
+    for size in sizes:
+        texts.append(data[offset:offset+size].decode('utf-8', 'surrogatepass'))
+        offset += size
+    start = time.perf_counter()
+    timings = []
+    found,decoded = scan_process_ruleset[1].search_texts(texts, timings=timings)
+    return found, time.perf_counter() - start, timings, decoded
+
+class ScanPool:
+## Matches paste bodies in a pool of processes so that regex work uses every core. Bodies are handed over
+## through shared memory blocks instead of being pickled, at most depth of them are in flight and results
+## are delivered to the callback from the pool's result thread.
+    def __init__(self, processes, depth, callback):
+        self.processes = processes
+        self.depth = depth
+        self.callback = callback
+        self.pool = multiprocessing.get_context('spawn').Pool(processes, initializer=scan_process_init)
+        self.slots = threading.BoundedSemaphore(depth)
+        self.lock = threading.Lock()
+        self.idle = threading.Condition(self.lock)
+        self.inflight = 0
+        self.totals = {'submitted':0, 'completed':0, 'failed':0, 'time':0.0, 'max_time':0.0, 'max_inflight':0, 'blocked':0.0}
+
+    def submit(self, paste_id, paste_txt, ruleset, texts=None):
+## texts are the texts matched if not paste_txt alone, e.g. with the blobs decoded by the Prefilter
+        rules = ruleset.rules
+        start = time.time()
+        self.slots.acquire()
+        texts = [text.encode('utf-8', 'surrogatepass') for text in (texts or [paste_txt])]
+        sizes = [len(text) for text in texts]
+        data = b''.join(texts)
+        shm = shared_memory.SharedMemory(create=True, size=max(1,len(data)))
+        shm.buf[:len(data)] = data
+        with self.lock:
+            self.inflight += 1
+            self.totals['submitted'] += 1
+            self.totals['max_inflight'] = max(self.totals['max_inflight'], self.inflight)
+            self.totals['blocked'] += time.time() - start
+        self.pool.apply_async(scan_shared, (shm.name, sizes, ruleset.version, rules, ruleset.engine, ruleset.budget, ruleset.profile, ruleset.sample, sorted(ruleset.disabled)),
+            callback=lambda result: self.done(shm, paste_id, paste_txt, rules, result, None),
+            error_callback=lambda error: self.done(shm, paste_id, paste_txt, rules, None, error))
+
+    def done(self, shm, paste_id, paste_txt, rules, result, error):
+        shm.close()
+        shm.unlink()
+        self.slots.release()
+        with self.lock:
+            if result is not None:
+                self.totals['completed'] += 1
+                self.totals['time'] += result[1]
+                self.totals['max_time'] = max(self.totals['max_time'], result[1])
+            else:
+                self.totals['failed'] += 1
+        try:
+            self.callback(paste_id, paste_txt, rules, result, error)
+        finally:
+            with self.lock:
+                self.inflight -= 1
+                self.idle.notify_all()
+
+    def wait(self, timeout=None):
+## wait until every submitted paste has been delivered, returns False on timeout
+        with self.lock:
+            return self.idle.wait_for(lambda: self.inflight == 0, timeout)
+
+    def close(self):
+        self.pool.terminate()
+        self.pool.join()
+
+    def summary(self):
+        with self.lock:
+            t = dict(self.totals)
+        n = t['completed'] or 1
+        return '{:d} processes scanned {:d} pastes ({:d} failed), averagely {:.3f}s and at most {:.3f}s per paste; up to {:d}/{:d} pastes queued, {:.1f}s spent waiting for a slot'.format(
+            self.processes, t['completed'], t['failed'], t['time']/n, t['max_time'], t['max_inflight'], self.depth, t['blocked'])
+
+class Metrics:
+## Counters and histograms in the Prometheus text format, served on /metrics by a small HTTP server thread.
+## An update is one dict operation under a lock; values the crawler already keeps elsewhere (totals, queue
+## depths, the rate controller...) are only read by the collectors when the endpoint is scraped.
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+    def __init__(self, prefix='pastebin_'):
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.kinds = collections.OrderedDict()	# name -> (type, help)
+        self.counters = {}	# (name, labels) -> value
+        self.histograms = {}	# (name, labels) -> per bucket counts, then sum and count
+        self.collectors = []	# callables returning (name, labels, value) samples of described names
+        self.server = None
+
+    def describe(self, name, kind, help):
+        self.kinds[name] = (kind, help)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [0]*len(self.BUCKETS) + [0.0, 0]
+            i = bisect.bisect_left(self.BUCKETS, value)
+            if i < len(self.BUCKETS):
+                histogram[i] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    def collect(self, collector):
+        self.collectors.append(collector)
+
+    @staticmethod
+    def labels(labels, extra=()):
+        labels = tuple(labels) + tuple(extra)
+        if not labels:
+            return ''
+        return '{' + ','.join('{:s}="{:s}"'.format(k, str(v).replace('\\','\\\\').replace('"','\\"').replace('\n','\\n')) for k,v in labels) + '}'
+
+    def render(self):
+        samples = collections.defaultdict(list)
+        with self.lock:
+            for (name,labels),value in self.counters.items():
+                samples[name].append((labels, value))
+            histograms = {key:list(histogram) for key,histogram in self.histograms.items()}
+        for collector in self.collectors:
+            try:
+                for name,labels,value in collector():
+                    samples[name].append((tuple(sorted(labels.items())), value))
+            except KeyboardInterrupt:
+                raise
+            except Exception as inst:
+                Logger().warn('Metrics collector failed: {:s}'.format(str(inst)))
+        for (name,labels),histogram in histograms.items():
+            samples[name].append((labels, histogram))
+        lines = []
+        for name,(kind,help) in self.kinds.items():
+            lines.append('# HELP {:s}{:s} {:s}'.format(self.prefix, name, help))
+            lines.append('# TYPE {:s}{:s} {:s}'.format(self.prefix, name, kind))
+            for labels,value in samples.get(name, ()):
+                if kind != 'histogram':
+                    lines.append('{:s}{:s}{:s} {:s}'.format(self.prefix, name, self.labels(labels), repr(float(value))))
+                    continue
+                cumulative = 0
+                for bound,count in zip(self.BUCKETS + (float('inf'),), value[:len(self.BUCKETS)] + [value[-1] - sum(value[:len(self.BUCKETS)])]):
+                    cumulative += count
+                    lines.append('{:s}{:s}_bucket{:s} {:d}'.format(self.prefix, name, self.labels(labels, [('le', '+Inf' if bound == float('inf') else repr(bound))]), cumulative))
+                lines.append('{:s}{:s}_sum{:s} {:s}'.format(self.prefix, name, self.labels(labels), repr(value[-2])))
+                lines.append('{:s}{:s}_count{:s} {:d}'.format(self.prefix, name, self.labels(labels), value[-1]))
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port, host=''):
+        metrics = self
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/metrics', '/'):
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+        self.server = http.server.ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name='metrics', daemon=True).start()
+        return self.server.server_port
+
+class RateLimiter:
+## politeness limiter shared by all fetch workers, consecutive requests start at least interval() seconds apart
+## no matter how many of them are in flight
+    def __init__(self, interval):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.next_time = 0
+        self.total_delayed = 0
+
+    def wait(self):
+        with self.lock:
+            now = time.time()
+            start = max(now, self.next_time)
+            delaytime = self.interval()
+            self.next_time = start + delaytime
+            self.total_delayed += delaytime
+        if start > now:
+            time.sleep(start - now)
+        return delaytime
+
+class RateController:
+## Paces paste requests by AIMD. Every successful fetch adds increase to the allowed rate (capacity) as
+## long as the crawler is actually held back by it; a throttling answer (429/403), the ban page or a run
+## of errors multiplies it by decrease, and latency well above its baseline trims it. The pace asked for is
+## the archive turnover (new pastes per second) times headroom, capped by capacity, so the crawler goes as
+## fast as needed to miss no paste but no faster. A ban also caps capacity below the rate that caused it,
+## the cap relaxes by relax of itself per hour. clock is replaceable so that it can be simulated offline.
+    def __init__(self, delay=5, min_rate=0.02, max_rate=5, increase=0.01, decrease=0.5, headroom=1.5,
+                 latency_factor=3, cooldown=10, relax=0.5, clock=time.time):
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.headroom = headroom
+        self.latency_factor = latency_factor	# latency this many times its baseline means the site is struggling
+        self.cooldown = cooldown	# seconds between two decreases, a burst of failures counts once
+        self.relax = relax
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.capacity = min(max_rate, max(min_rate, 1/delay if delay > 0 else max_rate))
+        self.ban_ceiling = None	# capacity cap set by the last ban
+        self.last_ban = 0
+        self.last_cut = -cooldown
+        self.turnover = None	# new pastes per second in the archive
+        self.listed = 0	# pastes listed by the archive page
+        self.last_archive = None
+        self.poll_interval = None	# moving average of the seconds between two archive polls, re-polls aside
+        self.latency = None	# moving average of the fetch latency
+        self.baseline = None	# lowest moving average seen, creeping up slowly
+        self.error_rate = 0.0
+        self.decisions = collections.Counter()
+        self.last_decision = 'start'
+
+    def ceiling(self):
+        if self.ban_ceiling is None:
+            return self.max_rate
+        return min(self.max_rate, self.ban_ceiling * (1 + self.relax*(self.clock() - self.last_ban)/3600))
+
+    def rate(self):
+        with self.lock:
+            if self.turnover is None:
+                return self.capacity
+            return min(self.capacity, max(self.min_rate, self.turnover*self.headroom))
+
+    def interval(self):
+        return 1/self.rate()
+
+    def decide(self, decision, reason):
+        self.decisions[decision] += 1
+        self.last_decision = '{:s} to {:.3f}/s ({:s})'.format(decision, self.capacity, reason)
+
+    def cut(self, factor, decision, reason, force=False):
+        now = self.clock()
+        if not force and now - self.last_cut < self.cooldown:
+            return False
+        self.capacity = max(self.min_rate, self.capacity*factor)
+        self.last_cut = now
+        self.decide(decision, reason)
+        return True
+
+    def success(self, latency):
+        with self.lock:
+            self.error_rate *= 0.9
+            self.latency = latency if self.latency is None else self.latency + 0.2*(latency - self.latency)
+            if self.baseline is None or self.latency < self.baseline:
+                self.baseline = self.latency
+            else:
+                self.baseline += 0.01*(self.latency - self.baseline)
+            if self.latency > self.latency_factor*self.baseline and self.baseline > 0:
+                self.cut(0.8, 'slow down', 'latency {:.2f}s against {:.2f}s'.format(self.latency, self.baseline))
+            elif self.turnover is None or self.turnover*self.headroom >= self.capacity:	# capacity is the bottleneck, probe for more
+                capacity = min(self.ceiling(), self.capacity + self.increase)
+                if capacity > self.capacity:
+                    self.capacity = capacity
+                    self.decisions['speed up'] += 1
+
+    def throttled(self, code):
+        with self.lock:
+            self.cut(0.7, 'back off', 'HTTP {:d}'.format(code))
+
+    def banned(self):
+        with self.lock:
+            self.ban_ceiling = max(self.min_rate, min(self.capacity, self.ceiling())*0.8)
+            self.last_ban = self.clock()
+            self.cut(self.decrease, 'back off', 'ban page', force=True)
+            self.capacity = min(self.capacity, self.ban_ceiling)
+
+    def error(self):
+        with self.lock:
+            self.error_rate = 0.9*self.error_rate + 0.1
+            if self.error_rate > 0.3:
+                self.cut(0.8, 'slow down', '{:.0f}% errors'.format(self.error_rate*100))
+
+    def archive(self, listed, new, repoll=False):
+## called once the pastes of an archive page are known, new of its listed pastes were not seen before.
+## repoll tells a poll made early for the pastes left over, which says nothing of the refresh interval
+        with self.lock:
+            now = self.clock()
+            if self.last_archive is not None and now > self.last_archive and not repoll:
+                interval = now - self.last_archive
+                self.poll_interval = interval if self.poll_interval is None else self.poll_interval + 0.3*(interval - self.poll_interval)
+            if self.last_archive is not None and now > self.last_archive:
+                turnover = new/(now - self.last_archive)
+                if new >= listed:	# no overlap with the last page, pastes were probably missed
+                    turnover *= 2
+                    self.decisions['overrun'] += 1
+                self.turnover = turnover if self.turnover is None else self.turnover + 0.3*(turnover - self.turnover)
+            self.last_archive = now
+            self.listed = listed
+
+    def refresh(self, refresh_time):
+## seconds until the next archive poll: at most refresh_time, less when half the page turns over sooner
+        with self.lock:
+            if not self.turnover or not self.listed:
+                return refresh_time
+            return min(refresh_time, max(5, 0.5*self.listed/self.turnover))
+
+    def deadline(self, refresh_time):
+## seconds the pastes of a poll have before the rest is left to the next one: the interval measured between
+## polls, refresh_time until there is one, and never less than refresh() asks for
+        with self.lock:
+            interval = self.poll_interval
+        return max(self.refresh(refresh_time), refresh_time if interval is None else interval)
+
+    STATE = ('capacity', 'ban_ceiling', 'last_ban', 'turnover', 'poll_interval', 'latency', 'baseline', 'error_rate')
+
+    def state(self):
+## what a restarted crawler needs to go on at the same pace, see Crawler.checkpoint
+        with self.lock:
+            return dict({name:getattr(self, name) for name in self.STATE}, decisions=dict(self.decisions))
+
+    def restore(self, state):
+        with self.lock:
+            for name in self.STATE:
+                if name in state:
+                    setattr(self, name, state[name])
+            self.capacity = min(self.max_rate, max(self.min_rate, self.capacity))
+            self.decisions.update(state.get('decisions', {}))
+            self.last_decision = 'resumed'
+
+    def metrics(self):
+        with self.lock:
+            rate = self.capacity if self.turnover is None else min(self.capacity, max(self.min_rate, self.turnover*self.headroom))
+            return dict({'rate':rate, 'capacity':self.capacity, 'ceiling':self.ceiling(), 'turnover':self.turnover or 0.0,
+                         'latency':self.latency or 0.0, 'latency_baseline':self.baseline or 0.0, 'error_rate':self.error_rate},
+                        **{'decisions_' + decision.replace(' ','_'):count for decision,count in self.decisions.items()})
+
+    def summary(self):
+        m = self.metrics()
+        return 'pacing {:.3f} pastes/s (capacity {:.3f}/s, ceiling {:.3f}/s) for a turnover of {:.3f}/s; latency {:.2f}s against {:.2f}s, {:.0f}% errors; {:s}; last decision: {:s}'.format(
+            m['rate'], m['capacity'], m['ceiling'], m['turnover'], m['latency'], m['latency_baseline'], m['error_rate']*100,
+            ', '.join('{:d} {:s}'.format(count, decision) for decision,count in sorted(self.decisions.items())) or 'no decisions', self.last_decision)
+
+class Scheduler:
+## Orders the pastes of a refresh so that the ones most worth a request go first, when the crawler cannot
+## fetch them all before some are deleted. 'page' keeps the archive order; 'priority' ranks them by
+## value * (1 + urgency * risk), value being the chance a paste matches the rules and risk the chance it
+## answers 404. Both are learned from the outcome of the pastes fetched so far, per feature of their archive
+## row (syntax, titled or not, title keyword, size and age classes); each feature's rates are pulled toward
+## the overall ones by prior pseudo-pastes, so that a feature seen a few times weighs little.
+    POLICIES = ('priority', 'page')
+    OUTCOMES = ('matched', 'clean', 'gone')
+    KEYWORDS = re.compile(r'pass|login|leak|dump|combo|account|config|key|token|secret|database|\bdb\b|mail|hack|crack|api', re.I)
+    SIZES = ((1024,'1KB'), (8*1024,'8KB'), (64*1024,'64KB'), (512*1024,'512KB'))	# size classes, bytes
+    AGES = ((60,'1min'), (300,'5min'), (900,'15min'), (3600,'1h'))	# age classes, seconds
+
+    def __init__(self, policy='page', urgency=2.0, prior=20, remember=10000, clock=time.time):
+        self.policy = policy
+        self.urgency = urgency	# weight of the deletion risk against the value
+        self.prior = prior
+        self.remember = remember	# rows kept for the pastes scheduled and not done yet
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.rates = collections.defaultdict(lambda: [0, 0, 0])	# 'name=value' feature -> pastes matched, clean, gone
+        self.rows = collections.OrderedDict()	# paste id -> (row, time listed, promoted, deferred) of the pastes scheduled
+        self.counters = collections.Counter()
+
+    @staticmethod
+    def bucket(value, bounds):
+        if value is None:
+            return '=?'
+        return next(('<' + label for bound,label in bounds if value < bound), '>=' + bounds[-1][1])
+
+    def features(self, row, age):
+        title = row.title or ''
+        return ('syntax=' + (row.syntax or '?').lower(), 'titled={:d}'.format(title not in ('', 'Untitled')),
+                'keyword={:d}'.format(bool(self.KEYWORDS.search(title))), 'size' + self.bucket(row.size, self.SIZES),
+                'age' + self.bucket(age, self.AGES))
+
+    def estimate(self, features):
+## (value, risk) of a paste with these features, averaged over its features
+        total = self.rates['*']
+        n = sum(total)
+        overall = ((total[0] + 1)/(n + 2), (total[2] + 1)/(n + 2))
+        value = risk = 0.0
+        for feature in features:
+            counts = self.rates.get(feature, (0, 0, 0))
+            seen = sum(counts)
+            value += (counts[0] + self.prior*overall[0])/(seen + self.prior)
+            risk += (counts[2] + self.prior*overall[1])/(seen + self.prior)
+        return value/len(features), risk/len(features)
+
+    def score(self, row, age):
+        value,risk = self.estimate(self.features(row, age))
+        return value*(1 + self.urgency*risk)
+
+    def order(self, pastes):
+## the pastes in the order they are to be fetched. Rows without metadata, e.g. pending pastes the archive
+## does not list any more, are scored from their row when it was last listed
+        now = self.clock()
+        with self.lock:
+            rows = []
+            for rank,paste in enumerate(pastes):
+                known = self.rows.get(paste.id)
+                if known is None:
+                    self.counters['scheduled'] += 1
+                if paste.title is None and paste.syntax is None and known is not None:
+                    row,listed = known[0],known[1]
+                else:
+                    row,listed = paste,now
+                    self.rows[paste.id] = (row, now) + (known[2:] if known is not None else (False, False))
+                    self.rows.move_to_end(paste.id)
+                age = row.age + now - listed if row.age is not None else None
+                rows.append((-self.score(row, age) if self.policy != 'page' else 0, rank, paste))
+            while len(self.rows) > self.remember:
+                self.rows.popitem(last=False)
+            rows.sort(key=lambda item: item[:2])
+            for position,(score,rank,paste) in enumerate(rows):
+                if position*2 < len(rows) <= rank*2 and paste.id in self.rows and not self.rows[paste.id][2]:	# from the back half of archive order to the front one
+                    self.rows[paste.id] = self.rows[paste.id][:2] + (True,) + self.rows[paste.id][3:]
+                    self.counters['promoted'] += 1
+        return [paste for score,rank,paste in rows]
+
+    def outcome(self, paste_id, outcome):
+## learns from a paste fetched after order(): 'matched', 'clean' or 'gone' (404)
+        with self.lock:
+            known = self.rows.pop(paste_id, None)
+            if known is None:
+                return
+            row,listed,promoted,deferred = known
+            age = row.age + self.clock() - listed if row.age is not None else None
+            n = self.OUTCOMES.index(outcome)
+            for feature in self.features(row, age) + ('*',):
+                self.rates[feature][n] += 1
+            self.counters[outcome] += 1
+            if promoted:
+                self.counters['promoted_' + outcome] += 1
+            if deferred:
+                self.counters['deferred_' + outcome] += 1
+
+    def deferred(self, paste_id):
+## a paste left pending because the refresh ran out of time
+        with self.lock:
+            self.counters['deferred'] += 1
+            if paste_id in self.rows:
+                self.rows[paste_id] = self.rows[paste_id][:3] + (True,)
+
+    def state(self):
+        with self.lock:
+            return {'rates':{feature:counts for feature,counts in self.rates.items()}}
+
+    def restore(self, state):
+        with self.lock:
+            for feature,counts in (state or {}).get('rates', {}).items():
+                self.rates[feature] = list(counts)
+
+    def summary(self):
+        with self.lock:
+            c = dict(self.counters)
+            done = sum(c.get(outcome, 0) for outcome in self.OUTCOMES)
+            promoted = sum(c.get('promoted_' + outcome, 0) for outcome in self.OUTCOMES)
+            risky = sorted(((counts[2]/sum(counts), feature) for feature,counts in self.rates.items() if feature != '*' and sum(counts) >= self.prior), reverse=True)[:3]
+        return '{:s} policy: {:d} pastes scheduled, {:d} moved to the front half and {:d} deferred to a later refresh; {:d} matched, {:d} clean, {:d} gone ({:.1f}%), of the moved {:d} gone out of {:d}; of the deferred {:d} fetched later and {:d} gone; most deleted: {:s}'.format(
+            self.policy, c.get('scheduled', 0), c.get('promoted', 0), c.get('deferred', 0), c.get('matched', 0), c.get('clean', 0), c.get('gone', 0),
+            c.get('gone', 0)*100/done if done else 0, c.get('promoted_gone', 0), promoted, c.get('deferred_matched', 0) + c.get('deferred_clean', 0), c.get('deferred_gone', 0), ', '.join('{:s} {:.0f}%'.format(feature, rate*100) for rate,feature in risky) or 'not known yet')
+
+class HttpResponse:
+    def __init__(self, url, status, reason, headers, body, timing, wire_bytes=0):
+        self.url = url
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+        self.timing = timing	# seconds spent connecting, waiting for the first byte and transferring
+        self.wire_bytes = wire_bytes	# body size before content decoding
+
+    def charset(self, default='utf-8'):
+        charset = self.headers.get_content_charset() if self.headers is not None else None
+        return charset or default
+
+    def text(self):
+        return self.body.decode(self.charset(), 'replace')
+
+    def validators(self):
+        return {'etag': self.headers.get('ETag'), 'last_modified': self.headers.get('Last-Modified')}
+
+class HttpStream(HttpResponse):
+## response whose body is read incrementally: chunks() yields content-decoded blocks as they arrive
+## and hands the connection back to the pool once the body is exhausted
+    def __init__(self, client, url, conn, resp, timing):
+        HttpResponse.__init__(self, url, resp.status, resp.reason, resp.headers, None, timing)
+        self.client = client
+        self.conn = conn
+        self.resp = resp
+        self.closed = False
+
+    def decompressor(self, first):
+        encoding = (self.headers.get('Content-Encoding') or '').lower()
+        if encoding in ('gzip', 'x-gzip'):
+            return zlib.decompressobj(16 + zlib.MAX_WBITS)
+        if encoding == 'deflate':	# some servers send raw deflate without the zlib header
+            zlib_header = len(first) > 1 and first[0] & 0x0f == 8 and ((first[0] << 8) | first[1]) % 31 == 0
+            return zlib.decompressobj() if zlib_header else zlib.decompressobj(-zlib.MAX_WBITS)
+        return None
+
+    def chunks(self, size=1024*64):
+        decoder = False
+        try:
+            while True:
+                start = time.time()
+                data = self.resp.read(size)
+                self.timing['transfer'] += time.time() - start
+                if not data:
+                    break
+                self.wire_bytes += len(data)
+                if decoder is False:
+                    decoder = self.decompressor(data)
+                if decoder is not None:
+                    data = decoder.decompress(data)
+                if data:
+                    yield data
+            if decoder:
+                data = decoder.flush()
+                if data:
+                    yield data
+        finally:
+            self.close()
+
+    def read(self):
+        return b''.join(self.chunks())
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self.resp.isclosed() and not self.resp.will_close:	# body fully read, the connection can be reused
+            self.client.release(self.url, self.conn)
+        else:
+            self.conn.close()
+        self.client.account(self)
+
+class HttpClient:
+## one client is shared by every request of the crawler: connections are kept alive and reused per
+## (scheme, host, port), responses are gzip/deflate encoded on the wire, every socket has a timeout
+## and the time spent in each phase of a request is accounted
+    USER_AGENT = 'Mozilla/5.0 (X11; Linux x86_64; rv:68.0) Gecko/20100101 Firefox/68.0'
+    REDIRECTS = (301, 302, 303, 307, 308)
+    max_redirects = 5
+    max_idle = 8	# idle connections kept per host
+
+    def __init__(self, timeout=30):
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.idle = {}
+        self.totals = {'requests':0, 'connections':0, 'connect':0.0, 'wait':0.0, 'transfer':0.0, 'bytes':0, 'not_modified':0}
+
+    def connection(self, url):
+        parts = urllib.parse.urlsplit(url)
+        with self.lock:
+            idle = self.idle.get((parts.scheme,parts.netloc))
+            if idle:
+                return idle.pop(), True
+        cls = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        return cls(parts.netloc, timeout=self.timeout), False
+
+    def release(self, url, conn):
+        parts = urllib.parse.urlsplit(url)
+        with self.lock:
+            idle = self.idle.setdefault((parts.scheme,parts.netloc), [])
+            if len(idle) < self.max_idle:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def close(self):
+        with self.lock:
+            for idle in self.idle.values():
+                for conn in idle:
+                    conn.close()
+            self.idle = {}
+
+    def account(self, stream):
+        with self.lock:
+            self.totals['requests'] += 1
+            self.totals['connections'] += 0 if stream.timing['reused'] else 1
+            self.totals['connect'] += stream.timing['connect']
+            self.totals['wait'] += stream.timing['wait']
+            self.totals['transfer'] += stream.timing['transfer']
+            self.totals['bytes'] += stream.wire_bytes
+            self.totals['not_modified'] += 1 if stream.status == 304 else 0
+
+    def request(self, url, headers):
+        parts = urllib.parse.urlsplit(url)
+        path = (parts.path or '/') + ('?' + parts.query if parts.query else '')
+        for attempt in range(2):
+            conn,reused = self.connection(url)
+            timing = {'connect':0.0, 'wait':0.0, 'transfer':0.0, 'reused':reused}
+            try:
+                if not reused:
+                    start = time.time()
+                    conn.connect()
+                    timing['connect'] = time.time() - start
+                start = time.time()
+                conn.request('GET', path, headers=headers)
+                resp = conn.getresponse()
+                timing['wait'] = time.time() - start
+            except (http.client.RemoteDisconnected, http.client.BadStatusLine, ConnectionResetError, BrokenPipeError):
+                conn.close()
+                if reused and attempt == 0:	# the server dropped an idle keep-alive connection, retry on a new one
+                    continue
+                raise
+            except:
+                conn.close()
+                raise
+            return HttpStream(self, url, conn, resp, timing)
+
+    def open(self, url, validators=None):
+        headers = {'User-Agent':self.USER_AGENT, 'Accept-Encoding':'gzip, deflate', 'Connection':'keep-alive'}
+        if validators:
+            if validators.get('etag'):
+                headers['If-None-Match'] = validators['etag']
+            if validators.get('last_modified'):
+                headers['If-Modified-Since'] = validators['last_modified']
+
+        for redirect in range(self.max_redirects + 1):
+            stream = self.request(url, headers)
+            if stream.status in self.REDIRECTS and stream.headers.get('Location'):
+                stream.read()
+                url = urllib.parse.urljoin(url, stream.headers.get('Location'))
+                continue
+            break
+        if stream.status >= 400:	# same exception, hence same message, as urllib.request.urlopen
+            stream.read()
+            raise urllib.error.HTTPError(url, stream.status, stream.reason, stream.headers, None)
+        return stream
+
+    def get(self, url, validators=None):
+        stream = self.open(url, validators)
+        body = stream.read()
+        return HttpResponse(stream.url, stream.status, stream.reason, stream.headers, body, stream.timing, stream.wire_bytes)
+
+    def summary(self):
+        with self.lock:
+            t = dict(self.totals)
+        n = t['requests'] or 1
+        return '{:d} HTTP requests over {:d} connections ({:d} not modified, {:.1f} MB); averagely {:.3f}s connecting, {:.3f}s waiting and {:.3f}s transferring per request'.format(
+            t['requests'], t['connections'], t['not_modified'], t['bytes']/1024/1024, t['connect']/n, t['wait']/n, t['transfer']/n)
+
+class SeenIndex:
+## ids of the pastes already processed: an in-memory hash map bounded by age (ttl) and size, mirrored to
+## a sqlite table so that a restart does not check the whole archive again. Only the entries still within
+## the ttl are loaded at startup.
+    def __init__(self, path='data/seen.db', ttl=3600*48, max_entries=200000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()	# paste id -> time last seen, oldest first
+        self.pending = {}	# added since the last commit
+        self.lock = threading.Lock()
+        self.db = None
+        if path:
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute('CREATE TABLE IF NOT EXISTS seen (id TEXT PRIMARY KEY, ts REAL NOT NULL)')
+            self.db.execute('CREATE INDEX IF NOT EXISTS seen_ts ON seen (ts)')
+            rows = self.db.execute('SELECT id, ts FROM seen WHERE ts >= ? ORDER BY ts DESC LIMIT ?', (time.time() - ttl, max_entries)).fetchall()
+            for paste_id,ts in reversed(rows):
+                self.entries[paste_id] = ts
+
+    def __contains__(self, paste_id):
+        return paste_id in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, paste_id):
+        now = time.time()
+        with self.lock:
+            self.entries[paste_id] = now
+            self.entries.move_to_end(paste_id)
+            self.pending[paste_id] = now
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def discard(self, paste_id):
+## forget a paste that could not be fetched yet, e.g. throttled, so that the next refresh retries it
+        with self.lock:
+            self.entries.pop(paste_id, None)
+            self.pending.pop(paste_id, None)
+
+    def commit(self):
+## also called by the checkpoint thread, writes hold the lock
+        with self.lock:
+            pending,self.pending = self.pending,{}
+            if self.db is not None and pending:
+                with self.db:
+                    self.db.executemany('INSERT OR REPLACE INTO seen (id, ts) VALUES (?, ?)', pending.items())
+
+    def prune(self):
+## drop the entries older than ttl from memory and disk, returns how many were dropped from memory
+        cutoff = time.time() - self.ttl
+        dropped = 0
+        with self.lock:
+            while self.entries and next(iter(self.entries.values())) < cutoff:
+                self.entries.popitem(last=False)
+                dropped += 1
+            if self.db is not None:
+                with self.db:
+                    self.db.execute('DELETE FROM seen WHERE ts < ?', (cutoff,))
+        return dropped
+
+    def close(self):
+        self.commit()
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+class WorkQueue:
+## paste ids shared by a coordinator, which polls the archive and publishes them, and any number of workers
+## claiming them in batches, each with its own rate controller and egress. Kept in a sqlite table: an id is
+## inserted once whatever how many times it is published (deduplication across polls, restarts and
+## coordinators), a claim is a lease that returns the paste to the others if its worker dies, and every
+## claim gets a new token so that a worker whose lease expired cannot complete it any more (fencing).
+## Workers on the same host open the same file; serve() lets workers on other hosts use it over HTTP,
+## see RemoteQueue, those knowing the shared token only.
+    PENDING = 0
+    CLAIMED = 1
+    DONE = 2
+    FAILED = 3
+    STATES = {PENDING:'pending', CLAIMED:'claimed', DONE:'done', FAILED:'failed'}
+    METHODS = ('publish', 'claim', 'renew', 'complete', 'release', 'counts')	# served by serve()
+
+    def __init__(self, path='data/queue.db', max_attempts=3):
+        self.path = path
+        self.max_attempts = max_attempts	# claims of a paste before it is given up as failed
+        self.lock = threading.Lock()
+        self.server = None
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')	# workers read while the coordinator publishes
+        self.db.execute('CREATE TABLE IF NOT EXISTS queue (id TEXT PRIMARY KEY, state INTEGER NOT NULL, ts REAL NOT NULL, '
+                        'worker TEXT, token INTEGER NOT NULL DEFAULT 0, lease REAL, attempts INTEGER NOT NULL DEFAULT 0, matched INTEGER)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS queue_state ON queue (state, ts)')
+
+    def transaction(self, func):
+## BEGIN IMMEDIATE takes the write lock at once, so two workers never claim the same rows
+        with self.lock:
+            self.db.execute('BEGIN IMMEDIATE')
+            try:
+                result = func()
+            except:
+                self.db.execute('ROLLBACK')
+                raise
+            self.db.execute('COMMIT')
+            return result
+
+    def publish(self, ids):
+## returns how many of the ids were new
+        now = time.time()
+        def insert():
+            before = self.db.total_changes
+            self.db.executemany('INSERT OR IGNORE INTO queue (id, state, ts) VALUES (?, ?, ?)', [(paste_id, self.PENDING, now) for paste_id in ids])
+            return self.db.total_changes - before
+        return self.transaction(insert)
+
+    def claim(self, worker, count, lease=600):
+## up to count pending pastes, oldest first, or claimed ones whose lease expired; returns [(id, token)]
+        now = time.time()
+        def claim():
+            self.db.execute('UPDATE queue SET state = ? WHERE state = ? AND lease < ? AND attempts >= ?', (self.FAILED, self.CLAIMED, now, self.max_attempts))
+            rows = self.db.execute('SELECT id, token FROM queue WHERE state = ? OR (state = ? AND lease < ?) ORDER BY ts LIMIT ?',
+                                   (self.PENDING, self.CLAIMED, now, count)).fetchall()
+            self.db.executemany('UPDATE queue SET state = ?, worker = ?, token = ?, lease = ?, attempts = attempts + 1 WHERE id = ?',
+                                [(self.CLAIMED, worker, token + 1, now + lease, paste_id) for paste_id,token in rows])
+            return [(paste_id, token + 1) for paste_id,token in rows]
+        return self.transaction(claim)
+
+    def renew(self, paste_id, token, lease=600):
+## extends a claim to lease seconds from now, False if it was lost meanwhile
+        now = time.time()
+        def renew():
+            return self.db.execute('UPDATE queue SET lease = ? WHERE id = ? AND token = ? AND state = ?',
+                                   (now + lease, paste_id, token, self.CLAIMED)).rowcount == 1
+        return self.transaction(renew)
+
+    def complete(self, paste_id, token, matched=0):
+## False if the claim was lost meanwhile: the paste is then someone else's, results included
+        def complete():
+            return self.db.execute('UPDATE queue SET state = ?, lease = NULL, matched = ? WHERE id = ? AND token = ? AND state = ?',
+                                   (self.DONE, matched, paste_id, token, self.CLAIMED)).rowcount == 1
+        return self.transaction(complete)
+
+    def release(self, paste_id, token):
+## give a claimed paste back, e.g. when this worker is throttled, another worker may fetch it sooner
+        def release():
+            return self.db.execute('UPDATE queue SET state = ?, lease = NULL WHERE id = ? AND token = ? AND state = ?',
+                                   (self.PENDING, paste_id, token, self.CLAIMED)).rowcount == 1
+        return self.transaction(release)
+
+    def counts(self):
+        with self.lock:
+            rows = self.db.execute('SELECT state, COUNT(*) FROM queue GROUP BY state').fetchall()
+        counts = {name:0 for name in self.STATES.values()}
+        counts.update((self.STATES[state], count) for state,count in rows)
+        return counts
+
+    def prune(self, ttl):
+## forget the pastes done or failed more than ttl seconds after they were published
+        def prune():
+            return self.db.execute('DELETE FROM queue WHERE state IN (?, ?) AND ts < ?', (self.DONE, self.FAILED, time.time() - ttl)).rowcount
+        return self.transaction(prune)
+
+    def summary(self):
+        return ', '.join('{:d} {:s}'.format(count, state) for state,count in self.counts().items())
+
+    def serve(self, port, host='', token=''):
+## every method of METHODS is a POST of its keyword arguments as JSON to /<method>, answering its result.
+## With a token, requests without it in their X-Queue-Token header are refused: anyone else reaching the
+## port could drain the queue or mark pastes done.
+        work_queue = self
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            def log_message(self, *args):
+                pass
+            def do_POST(self):
+                name = self.path.strip('/')
+                try:
+                    if token and not hmac.compare_digest((self.headers.get('X-Queue-Token') or '').encode('utf-8'), token.encode('utf-8')):
+                        raise PermissionError('wrong or missing queue token')
+                    if name not in work_queue.METHODS:
+                        raise LookupError('unknown method ' + name)
+                    args = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)) or b'{}')
+                    body = json.dumps(getattr(work_queue, name)(**args)).encode('utf-8')
+                    status = 200
+                except KeyboardInterrupt:
+                    raise
+                except Exception as inst:
+                    body = json.dumps(str(inst)).encode('utf-8')
+                    status = 401 if isinstance(inst, PermissionError) else 404 if isinstance(inst, LookupError) else 500
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+        self.server = http.server.ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name='work-queue', daemon=True).start()
+        return self.server.server_port
+
+    def close(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server = None
+        with self.lock:
+            self.db.close()
+
+class RemoteQueue:
+## a WorkQueue served by a coordinator on another host, e.g. http://10.0.0.1:8090
+    def __init__(self, url, timeout=30, token=''):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+        self.token = token	# shared with the coordinator, see WorkQueue.serve
+
+    def call(self, name, **args):
+        headers = {'Content-Type':'application/json'}
+        if self.token:
+            headers['X-Queue-Token'] = self.token
+        request = urllib.request.Request(self.url + '/' + name, data=json.dumps(args).encode('utf-8'), headers=headers)
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+    def publish(self, ids):
+        return self.call('publish', ids=list(ids))
+
+    def claim(self, worker, count, lease=600):
+        return [tuple(claim) for claim in self.call('claim', worker=worker, count=count, lease=lease)]
+
+    def renew(self, paste_id, token, lease=600):
+        return self.call('renew', paste_id=paste_id, token=token, lease=lease)
+
+    def complete(self, paste_id, token, matched=0):
+        return self.call('complete', paste_id=paste_id, token=token, matched=matched)
+
+    def release(self, paste_id, token):
+        return self.call('release', paste_id=paste_id, token=token)
+
+    def counts(self):
+        return self.call('counts')
+
+    def prune(self, ttl):
+        return 0	# left to the coordinator
+
+    def summary(self):
+        return ', '.join('{:d} {:s}'.format(count, state) for state,count in self.counts().items())
+
+    def close(self):
+        pass
+
+def lock_file(path):
+## an exclusive lock on path, held until the returned file is closed; None if another process holds it.
+## Advisory, and a no-op where fcntl is missing.
+    f = open(path, 'a')
+    if fcntl is not None:
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return None
+    return f
+
+def worker_data_dir(root='data'):
+## the first root/worker-N directory no other worker on this host holds, and its lock, held while this one runs
+    n = 1
+    while True:
+        path = os.path.join(root, 'worker-{:d}'.format(n))
+        os.makedirs(path, exist_ok=True)
+        held = lock_file(os.path.join(path, 'lock'))
+        if held is not None:
+            return path, held
+        n += 1
+
+class PasteStore:
+## Content addressed store for saved pastes, replacing one small file per match. Bodies are keyed by their
+## sha256, so a re-posted paste is stored once, and appended as independent compressed frames (zstd when
+## installed, else gzip members) to segment files of up to max_segment bytes. bodies.idx holds one fixed
+## size record per body (digest, segment, offset, compressed and raw length) and matches.tsv one line per
+## saved match; segments are read back through mmap. Only one process may have a store open for writing at a
+## time, readonly ones take no lock and read what was written when they were opened.
+    RECORD = struct.Struct('<32sIQII')
+    max_segment = 256*1024*1024
+
+    def __init__(self, path='data/store', codec=None, level=None, readonly=False):
+        self.path = path
+        self.codec = codec or ('zstd' if zstandard is not None else 'gzip')
+        if self.codec == 'zstd' and zstandard is None:
+            raise ValueError('zstandard is not installed, use the gzip codec')
+        self.level = level if level is not None else (9 if self.codec == 'zstd' else 6)
+        self.lock = threading.Lock()
+        self.bodies = {}	# digest -> (segment, offset, compressed length, raw length)
+        self.maps = {}	# segment -> (file, mmap) opened for reading
+        self.totals = {'saved':0, 'deduplicated':0, 'raw':0, 'stored':0}
+        if readonly:
+            if not os.path.isdir(path):
+                raise RuntimeError('there is no paste store in {:s}'.format(path))
+            self.held = None
+        else:
+            os.makedirs(path, exist_ok=True)
+            self.held = lock_file(os.path.join(path, 'lock'))	# appends of two processes would interleave
+            if self.held is None:
+                raise RuntimeError('the paste store {:s} is open in another process'.format(path))
+        index = os.path.join(path, 'bodies.idx')
+        size = os.path.getsize(index) if os.path.exists(index) else 0
+        if size >= self.RECORD.size:
+            with open(index, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                for pos in range(0, size - size % self.RECORD.size, self.RECORD.size):
+                    digest,segment,offset,length,raw = self.RECORD.unpack_from(m, pos)
+                    self.bodies[digest] = (segment, offset, length, raw)
+        self.index = self.matches = None
+        if not readonly:
+            self.index = open(index, 'ab')
+            self.index.truncate(size - size % self.RECORD.size)	# drop a record torn by a crash
+            self.matches = open(os.path.join(path, 'matches.tsv'), 'a', encoding='utf-8')
+        segments = sorted(int(name.split('.')[0][len('segment-'):]) for name in os.listdir(path) if name.startswith('segment-'))
+        self.segment = segments[-1] if segments else 1
+        self.writer = None
+
+    def segment_file(self, segment):
+        for codec in ('zstd', 'gzip'):
+            name = os.path.join(self.path, 'segment-{:06d}.{:s}'.format(segment, 'zst' if codec == 'zstd' else 'gz'))
+            if os.path.exists(name) or codec == self.codec:
+                return name, codec
+
+    def compressor(self):
+        if self.codec == 'zstd':
+            return zstandard.ZstdCompressor(level=self.level).compressobj()
+        return zlib.compressobj(self.level, zlib.DEFLATED, 31)	# gzip member, segments stay readable by zcat
+
+    def open_segment(self):
+        name,codec = self.segment_file(self.segment)
+        if codec != self.codec or (os.path.exists(name) and os.path.getsize(name) >= self.max_segment):
+            self.segment += 1
+            name,codec = self.segment_file(self.segment)
+        self.writer = open(name, 'ab')
+
+    def put(self, chunks):
+## chunks is a list of str or a callable returning a fresh iterator of them, walked once to hash the body
+## and once more to compress it when it was not stored yet; returns (digest, new)
+        digest = hashlib.sha256()
+        for text in (chunks() if callable(chunks) else chunks):
+            digest.update(text.encode('utf-8', 'surrogatepass'))
+        digest = digest.digest()
+        with self.lock:
+            if digest in self.bodies:
+                self.totals['deduplicated'] += 1
+                return digest, False
+            if self.writer is None or self.writer.tell() >= self.max_segment:
+                if self.writer is not None:
+                    self.writer.close()
+                    self.segment += 1
+                self.open_segment()
+            offset = self.writer.seek(0, os.SEEK_END)
+            compressor = self.compressor()
+            raw = 0
+            for text in (chunks() if callable(chunks) else chunks):
+                data = text.encode('utf-8', 'surrogatepass')
+                raw += len(data)
+                self.writer.write(compressor.compress(data))
+            self.writer.write(compressor.flush())
+            self.writer.flush()
+            length = self.writer.tell() - offset
+            self.index.write(self.RECORD.pack(digest, self.segment, offset, length, raw))	# after the body, a crash leaves no dangling record
+            self.index.flush()
+            self.bodies[digest] = (self.segment, offset, length, raw)
+            self.totals['raw'] += raw
+            self.totals['stored'] += length
+            return digest, True
+
+    def save(self, paste_id, category, file, chunks, timestamp=None):
+        digest,new = self.put(chunks)
+        with self.lock:
+            self.totals['saved'] += 1
+            self.matches.write('\t'.join((timestamp or get_timestamp(), paste_id.strip('/'), category, file, digest.hex())) + '\n')
+            self.matches.flush()
+        return digest
+
+    def locate(self, digest):
+## (segment file, codec, offset, compressed and raw length) of a body, for read_frame in another process
+        if isinstance(digest, str):
+            digest = bytes.fromhex(digest)
+        with self.lock:
+            segment,offset,length,raw = self.bodies[digest]
+        name,codec = self.segment_file(segment)
+        return name, codec, offset, length, raw
+
+    @staticmethod
+    def read_frame(m, codec, offset, length, raw):
+        frame = m[offset:offset+length]
+        if codec == 'zstd':
+            data = zstandard.ZstdDecompressor().decompress(frame, max_output_size=raw)
+        else:
+            data = zlib.decompress(frame, 31)
+        return data.decode('utf-8', 'surrogatepass')
+
+    def get(self, digest):
+        if isinstance(digest, str):
+            digest = bytes.fromhex(digest)
+        with self.lock:
+            segment,offset,length,raw = self.bodies[digest]
+            if segment not in self.maps:
+                name,codec = self.segment_file(segment)
+                f = open(name, 'rb')
+                self.maps[segment] = (f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), codec)
+            f,m,codec = self.maps[segment]
+            if offset + length > len(m):	# the segment grew since it was mapped
+                m.close()
+                m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self.maps[segment] = (f, m, codec)
+            return self.read_frame(m, codec, offset, length, raw)
+
+    def records(self):
+## the saved matches, oldest first: (timestamp, paste id, category, file, digest)
+        if self.matches is not None:
+            self.matches.flush()
+        if not os.path.exists(os.path.join(self.path, 'matches.tsv')):
+            return
+        with open(os.path.join(self.path, 'matches.tsv'), 'r', encoding='utf-8') as f:
+            for line in f:
+                fields = line.rstrip('\n').split('\t')
+                if len(fields) == 5:
+                    yield tuple(fields)
+
+    def summary(self):
+        raw = sum(entry[3] for entry in self.bodies.values())
+        stored = sum(entry[2] for entry in self.bodies.values())
+        return '{:d} bodies in {:d} segments, {:.1f} MB stored for {:.1f} MB of text ({:.1f}x); {:d} saved and {:d} deduplicated since start'.format(
+            len(self.bodies), len(set(entry[0] for entry in self.bodies.values())), stored/1024/1024, raw/1024/1024, raw/stored if stored else 0,
+            self.totals['saved'], self.totals['deduplicated'])
+
+    def sync(self):
+        with self.lock:
+            for f in (self.writer, self.index, self.matches):
+                if f is not None:
+                    f.flush()
+                    os.fsync(f.fileno())
+
+    def close(self):
+        with self.lock:
+            for f,m,codec in self.maps.values():
+                m.close()
+                f.close()
+            self.maps = {}
+            if self.writer is not None:
+                self.writer.close()
+                self.writer = None
+            for f in (self.index, self.matches, self.held):
+                if f is not None:
+                    f.close()
+
+class ResultWriter:
+## Persists matches off the crawl loop: save_result queues the writes, a single thread commits them in
+## batches of what is waiting, grouping the appends to each URL list into one write and, with fsync on,
+## syncing every touched file once per batch. The queue is bounded so a slow disk pushes back on the
+## crawler instead of growing memory; once closed, writes are done inline so nothing queued is lost.
+## Callbacks queued with after() run once the writes queued before them are committed. A match is saved
+## once per rule: a paste the URL list of its rule already has is skipped, whatever how many times it is
+## processed, e.g. again after a crash or by a rescan.
+    FSYNC = ('none', 'batch')
+
+    def __init__(self, depth=1000, batch=64, fsync='none', store=None, root='data'):
+        self.batch = batch
+        self.fsync = fsync == 'batch'
+        self.store = store
+        self.root = root	# data directory, the store records the category of a match relative to it
+        self.queue = queue.Queue(maxsize=depth)
+        self.lock = threading.Lock()
+        self.closed = False
+        self.listed = {}	# URL list file -> ids of the pastes it has, read when first written to
+        self.totals = {'items':0, 'batches':0, 'errors':0, 'skipped':0, 'max_depth':0, 'blocked':0.0, 'time':0.0, 'max_time':0.0, 'fsync':0.0}
+        self.thread = threading.Thread(target=self.run, name='result-writer', daemon=True)
+        self.thread.start()
+
+    def put(self, item):
+        if self.closed:
+            self.commit([item])
+            return
+        start = time.time()
+        self.queue.put(item)
+        with self.lock:
+            self.totals['blocked'] += time.time() - start
+            self.totals['max_depth'] = max(self.totals['max_depth'], self.queue.qsize())
+
+    def append(self, path, text):
+        self.put(('append', path, text))
+
+    def write(self, path, content):
+## content is the paste text or the spool of a big paste, which must then be handed over with release
+        self.put(('write', path, content))
+
+    def save(self, paste_id, category, file, chunks, timestamp):
+        self.put(('store', paste_id, category, file, chunks, timestamp))
+
+    def release(self, spool):
+## closes spool once the writes queued before have read it
+        self.put(('close', spool))
+
+    def after(self, func, *args):
+## calls func(*args) from the writer once the writes queued before are committed (and synced with fsync on),
+## or not at all if one of them failed
+        self.put(('call', func, args))
+
+    @staticmethod
+    def line_id(line):
+## the paste id of a URL list line, <file>-<timestamp>-<paste url>
+        return line.rstrip().rsplit('/', 1)[-1]
+
+    def record(self, file, paste_id):
+## False if the URL list file already has paste_id, else notes that it is being written
+        with self.lock:
+            ids = self.listed.get(file)
+            if ids is None:
+                ids = self.listed[file] = set()
+                if os.path.exists(file):
+                    with open(file, 'r', errors='replace') as f:
+                        ids.update(self.line_id(line) for line in f)
+            if paste_id.strip('/') in ids:
+                self.totals['skipped'] += 1
+                return False
+            ids.add(paste_id.strip('/'))
+            return True
+
+    def result(self, paste_id, paste_url, file, directory, content, timestamp):
+## a match in the layout of Crawler.save_result: a line in the URL list file, and the paste saved under
+## directory, or in the store. content is the paste text or the spool of a big paste. Returns False for a
+## match saved already.
+        if not self.record(file, paste_id):
+            return False
+        fn = os.path.splitext(os.path.split(file)[1])[0]
+        self.append ( file, fn + '-' + timestamp + '-' + paste_url + os.linesep )
+        if self.store is not None:
+            if isinstance(content, str):
+                chunks = [content]
+            else:
+                def chunks():
+                    content.seek(0)
+                    return itertools.chain(iter(lambda: content.read(1024*1024), ''), [os.linesep])
+            self.save(paste_id, os.path.relpath(directory, self.root), fn, chunks, timestamp)
+        else:
+            self.write( directory + '/' + fn + '_' + timestamp.replace('/','_').replace(':','_').replace(' ','__') + '_' + paste_id.replace('/','') + '.txt', content )
+        return True
+
+    def flush(self):
+## wait until everything queued so far is written
+        if not self.closed:
+            self.queue.join()
+
+    def run(self):
+        while True:
+            batch = [self.queue.get()]
+            while batch[-1] is not None and len(batch) < self.batch:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            self.commit([item for item in batch if item is not None])
+            for item in batch:
+                self.queue.task_done()
+            if batch[-1] is None:
+                return
+
+    def commit(self, batch):
+        start = time.time()
+        appends = collections.OrderedDict()	# path -> lines, one write per URL list
+        synced = []
+        calls = []
+        failed = False
+        for item in batch:
+            kind = item[0]
+            try:
+                if kind == 'append':
+                    appends.setdefault(item[1], []).append(item[2])
+                elif kind == 'write':
+                    path,content = item[1:]
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    if isinstance(content, str):
+                        paste = open(path, mode='w')
+                        paste.write(content)
+                    else:
+                        paste = open(path, mode='w', encoding='utf-8')
+                        content.seek(0)
+                        shutil.copyfileobj(content, paste)
+                        paste.write(os.linesep)
+                    synced.append(paste)
+                elif kind == 'store':
+                    self.store.save(*item[1:])
+                elif kind == 'close':
+                    item[1].close()
+                elif kind == 'call':
+                    calls.append(item[1:])
+            except KeyboardInterrupt:
+                raise
+            except Exception as inst:
+                failed = True
+                with self.lock:
+                    self.totals['errors'] += 1
+                Logger().error('Error writing {:s}, error is {:s}.'.format(str(item[1]) if kind != 'store' else 'paste ' + item[1], str(inst)))
+        for path,lines in appends.items():
+            try:
+                matching = open(path, 'a')
+                matching.write(''.join(lines))
+                synced.append(matching)
+            except KeyboardInterrupt:
+                raise
+            except Exception as inst:
+                failed = True
+                with self.lock:
+                    self.totals['errors'] += 1
+                    self.listed.get(path, set()).difference_update(self.line_id(line) for line in lines)	# written again when processed again
+                Logger().error('Error writing {:s}, error is {:s}.'.format(path, str(inst)))
+        synced_at = time.time()
+        for f in synced:
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+            f.close()
+        if self.fsync and self.store is not None:
+            self.store.sync()
+        for func,args in ([] if failed else calls):	# a failed batch leaves e.g. work queue claims to expire
+            try:
+                func(*args)
+            except KeyboardInterrupt:
+                raise
+            except Exception as inst:
+                Logger().error('Error after writing a batch, error is {:s}.'.format(str(inst)))
+        with self.lock:
+            elapsed = time.time() - start
+            self.totals['items'] += len(batch)
+            self.totals['batches'] += 1
+            self.totals['time'] += elapsed
+            self.totals['max_time'] = max(self.totals['max_time'], elapsed)
+            if self.fsync:
+                self.totals['fsync'] += time.time() - synced_at
+
+    def close(self):
+## flushes everything queued, later writes are done inline
+        if self.closed:
+            return
+        self.queue.put(None)
+        self.thread.join()
+        self.closed = True
+        late = []	# queued by another thread while closing
+        while not self.queue.empty():
+            late.append(self.queue.get_nowait())
+        self.commit([item for item in late if item is not None])
+
+    def summary(self):
+        t = self.totals
+        return '{:d} writes in {:d} batches ({:.1f} per batch, {:d} errors), {:d} matches saved already skipped; averagely {:.1f} ms, at most {:.1f} ms per batch of which {:.1f} ms fsync; queue peaked at {:d}, crawler blocked {:.2f}s on it'.format(
+            t['items'], t['batches'], t['items']/t['batches'] if t['batches'] else 0, t['errors'], t['skipped'], t['time']/t['batches']*1000 if t['batches'] else 0,
+            t['max_time']*1000, t['fsync']/t['batches']*1000 if t['batches'] else 0, t['max_depth'], t['blocked'])
+
+ArchiveEntry = collections.namedtuple('ArchiveEntry', ['id', 'title', 'syntax', 'age', 'size'])	# a row of /archive, age in seconds
+
 class Crawler:
 
     PASTEBIN_URL = 'http://pastebin.com'
@@ -216,40 +2192,164 @@ class Crawler:
     ACCESS_DENIED = -1
     CONNECTION_FAIL = -2
     OTHER_ERROR = -3
+    NOT_MODIFIED = 2
+    STATUS_NAMES = {OK:'ok', ACCESS_DENIED:'banned', CONNECTION_FAIL:'connection_fail', OTHER_ERROR:'other_error', NOT_MODIFIED:'not_modified'}
+    FETCH_MODES = ('raw', 'html')
+    STORAGES = ('files', 'store')
+    ROLES = ('standalone', 'coordinator', 'worker')
+    PENDING_RETRIES = 3	# refreshes a pending paste is retried at, when the archive does not list it any more
+    BAN_TITLE = re.compile(rb'<title>\s*Pastebin\.com - Access Denied Warning', re.I)
+    BAN_MARKERS = (b'blocked your IP', b'unatural browsing behavior')
+    ARCHIVE_TABLE = re.compile(rb'<table[^>]*class="[^"]*\bmaintable\b[^"]*"[^>]*>(.*?)</table>', re.S | re.I)
+    ARCHIVE_ROW = re.compile(rb'<tr[^>]*>(.*?)</tr>', re.S | re.I)
+    ARCHIVE_LINK = re.compile(rb'<img[^>]*>\s*<a\s+href="(/[^"/?#]+)"[^>]*>(.*?)</a>', re.S | re.I)
+    ARCHIVE_AGE = re.compile(rb'>\s*(\d+)\s*(sec|min|hour|day|week|month|year)s?\s+ago\s*<', re.I)
+    ARCHIVE_SYNTAX = re.compile(rb'<a\s+href="/archive/([^"]*)"[^>]*>(.*?)</a>', re.S | re.I)
+    ARCHIVE_SIZE = re.compile(rb'>\s*(\d+(?:\.\d+)?)\s*(bytes|KB|MB)\s*<', re.I)
+    ARCHIVE_CHARSET = re.compile(rb'<meta[^>]+charset=["\']?([\w-]+)', re.I)
+    AGE_UNITS = {'sec':1, 'min':60, 'hour':3600, 'day':86400, 'week':7*86400, 'month':30*86400, 'year':365*86400}
+    SIZE_UNITS = {'BYTES':1, 'KB':1024, 'MB':1024*1024}
+
+    @staticmethod
+    def parse_regexes(lines):
+        regexes = [ [ field.strip() for field in line.split(',')] for line in lines if line.strip() != '' and not line.startswith('#')]
 
-    prev_checked_ids = []
-    new_checked_ids = []
+        # In case commas exist in the regexes...merge everything.
+        for i in range(len(regexes)):
+            regexes[i] = [','.join(regexes[i][:-2])] + regexes[i][-2:]
+        return regexes
+
+    @classmethod
+    def validate_regexes(cls, lines, known=()):
+## returns the rules and the list of problems found, patterns in known were already compiled once
+        regexes = []
+        errors = []
+        for n,line in enumerate(lines, 1):
+            if line.strip() == '' or line.startswith('#'):
+                continue
+            rule = cls.parse_regexes([line])[0]
+            if len(rule) < 3 or not all(rule):
+                errors.append('line {:d}: expected regex_pattern,URL logging file,directory logging file'.format(n))
+                continue
+            if rule[0] not in known:
+                try:
+                    re.compile(rule[0], re.IGNORECASE)
+                except re.error as inst:
+                    errors.append('line {:d}: {:s} in {:s}'.format(n, str(inst), rule[0][:40]))
+                    continue
+            regexes.append(rule)
+        return regexes, errors
 
     def read_regexes(self):
+## Reparses regexes.txt only when it changed since the last call. A file that does not validate is rejected
+## and the rules loaded before keep running; it is only fatal at startup, when there are none. The new
+## RuleSet replaces the old one in a single assignment, scans already running finish with the old one.
         try:
+            stat = os.stat(self.REGEXES_FILE)
+            changed = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+            if changed == self.regexes_stat:
+                return False
             with open ( self.REGEXES_FILE, 'r') as f:
-                try:
-                    self.regexes = [ [ field.strip() for field in line.split(',')] for line in f.readlines() if line.strip() != '' and not line.startswith('#')]
-
-                    # In case commas exist in the regexes...merge everything.
-                    for i in range(len(self.regexes)):
-                        self.regexes[i] = [','.join(self.regexes[i][:-2])] + self.regexes[i][-2:]
-                except KeyboardInterrupt:
-                    raise
-                except:
-                    Logger(self.verbose).fatal_error('Malformed regexes file. Format: regex_pattern,URL logging file, directory logging file.')
-
-            #for regex,file,directory in self.regexes:
-                #Logger (self.verbose).log ( directory+':\t'+file+':\t'+regex[:68])
-            Logger (self.verbose).log ( '{:d} regex rules are refreshed.'.format(len(self.regexes)), True)
-
+                lines = f.readlines()
         except KeyboardInterrupt:
             raise
         except:
-            Logger(self.verbose).fatal_error('{:s} not found or not acessible.'.format(self.REGEXES_FILE))
+            if self.ruleset is None:
+                Logger(self.verbose).fatal_error('{:s} not found or not acessible.'.format(self.REGEXES_FILE))
+            Logger(self.verbose).error('{:s} not found or not acessible, still matching the {:d} rules loaded before.'.format(self.REGEXES_FILE,len(self.ruleset.rules)))
+            return False
+        self.regexes_stat = changed	# a rejected file is not reported again until it changes
 
+        cache = self.ruleset.cache if self.ruleset is not None else None
+        regexes,errors = self.validate_regexes(lines, known=cache or ())
+        ruleset = None
+        if not errors:
+            try:
+                ruleset = RuleSet(regexes, engine=self.rule_engine, budget=self.rule_budget, profile=self.profile_rules, sample=self.profile_sample,
+                                  disabled=self.profiler.quarantined(regexes), version=self.ruleset_version + 1, cache=cache)
+            except KeyboardInterrupt:
+                raise
+            except Exception as inst:
+                errors.append(str(inst))
+        if errors:
+            for error in errors[:10]:
+                Logger(self.verbose).error('{:s}: {:s}'.format(self.REGEXES_FILE,error))
+            if self.ruleset is None:
+                Logger(self.verbose).fatal_error('Malformed regexes file. Format: regex_pattern,URL logging file, directory logging file.')
+            Logger(self.verbose).error('Malformed regexes file rejected, still matching the {:d} rules loaded before.'.format(len(self.ruleset.rules)))
+            return False
 
-    def __init__(self):
+        self.ruleset_version = ruleset.version
+        self.regexes = regexes
+        self.ruleset = ruleset
+        Logger (self.verbose).log ( '{:d} regex rules are refreshed ({:d} recompiled, {:s} engine).'.format(len(regexes),ruleset.recompiled,ruleset.engine), True)
+        return True
+
+
+    def __init__(self, rule_engine='auto', workers=1, scan_queue=100, http_timeout=30, fetch_mode='raw', seen_db='data/seen.db', seen_ttl=48, seen_max=200000,
+                 stream_window=256, stream_overlap=4, stop_categories=(), scan_processes=0, scan_depth=32,
+                 rule_budget=2, profile_rules=False, profile_sample=0.01, profile_interval=3600, base_url=None, storage='files', store_path='data/store', store_codec=None,
+                 writer_queue=1000, writer_batch=64, writer_fsync='none', max_rate=2, archive_snapshots=None,
+                 metrics_port=0, metrics_host='127.0.0.1', role='standalone', queue_path='data/queue.db', queue_port=0, queue_host='127.0.0.1', queue_token='',
+                 queue_batch=10, queue_lease=600, prefilter=True, decode_blobs=True, duplicate_cache=10000, skip_binary=False,
+                 checkpoint='', checkpoint_interval=60, schedule='page', schedule_urgency=2.0, data_dir='data'):
         #self.read_regexes()
+        if base_url:	# e.g. a local fake_pastebin.py
+            self.PASTEBIN_URL = base_url.rstrip('/')
+            self.PASTES_URL = self.PASTEBIN_URL + '/archive'
+            self.PASTESRAW_URL = self.PASTEBIN_URL + '/raw.php?i='
+        self.rule_budget = rule_budget	# seconds a single rule may spend on a paste
+        self.profile_rules = profile_rules
+        self.profile_sample = profile_sample	# share of the pastes whose rules are timed one by one without profile_rules
+        self.profile_interval = profile_interval
+        self.last_profile_dump = time.time()
+        self.profile_requested = False	# set by SIGUSR1, the main loop dumps the profile
+        self.profiler = RuleProfiler()
+        self.ruleset = None	# replaced as a whole by read_regexes, never modified in place but for quarantines
+        self.ruleset_version = 0
+        self.regexes_stat = None	# mtime, size and inode of the regexes file last read
+        self.scan_pool = ScanPool(scan_processes, scan_depth, self.scan_done) if scan_processes > 0 else None
+        self.stream_window = stream_window*1024	# pastes bigger than this are matched window by window
+        self.stream_overlap = stream_overlap*1024	# longest match guaranteed to be found across windows
+        self.stop_categories = set(stop_categories)	# stop matching a big paste once all of these directories are hit
+        self.prefilter = Prefilter(enabled=prefilter, decode=decode_blobs, duplicates=duplicate_cache, skip_binary=skip_binary)	# pastes up to stream_window only
+        self.seen = SeenIndex(seen_db, ttl=seen_ttl*3600, max_entries=seen_max)
+        self.store = PasteStore(store_path, codec=store_codec) if storage == 'store' else None	# None keeps one file per match under data/
+        self.data_dir = data_dir	# URL lists and files of the matches, a worker has its own
+        self.writer = ResultWriter(depth=writer_queue, batch=writer_batch, fsync=writer_fsync, store=self.store, root=data_dir)
+        atexit.register(self.writer.close)	# exit() on kill_now still writes every queued match
+        self.fetch_mode = fetch_mode	# 'raw' reads the raw endpoint and falls back to the html page
+        self.fetch_counters = {mode:{'pastes':0, 'bytes':0, 'decoded':0, 'cpu':0.0} for mode in self.FETCH_MODES}
+        self.fetch_counters['fallbacks'] = 0
+        self.http = HttpClient(timeout=http_timeout)
+        self.archive_validators = None	# ETag/Last-Modified of the last processed /archive page
+        self.archive_counters = {'fast':0, 'dom':0}	# archive pages parsed by parse_archive, by the PyQuery fallback
+        self.archive_snapshots = archive_snapshots	# directory keeping every /archive page fetched, for the archive benchmark
+        self.rule_engine = rule_engine
+        self.workers = workers	# number of pastes fetched concurrently, 1 keeps the sequential loop
+        if workers > 1 and self.scan_pool is None and rule_budget:
+            Logger().warn('The rule budget is not enforced in the scanner thread of --workers, use --scan-processes to enforce it.')
+        self.scan_queue_size = scan_queue	# fetched pastes waiting for the scanner thread
+        self.lock = threading.Lock()
         self.kill_now = False
-        self.delayfactor = 1	# dynamically adjust the delay time of retrieving each paste
-        self.min_delayfactor = 0.5	# minimal acceptable delay factor preventing from being banned
-        self.max_delayfactor = 1.6	# maxium acceptable delay factor for efficiency
+        self.verbose = False	# set by start() or work()
+        self.conclude_on_delete = True	# log the statistics when dropped, off for the instances of the benchmarks
+        self.rate = None	# RateController pacing paste requests, created once the delay is known
+        self.role = role
+        self.queue = None	# WorkQueue or RemoteQueue shared by a coordinator and its workers, None when standalone
+        if role != 'standalone':
+            self.queue = RemoteQueue(queue_path, timeout=http_timeout, token=queue_token) if queue_path.startswith(('http://','https://')) else WorkQueue(queue_path)
+            if role == 'coordinator' and queue_port and isinstance(self.queue, WorkQueue):
+                port = self.queue.serve(queue_port, queue_host, queue_token)
+                Logger().log('Serving the work queue on http://{:s}:{:d}'.format(queue_host or '0.0.0.0', port), True)
+        self.queue_batch = queue_batch	# pastes claimed at once by a worker
+        self.queue_lease = queue_lease	# seconds a claim lasts before other workers may take the paste over
+        self.claims = {}	# worker mode: paste id -> token of the claims not completed yet
+        self.worker_id = '{:s}-{:d}'.format(socket.gethostname(), os.getpid())
+        self.max_rate = max_rate	# pastes per second never exceeded whatever the controller finds
+        self.scheduler = Scheduler(schedule, urgency=schedule_urgency)
+        self.deadline = None	# priority schedule: time the pastes of this refresh are left to the next one after
+        self.repoll = False	# the archive is polled early for the pastes left over by the last refresh
 ## values used in self.conclude() stats
         self.totalpastes = 0
         self.validpastes = 0
@@ -260,10 +2360,211 @@ class Crawler:
         self.stats = {}
         self.init_stat('get_pastes')
         self.init_stat('check_paste')
+        self.init_stat('fetch_paste')
+        self.init_stat('scan_paste')
+        self.init_metrics(metrics_port, metrics_host)
+## state saved by self.checkpoint() and restored at startup
+        self.pending = collections.OrderedDict()	# paste id -> attempts, for the listed pastes not processed yet
+        self.checkpoint_path = checkpoint	# empty disables checkpoints
+        self.checkpoint_interval = checkpoint_interval
+        self.resumed_rate = None	# RateController state of the last run, restored by self.pace()
+        self.resume()
+        if self.checkpoint_path:
+            atexit.register(self.checkpoint)	# before the writer closes, on kill_now or any other exit
 
 ## register os signals to response to kill interruption
         signal.signal(signal.SIGINT, self.handle)
         signal.signal(signal.SIGTERM, self.handle)
+        signal.signal(signal.SIGUSR1, self.request_profile)
+
+    def init_metrics ( self, port, host ):
+        metrics = self.metrics = Metrics()
+        metrics.describe('archive_polls_total', 'counter', 'Archive page polls by outcome.')
+        metrics.describe('archive_poll_seconds', 'histogram', 'Time to fetch and parse the archive page.')
+        metrics.describe('bans_total', 'counter', 'Ban pages and 403/429 answers, on archive polls or paste fetches.')
+        metrics.describe('pastes_total', 'counter', 'Pastes fetched or attempted.')
+        metrics.describe('pastes_recorded_total', 'counter', 'Matching pastes saved.')
+        metrics.describe('errors_total', 'counter', 'Errors polling the archive, fetching or matching pastes.')
+        metrics.describe('matches_total', 'counter', 'Rule matches by directory.')
+        metrics.describe('fetch_seconds', 'histogram', 'Time to fetch a paste by fetch mode, up to its first window for big pastes.')
+        metrics.describe('scan_seconds', 'histogram', 'Time to match a paste against the rules.')
+        metrics.describe('pastes_fetched_total', 'counter', 'Pastes downloaded by fetch mode.')
+        metrics.describe('paste_bytes_total', 'counter', 'Bytes of the pastes downloaded by fetch mode, as sent on the wire.')
+        metrics.describe('fetch_fallbacks_total', 'counter', 'Raw fetches that fell back to the html page.')
+        metrics.describe('archive_pages_parsed_total', 'counter', 'Archive pages parsed by the byte parser (fast) or PyQuery (dom).')
+        metrics.describe('http_requests_total', 'counter', 'HTTP requests sent.')
+        metrics.describe('http_bytes_total', 'counter', 'Bytes downloaded, as sent on the wire.')
+        metrics.describe('rate_rate', 'gauge', 'Pastes per second the crawler currently paces itself to.')
+        metrics.describe('rate_capacity', 'gauge', 'Pastes per second the rate controller believes safe.')
+        metrics.describe('rate_ceiling', 'gauge', 'Cap on the capacity after a ban, relaxing over time.')
+        metrics.describe('rate_turnover', 'gauge', 'New pastes per second in the archive.')
+        metrics.describe('rate_latency', 'gauge', 'Moving average of the fetch latency in seconds.')
+        metrics.describe('rate_latency_baseline', 'gauge', 'Baseline of the fetch latency in seconds.')
+        metrics.describe('rate_error_rate', 'gauge', 'Moving average of the share of failed fetches.')
+        metrics.describe('rate_decisions_total', 'counter', 'Rate controller decisions.')
+        metrics.describe('seen_ids', 'gauge', 'Paste ids remembered as checked.')
+        metrics.describe('writer_queue_depth', 'gauge', 'Writes waiting for the result writer.')
+        metrics.describe('scan_pool_inflight', 'gauge', 'Pastes submitted to the scanning processes and not matched yet.')
+        metrics.describe('prefilter_pastes_total', 'counter', 'Pastes by prefilter verdict: text, encoded, empty, binary or duplicate.')
+        metrics.describe('prefilter_skipped_bytes_total', 'counter', 'Bytes of the pastes the rules did not run on.')
+        metrics.describe('prefilter_saved_seconds_total', 'counter', 'Estimated seconds of matching saved by the skipped pastes.')
+        metrics.describe('prefilter_blobs_total', 'counter', 'Blobs decoded by encoding.')
+        metrics.describe('prefilter_decoded_bytes_total', 'counter', 'Bytes of decoded blobs added to the matched text.')
+        metrics.describe('prefilter_decoded_matches_total', 'counter', 'Matches found only in decoded blobs.')
+        metrics.describe('queue_pastes', 'gauge', 'Pastes of the work queue by state.')
+        metrics.describe('queue_claims', 'gauge', 'Pastes claimed by this worker and not completed yet.')
+        metrics.describe('schedule_pastes_total', 'counter', 'Scheduled pastes fetched by outcome: matched, clean or gone (404).')
+        metrics.describe('schedule_promoted_total', 'counter', 'Pastes moved from the back half of archive order to the front one, by outcome.')
+        metrics.describe('schedule_deferred_total', 'counter', 'Pastes left to a later refresh once the refresh ran out of time.')
+        metrics.describe('schedule_deferred_done_total', 'counter', 'Deferred pastes fetched in a later refresh, by outcome.')
+        metrics.describe('uptime_seconds', 'gauge', 'Seconds since the crawler started.')
+        metrics.collect(self.collect_metrics)
+        if port:
+            port = metrics.serve(port, host)
+            Logger().log('Serving metrics on http://{:s}:{:d}/metrics'.format(host or '0.0.0.0', port), True)
+
+    def collect_metrics ( self ):
+## values kept anyway by the crawler, read when /metrics is scraped
+        yield 'pastes_total', {}, self.totalpastes
+        yield 'pastes_recorded_total', {}, self.validpastes
+        yield 'errors_total', {}, self.totalerrors
+        for mode in self.FETCH_MODES:
+            yield 'pastes_fetched_total', {'mode':mode}, self.fetch_counters[mode]['pastes']
+            yield 'paste_bytes_total', {'mode':mode}, self.fetch_counters[mode]['bytes']
+        yield 'fetch_fallbacks_total', {}, self.fetch_counters['fallbacks']
+        for parser,count in self.archive_counters.items():
+            yield 'archive_pages_parsed_total', {'parser':parser}, count
+        yield 'http_requests_total', {}, self.http.totals['requests']
+        yield 'http_bytes_total', {}, self.http.totals['bytes']
+        yield 'seen_ids', {}, len(self.seen)
+        yield 'writer_queue_depth', {}, self.writer.queue.qsize()
+        if self.scan_pool is not None:
+            yield 'scan_pool_inflight', {}, self.scan_pool.inflight
+        if self.rate is not None:
+            for key,value in self.rate.metrics().items():
+                if key.startswith('decisions_'):
+                    yield 'rate_decisions_total', {'decision':key[len('decisions_'):]}, value
+                else:
+                    yield 'rate_' + key, {}, value
+        counters = dict(self.prefilter.counters)
+        for verdict in Prefilter.VERDICTS:
+            yield 'prefilter_pastes_total', {'verdict':verdict}, counters[verdict]
+        yield 'prefilter_skipped_bytes_total', {}, counters['skipped_bytes']
+        yield 'prefilter_saved_seconds_total', {}, self.prefilter.saved()
+        for kind in ('base64', 'hex', 'compressed'):
+            yield 'prefilter_blobs_total', {'kind':kind}, counters[kind]
+        yield 'prefilter_decoded_bytes_total', {}, counters['decoded_bytes']
+        yield 'prefilter_decoded_matches_total', {}, counters['decoded_matches']
+        if self.queue is not None:
+            for state,count in self.queue.counts().items():
+                yield 'queue_pastes', {'state':state}, count
+            yield 'queue_claims', {}, len(self.claims)
+        counters = dict(self.scheduler.counters)
+        for outcome in Scheduler.OUTCOMES:
+            yield 'schedule_pastes_total', {'outcome':outcome}, counters.get(outcome, 0)
+            yield 'schedule_promoted_total', {'outcome':outcome}, counters.get('promoted_' + outcome, 0)
+            yield 'schedule_deferred_done_total', {'outcome':outcome}, counters.get('deferred_' + outcome, 0)
+        yield 'schedule_deferred_total', {}, counters.get('deferred', 0)
+        yield 'uptime_seconds', {}, time.time() - self.starttime
+
+    def checkpoint ( self ):
+## a compact snapshot of what a restart needs to go on where this run stopped, replaced atomically
+        if not self.checkpoint_path:
+            return
+        self.seen.commit()	# the pastes done so far are not processed again either
+        with self.lock:
+            state = {'saved':time.time(), 'role':self.role, 'started':self.starttime, 'started_ts':self.starttime_ts,
+                     'totals':{'pastes':self.totalpastes, 'recorded':self.validpastes, 'errors':self.totalerrors},
+                     'stats':{stat:{'total':values['total'], 'num':values['num']} for stat,values in self.stats.items()},
+                     'pending':list(self.pending.items())}
+        state['rate'] = self.rate.state() if self.rate is not None else self.resumed_rate
+        state['schedule'] = self.scheduler.state()
+        if os.path.dirname(self.checkpoint_path):
+            os.makedirs(os.path.dirname(self.checkpoint_path), exist_ok=True)
+        tmp = self.checkpoint_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(state, f, separators=(',',':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.checkpoint_path)
+
+    def checkpointer ( self ):
+## periodic checkpoints, the last one is written at exit
+        while True:
+            time.sleep(self.checkpoint_interval)
+            try:
+                self.checkpoint()
+            except KeyboardInterrupt:
+                raise
+            except Exception as inst:
+                Logger().warn('Could not write the checkpoint {:s}: {:s}.'.format(self.checkpoint_path,str(inst)))
+
+    def start_checkpoints ( self ):
+        if self.checkpoint_path and self.checkpoint_interval > 0 and not hasattr(self, 'checkpoint_thread'):
+            self.checkpoint_thread = threading.Thread(target=self.checkpointer, name='checkpoint', daemon=True)
+            self.checkpoint_thread.start()
+
+    def resume ( self ):
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return
+        try:
+            with open(self.checkpoint_path, 'r') as f:
+                state = json.load(f)
+            if state.get('role', self.role) != self.role:	# e.g. a coordinator started on the data of a standalone crawler
+                Logger().warn('Ignoring the checkpoint {:s} of a {:s} node.'.format(self.checkpoint_path,state['role']))
+                return
+            self.totalpastes = state['totals']['pastes']
+            self.validpastes = state['totals']['recorded']
+            self.totalerrors = state['totals']['errors']
+            self.starttime = state['started']
+            self.starttime_ts = state['started_ts']
+            for stat,values in state['stats'].items():
+                if stat in self.stats:
+                    self.stats[stat]['total'] = values['total']
+                    self.stats[stat]['num'] = values['num']
+            self.resumed_rate = state.get('rate')
+            self.scheduler.restore(state.get('schedule'))
+            self.pending.update((paste_id, attempts) for paste_id,attempts in state['pending'])
+        except (OSError, ValueError, KeyError, TypeError) as inst:
+            Logger().warn('Ignoring the unreadable checkpoint {:s}: {:s}.'.format(self.checkpoint_path,str(inst)))
+            return
+        Logger().log('Resumed from the checkpoint of {:s}: {:d} pastes processed so far, {:d} pending pastes go first.'.format(
+            datetime.datetime.fromtimestamp(state['saved']).strftime('%Y/%m/%d %H:%M:%S'), self.totalpastes, len(self.pending)), True)
+
+    def take_backlog ( self, pastes ):
+## the pending pastes not listed by this archive page: throttled at the last refresh or interrupted by a
+## restart. They are processed before the page, each at most PENDING_RETRIES times; the page's new pastes
+## are pending from now on until processed
+        listed = set(paste.id for paste in pastes)
+        backlog = []
+        with self.lock:
+            for paste_id,attempts in list(self.pending.items()):
+                self.seen.discard(paste_id)	# maybe committed as seen before it was done
+                if paste_id in listed:
+                    continue
+                if attempts >= self.PENDING_RETRIES:
+                    del self.pending[paste_id]
+                    Logger().warn('Giving up paste {:s} after {:d} attempts.'.format(paste_id,attempts))
+                    continue
+                self.pending[paste_id] = attempts + 1
+                backlog.append(ArchiveEntry(paste_id, None, None, None, None))
+            for paste in pastes:
+                if paste.id not in self.seen:
+                    self.pending.setdefault(paste.id, 0)
+        return backlog
+
+    def processed ( self, paste_id, outcome=None ):
+## the paste is done with, its results if any are queued to the writer; outcome is what the scheduler
+## learns from: 'matched', 'clean' or 'gone'
+        with self.lock:
+            self.pending.pop(paste_id, None)
+        if outcome is not None:
+            self.scheduler.outcome(paste_id, outcome)
+
+    def defer ( self, paste_id ):
+## the refresh ran out of time: the paste stays pending and is scheduled again with the next page
+        self.seen.discard(paste_id)
+        self.scheduler.deferred(paste_id)
 
     def init_stat(self,stat):
         if stat not in self.stats:
@@ -276,9 +2577,11 @@ class Crawler:
             return 0,0
         if start >= 0:
             now = time.time()
-            self.stats[stat]['num'] += 1
-            self.stats[stat]['total'] += now - start
-            return now - start, (now - start - self.stats[stat]['avg']()) / self.stats[stat]['avg']()
+            with self.lock:
+                self.stats[stat]['num'] += 1
+                self.stats[stat]['total'] += now - start
+                avg = self.stats[stat]['avg']()
+            return now - start, (now - start - avg) / avg if avg else 0
         else:	# return avg if start==0
             return self.stats[stat]['avg']()
 
@@ -298,24 +2601,141 @@ class Crawler:
     def handle(self, signum, frame):
         self.kill_now = True
 
+    def request_profile(self, signum, frame):
+## logging from a signal handler may interrupt the logger itself, so the main loop dumps the profile instead
+        self.profile_requested = True
+
     def conclude(self):
 ## stats from startup
         Logger(verbose=self.verbose).log ('Since started at {:s}, the program has run for {:s}.'.format(self.starttime_ts, self.runduration(self.starttime,time.time())), True)
         Logger(self.verbose,journal=True).log ('It processed {:d} pastes, including {:d} recorded and {:d} errors.'.format(self.totalpastes, self.validpastes, self.totalerrors), True)
-        Logger(self.verbose).log ('Averagely it took {:.2f}s to fetch pastes, and {:.2f}s to check a single paste.'.format(self.stats['get_pastes']['avg'](), self.stats['check_paste']['avg']()), True)
+        if self.workers > 1:
+            Logger(self.verbose).log ('Averagely it took {:.2f}s to fetch pastes, {:.2f}s to fetch and {:.2f}s to scan a single paste.'.format(self.stats['get_pastes']['avg'](), self.stats['fetch_paste']['avg'](), self.stats['scan_paste']['avg']()), True)
+        else:
+            Logger(self.verbose).log ('Averagely it took {:.2f}s to fetch pastes, and {:.2f}s to check a single paste.'.format(self.stats['get_pastes']['avg'](), self.stats['check_paste']['avg']()), True)
+        Logger(self.verbose).log (self.http.summary() + '.', True)
+        if self.scan_pool is not None:
+            Logger(self.verbose).log ('Scan pool: ' + self.scan_pool.summary() + '.', True)
+        if self.profile_requested or time.time() - self.last_profile_dump > self.profile_interval:
+            self.dump_profile()
+        if self.fetch_summary():
+            Logger(self.verbose).log ('Fetched pastes by ' + self.fetch_summary() + '.', True)
+        if self.archive_counters['dom']:
+            Logger(self.verbose).log ('{:d} archive pages parsed directly, {:d} needed the DOM parser.'.format(self.archive_counters['fast'],self.archive_counters['dom']), True)
+        if self.rate is not None:
+            Logger(self.verbose).log ('Rate controller: ' + self.rate.summary() + '.', True)
+        Logger(self.verbose).log ('Result writer: ' + self.writer.summary() + '.', True)
+        if self.store is not None:
+            Logger(self.verbose).log ('Paste store: ' + self.store.summary() + '.', True)
+        if self.prefilter.enabled:
+            Logger(self.verbose).log ('Prefilter: ' + self.prefilter.summary() + '.', True)
+        Logger(self.verbose).log ('Scheduler: ' + self.scheduler.summary() + '.', True)
+        if self.queue is not None:
+            try:
+                Logger(self.verbose).log ('Work queue: ' + self.queue.summary() + '.', True)
+            except KeyboardInterrupt:
+                raise
+            except Exception as inst:
+                Logger(self.verbose).warn ('Work queue unreachable: {:s}.'.format(str(inst)))
 
     def __del__(self):
-        self.conclude()
+        if self.conclude_on_delete:
+            self.conclude()
 
     def get_pastes ( self ):
+        start = time.time()
+        status,pastes = self.poll_archive()
+        self.metrics.inc('archive_polls_total', status=self.STATUS_NAMES[status])
+        self.metrics.observe('archive_poll_seconds', time.time() - start)
+        if status == self.ACCESS_DENIED:
+            self.metrics.inc('bans_total', where='archive')
+        return status,pastes
+
+    def poll_archive ( self ):
         Logger (self.verbose,journal=True).log ( 'Getting pastes', True )
         try:
-            page = PyQuery ( url = self.PASTES_URL )
+            response = self.http.get ( self.PASTES_URL, validators=self.archive_validators )
+            if response.status == 304:
+                return self.NOT_MODIFIED,None
         except KeyboardInterrupt:
             raise
-        except:
+        except Exception as inst:
+            if getattr(inst, 'code', None) in (403, 429):	# throttled, handled like the ban page
+                return self.ACCESS_DENIED,None
             return self.CONNECTION_FAIL,None
+        if self.archive_snapshots:
+            os.makedirs(self.archive_snapshots, exist_ok=True)
+            with open(os.path.join(self.archive_snapshots, 'archive_' + time.strftime('%Y%m%d%H%M%S') + '.html'), 'wb') as snapshot:
+                snapshot.write(response.body)
+
+        if self.is_ban_page(response.body):
+            return self.ACCESS_DENIED,None
+        pastes = self.parse_archive(response.body, response.charset(None))
+        if pastes:
+            self.archive_counters['fast'] += 1
+        else:	# not the layout parse_archive knows, let the DOM parser try
+            status,pastes = self.dom_archive(response)
+            if status != self.OK:
+                return status,None
+            self.archive_counters['dom'] += 1
+        self.archive_validators = response.validators()
+        return self.OK,pastes
+
+    @classmethod
+    def archive_encoding(cls, body, charset=None):
+## the charset of the Content-Type header, else of the <meta> tag, else utf-8
+        if charset is None:
+            m = cls.ARCHIVE_CHARSET.search(body, 0, 2048)
+            charset = m.group(1).decode('ascii') if m else 'utf-8'
+        try:
+            return codecs.lookup(charset).name
+        except LookupError:
+            return 'utf-8'
 
+    @classmethod
+    def archive_age(cls, text):
+## seconds from '12 sec ago', '3 mins ago'... None if text is not an age
+        m = re.search(r'(\d+)\s*(sec|min|hour|day|week|month|year)', text or '', re.IGNORECASE)
+        return int(m.group(1)) * cls.AGE_UNITS[m.group(2).lower()] if m else None
+
+    @classmethod
+    def is_ban_page(cls, body):
+## the ban page is told by its title; its other phrases only count on a page without the archive table, so
+## that a paste titled like them is not taken for a ban
+        if cls.BAN_TITLE.search(body[:4096]):
+            return True
+        return any(marker in body for marker in cls.BAN_MARKERS) and not cls.ARCHIVE_TABLE.search(body)
+
+    @classmethod
+    def parse_archive(cls, body, charset=None):
+## fast path: the rows of the archive table straight from the raw bytes, decoding only the titles and syntaxes
+        table = cls.ARCHIVE_TABLE.search(body)
+        if table is None:
+            return []
+        encoding = cls.archive_encoding(body, charset)
+        pastes = []
+        for row in cls.ARCHIVE_ROW.finditer(body, table.start(1), table.end(1)):
+            link = cls.ARCHIVE_LINK.search(row.group(1))
+            if link is None:	# header row
+                continue
+            age = cls.ARCHIVE_AGE.search(row.group(1))
+            syntax = cls.ARCHIVE_SYNTAX.search(row.group(1))
+            size = cls.ARCHIVE_SIZE.search(row.group(1))
+            pastes.append(ArchiveEntry(id=link.group(1).decode('ascii', 'replace'),
+                                       title=html.unescape(link.group(2).decode(encoding, 'replace')).strip(),
+                                       syntax=html.unescape(syntax.group(2).decode(encoding, 'replace')).strip() if syntax else None,
+                                       age=int(age.group(1)) * cls.AGE_UNITS[age.group(2).decode('ascii').lower()] if age else None,
+                                       size=int(float(size.group(1)) * cls.SIZE_UNITS[size.group(2).decode('ascii').upper()]) if size else None))
+        return pastes
+
+    def dom_archive ( self, response ):
+## fallback for layouts parse_archive does not know: the whole page as a PyQuery document
+        try:
+            page = PyQuery ( response.body )
+        except KeyboardInterrupt:
+            raise
+        except:
+            return self.OTHER_ERROR,None
 
         """
         There are a set of encoding issues which, coupled with some bugs in etree (such as in the Raspbian packages) can
@@ -331,9 +2751,7 @@ class Crawler:
             worked = False
             # try utf8 first
             try:
-                f = urllib.request.urlopen(Crawler.PASTES_URL)
-                page_html = PyQuery(str(f.read()).encode('utf8')).html()
-                f.close()
+                page_html = PyQuery(str(response.body).encode('utf8')).html()
                 worked = True
             except KeyboardInterrupt:
                 raise
@@ -351,52 +2769,528 @@ class Crawler:
                     except:
                         return self.OTHER_ERROR, None
 
-        if re.match ( r'Pastebin\.com - Access Denied Warning', page_html, re.IGNORECASE ) or 'blocked your IP' in page_html or 'unatural browsing behavior' in page_html:
+        if self.is_ban_page(response.body):
             return self.ACCESS_DENIED,None
-        else:
-            return self.OK,page('.maintable img').next('a')
+        pastes = []
+        for link in page('.maintable img').next('a').items():
+            row = link.closest('tr')
+            syntax = row.find('a[href^="/archive/"]')
+            pastes.append(ArchiveEntry(id=link.attr('href'), title=link.text(), syntax=syntax.text() if syntax else None,
+                                       age=self.archive_age(row.find('td').eq(1).text()), size=None))
+        return self.OK,pastes
 
     def check_paste ( self, paste_id ):
-        self.totalpastes += 1
-        paste_url = self.PASTEBIN_URL + (paste_id if paste_id[0] == '/' else '/' + paste_id)
-        try:
-            #paste_txt = PyQuery ( url = paste_url )('#paste_code').text()
-            content = urllib.request.urlopen(paste_url).read().strip()
-            paste_txt = PyQuery (content)('#paste_code').text()
+        paste_txt = self.fetch_paste ( paste_id )
+        if paste_txt is None:
+            return False
+        return self.scan_paste ( paste_id, paste_txt )
 
-            if len(paste_txt) > 1024*256:
-                self.save_result( paste_id=paste_id,paste_txt=paste_txt,file='data/bigfiles.txt',directory='data/res' )
-                return True
-            for regex,file,directory in self.regexes:
-                Logger ().log ( 'Start to match {:s} using {:s}:{:s}:{:s} ...'.format(paste_id,directory,file,regex[:25]) )
-                if self.kill_now == True:
-                    exit()
-                r = re.search ( regex, paste_txt, re.IGNORECASE )
-                if r:
-                    Logger ().match( 'Found a matching paste: ' + paste_url.rsplit('/')[-1] + ' (' + file + '): '+ r[0][:50] )
-                    #self.save_result ( paste_url,paste_id,'data/'+file,'data/'+directory )
-                    self.save_result( paste_id=paste_id,paste_txt=paste_txt,file='data/'+file,directory='data/'+directory )
-                    return True
-            #Logger (self.verbose).log ( 'Not matching paste: ' + paste_url )
+    def fetch_paste ( self, paste_id ):
+        with self.lock:
+            self.totalpastes += 1
+        start = time.time()
+        try:
+            if self.fetch_mode == 'raw':
+                try:
+                    paste_txt = self.fetch_raw ( paste_id )
+                    self.rate.success(time.time() - start)
+                    self.metrics.observe('fetch_seconds', time.time() - start, mode='raw')
+                    return paste_txt
+                except KeyboardInterrupt:
+                    raise
+                except Exception as inst:
+                    if str(inst) == 'HTTP Error 404: Not Found' or getattr(inst, 'code', None) in (403, 429):	# the paste is gone or we are throttled, html would fail too
+                        raise
+                    with self.lock:
+                        self.fetch_counters['fallbacks'] += 1
+                    Logger ().warn ( 'Raw endpoint failed for paste {:s} ({:s}), extracting it from html instead.'.format(paste_id,str(inst)))
+            paste_txt = self.fetch_html ( paste_id )
+            self.rate.success(time.time() - start)
+            self.metrics.observe('fetch_seconds', time.time() - start, mode='html')
+            return paste_txt
         except KeyboardInterrupt:
             raise
         except Exception as inst:
-            self.totalerrors += 1
+            with self.lock:
+                self.totalerrors += 1
+            outcome = None
             if str(inst) == 'HTTP Error 404: Not Found':
+                self.rate.success(time.time() - start)	# answered, the paste is just gone
+                outcome = 'gone'
+                self.commit_claim ( paste_id, 0 )
                 Logger ().warn ( '404 Error reading paste {:s}.'.format(paste_id))	# likely being removed
+            elif getattr(inst, 'code', None) in (403, 429):
+                self.rate.throttled(inst.code)
+                self.metrics.inc('bans_total', where='paste')
+                self.retry ( paste_id )
+                Logger ().warn ( 'Throttled reading paste {:s} ({:s}), slowing down to {:.2f} pastes/s.'.format(paste_id,str(inst),self.rate.rate()))
+                return None	# still pending
             else:
+                self.rate.error()
                 Logger ().warn ( 'Error reading paste {:s} (probably encoding issue or regex issue), error is {:s}.'.format(paste_id,str(inst)))
+            self.processed ( paste_id, outcome )
+        return None
+
+    def retry ( self, paste_id ):
+## a throttled paste is retried if the next archive page still lists it, or given back to the other workers
+        self.seen.discard(paste_id)
+        if self.queue is None:
+            return
+        with self.lock:
+            token = self.claims.pop(paste_id, None)
+        try:
+            if token is not None:
+                self.queue.release(paste_id, token)
+        except KeyboardInterrupt:
+            raise
+        except Exception as inst:	# its lease expires anyway
+            Logger ().warn ( 'Could not give paste {:s} back to the work queue: {:s}.'.format(paste_id,str(inst)))
+
+    def renew_claim ( self, paste_id ):
+## worker mode: the claim of a matching paste is extended before its results are queued, so that it does
+## not expire before the writer completes it. False if it expired and another worker took the paste over:
+## the results are that worker's to write. A worker dying between its writes and the completion leaves
+## the paste to another one, which writes the results again in its own data directory.
+        if self.queue is None:
+            return True
+        with self.lock:
+            token = self.claims.get(paste_id)
+        if token is None:
+            return True
+        try:
+            if self.queue.renew(paste_id, token, self.queue_lease):
+                return True
+        except KeyboardInterrupt:
+            raise
+        except Exception as inst:	# the results are saved, another worker may save them too
+            Logger ().warn ( 'Could not renew the claim of paste {:s}, saving its results anyway: {:s}.'.format(paste_id,str(inst)))
+            return True
+        with self.lock:
+            self.claims.pop(paste_id, None)
+        Logger ().warn ( 'Lost the claim of paste {:s}, the worker that took it over saves its results.'.format(paste_id))
+        return False
+
+    def commit_claim ( self, paste_id, matched ):
+## worker mode: a paste fetched and matched is marked done in the work queue once its results are written,
+## the writer completes the claim of a matching paste after committing the batch of its results
+        if self.queue is None:
+            return
+        with self.lock:
+            token = self.claims.pop(paste_id, None)
+        if token is None:
+            return
+        if matched:
+            self.writer.after(self.complete_claim, paste_id, token, matched)
+        else:
+            self.complete_claim ( paste_id, token, matched )
+
+    def complete_claim ( self, paste_id, token, matched ):
+        try:
+            if not self.queue.complete(paste_id, token, matched):
+                Logger ().warn ( 'Lost the claim of paste {:s} while its results were written, another worker may save them too.'.format(paste_id))
+        except KeyboardInterrupt:
+            raise
+        except Exception as inst:	# its lease expires, another worker does it again
+            Logger ().warn ( 'Could not complete paste {:s} in the work queue: {:s}.'.format(paste_id,str(inst)))
+
+    def raw_url ( self, paste_id ):
+        return self.PASTESRAW_URL + paste_id.strip('/')
+
+    def count_fetch ( self, mode, wire_bytes, decoded, cpu ):
+        with self.lock:
+            counter = self.fetch_counters[mode]
+            counter['pastes'] += 1
+            counter['bytes'] += wire_bytes
+            counter['decoded'] += decoded
+            counter['cpu'] += cpu
+
+    def fetch_raw ( self, paste_id ):
+## stream the raw paste and decode it incrementally, no html is built or parsed
+        cpu = time.thread_time()
+        stream = self.http.open(self.raw_url(paste_id))
+        if stream.headers.get_content_type() == 'text/html':	# error or captcha page instead of the paste
+            stream.close()
+            raise ValueError('raw endpoint returned html')
+        chunks = self.decode_chunks(stream, codecs.getincrementaldecoder(stream.charset())('replace'), cpu)
+        parts = []
+        size = 0
+        for text in chunks:
+            parts.append(text)
+            size += len(text)
+            if size > self.stream_window:	# too big to hold, hand the rest over as a stream
+                return itertools.chain(parts, chunks)
+        return ''.join(parts).strip()
+
+    def decode_chunks ( self, stream, decoder, cpu ):
+        spent = 0.0
+        decoded = 0
+        for chunk in itertools.chain(stream.chunks(), [None]):
+            text = decoder.decode(b'', final=True) if chunk is None else decoder.decode(chunk)
+            decoded += len(text)
+            spent += time.thread_time() - cpu
+            if text:
+                yield text
+            cpu = time.thread_time()
+        self.count_fetch('raw', stream.wire_bytes, decoded, spent)
+
+    def fetch_html ( self, paste_id ):
+        cpu = time.thread_time()
+        paste_url = self.PASTEBIN_URL + (paste_id if paste_id[0] == '/' else '/' + paste_id)
+        #paste_txt = PyQuery ( url = paste_url )('#paste_code').text()
+        response = self.http.get(paste_url)
+        paste_txt = PyQuery (response.body.strip())('#paste_code').text()
+        self.count_fetch('html', response.wire_bytes, len(paste_txt), time.thread_time() - cpu)
+        return paste_txt
+
+    def fetch_summary ( self ):
+        with self.lock:
+            counters = {mode:dict(self.fetch_counters[mode]) for mode in self.FETCH_MODES}
+            fallbacks = self.fetch_counters['fallbacks']
+        summary = []
+        for mode in self.FETCH_MODES:
+            n = counters[mode]['pastes']
+            if n:
+                summary.append('{:s}: {:d} pastes, {:.1f} KB transferred and {:.1f} ms cpu per paste'.format(mode, n, counters[mode]['bytes']/n/1024, counters[mode]['cpu']/n*1000))
+        return '; '.join(summary) + ('; {:d} fallbacks from raw to html'.format(fallbacks) if fallbacks else '')
+
+    def scan_paste ( self, paste_id, paste_txt ):
+        paste_url = self.PASTEBIN_URL + (paste_id if paste_id[0] == '/' else '/' + paste_id)
+        if not isinstance(paste_txt, str) or len(paste_txt) > self.stream_window:
+            return self.scan_stream ( paste_id, [paste_txt] if isinstance(paste_txt, str) else paste_txt )
+        ruleset = self.ruleset	# the same rules for the whole paste, even if they are reloaded meanwhile
+        try:
+            Logger ().log ( 'Start to match {:s} against {:d} rules ...'.format(paste_id,len(ruleset.rules)) )
+            if self.kill_now == True:
+                exit()
+            verdict,texts,matches = self.prefilter.prepare(paste_txt, ruleset.version)
+            if matches is not None:	# junk, or the same content as a paste matched lately
+                Logger ().log ( 'Paste {:s} is {:s}, not matched again.'.format(paste_id,verdict) )
+                self.handle_matches ( paste_id, paste_txt, matches )
+                return bool(matches)
+            if self.scan_pool is not None:	# matched by another process, results come back through scan_done
+                self.scan_pool.submit(paste_id, paste_txt, ruleset, texts)
+                return None
+            timings = []
+            start = time.time()
+            found,decoded = ruleset.search_texts(texts, timings=timings)
+            matches = [(ruleset.rules[i], found[i]) for i in sorted(found)]
+            self.metrics.observe('scan_seconds', time.time() - start)
+            self.prefilter.scanned(paste_txt, ruleset.version, matches, time.time() - start, len(decoded))
+            self.record_timings ( paste_id, ruleset.rules, timings )
+            self.handle_matches ( paste_id, paste_txt, matches )
+            if matches:
+                return True
+            #Logger (self.verbose).log ( 'Not matching paste: ' + paste_url )
+        except KeyboardInterrupt:
+            raise
+        except Exception as inst:
+            with self.lock:
+                self.totalerrors += 1
+            Logger ().warn ( 'Error checking paste {:s} (probably encoding issue or regex issue), error is {:s}.'.format(paste_id,str(inst)))
+            self.processed ( paste_id )
         return False
 
-    def save_result ( self, paste_id, paste_txt, file, directory ):
+    def handle_matches ( self, paste_id, paste_txt, matches ):
+        paste_url = self.PASTEBIN_URL + (paste_id if paste_id[0] == '/' else '/' + paste_id)
+        if matches and not self.renew_claim ( paste_id ):
+            self.processed ( paste_id, 'matched' )
+            return
+        for (regex,file,directory),found in matches:
+            Logger ().match( 'Found a matching paste: ' + paste_url.rsplit('/')[-1] + ' (' + file + '): '+ found[:50] )
+            self.metrics.inc('matches_total', category=directory)
+            #self.save_result ( paste_url,paste_id,'data/'+file,'data/'+directory )
+            self.save_result( paste_id=paste_id,paste_txt=paste_txt,file=os.path.join(self.data_dir,file),directory=os.path.join(self.data_dir,directory) )
+        self.commit_claim ( paste_id, len(matches) )
+        self.processed ( paste_id, 'matched' if matches else 'clean' )
+
+    def scan_done ( self, paste_id, paste_txt, rules, result, error ):
+## called from the ScanPool result thread for each paste submitted by scan_paste
+        try:
+            if error is not None:
+                raise error
+            found,elapsed,timings,decoded = result
+            self.metrics.observe('scan_seconds', elapsed)
+            self.record_timings ( paste_id, rules, timings )
+            matches = [(rules[i], found[i]) for i in sorted(found)]
+            ruleset = self.ruleset
+            self.prefilter.scanned(paste_txt, ruleset.version if ruleset.rules is rules else None, matches, elapsed, len(decoded))	# None: reloaded meanwhile, never reused
+            tooktime,times = self.check_stat(time.time() - elapsed,'scan_paste')
+            if times >= 20:
+                Logger(self.verbose).error('{:s} might be a giant paste that took {:.2f}s to scan, it is {:.2f} times of average'.format(paste_id,tooktime,times))
+            self.handle_matches ( paste_id, paste_txt, matches )
+        except KeyboardInterrupt:
+            raise
+        except Exception as inst:
+            with self.lock:
+                self.totalerrors += 1
+            Logger ().warn ( 'Error checking paste {:s} (probably encoding issue or regex issue), error is {:s}.'.format(paste_id,str(inst)))
+            self.processed ( paste_id )
+
+    def record_timings ( self, paste_id, rules, timings ):
+        for i,elapsed,matched,timed_out in timings:
+            timeouts = self.profiler.record(rules[i], paste_id, elapsed, matched, timed_out)
+            if not timed_out:
+                continue
+            Logger ().error ( 'Rule {:s} ({:s}) overran its budget of {:.2f}s on paste {:s} and was aborted, probably catastrophic backtracking.'.format(rules[i][0][:40],rules[i][1],self.rule_budget,paste_id) )
+            ruleset = self.ruleset
+            if timeouts >= self.profiler.max_timeouts and rules is ruleset.rules and i not in ruleset.disabled:
+                ruleset.disabled.add(i)
+                Logger ().error ( 'Rule {:s} ({:s}) is quarantined after {:d} timeouts, fix it in {:s} to enable it again.'.format(rules[i][0][:40],rules[i][1],timeouts,self.REGEXES_FILE) )
+
+    def dump_profile ( self ):
+        self.profile_requested = False
+        self.last_profile_dump = time.time()
+        lines = self.profiler.report()
+        if lines:
+            Logger(self.verbose).log ('Per-rule profile ({:s}):'.format('every paste' if self.profile_rules else '{:g}% of the pastes and the budget overruns'.format(self.profile_sample*100)), True)
+            for line in lines:
+                Logger(self.verbose).log ('  ' + line, True, log_time=False)
+
+    def wait_scans ( self ):
+        while self.scan_pool is not None and not self.scan_pool.wait(timeout=1):
+            if self.kill_now == True:
+                exit()
+
+    def scan_stream ( self, paste_id, chunks ):
+## pastes bigger than one window are matched window by window while they are spooled to a temporary file,
+## so memory use stays flat whatever their size
+        paste_url = self.PASTEBIN_URL + (paste_id if paste_id[0] == '/' else '/' + paste_id)
+        ruleset = self.ruleset
+        try:
+            spool = tempfile.SpooledTemporaryFile(max_size=self.stream_window*4, mode='w+', encoding='utf-8')
+            try:	# the writer reads the spool of a matching paste later, it closes it when done
+                def spooled():
+                    for text in chunks:
+                        spool.write(text)
+                        yield text
+                stream = spooled()
+                Logger ().log ( 'Start to match big paste {:s} against {:d} rules by windows of {:d} KB ...'.format(paste_id,len(ruleset.rules),self.stream_window//1024) )
+                timings = []
+                start = time.time()
+                matches = ruleset.scan_stream(stream, window=self.stream_window, overlap=self.stream_overlap, stop=self.stop_categories, timings=timings)
+                self.metrics.observe('scan_seconds', time.time() - start)
+                self.record_timings ( paste_id, ruleset.rules, timings )
+                for text in stream:	# stopped early, still read the whole paste in case it has to be saved
+                    pass
+                Logger ().log ( 'Big paste {:s} of {:d} KB matched {:d} rules.'.format(paste_id,spool.tell()//1024,len(matches)), True )
+                if matches and not self.renew_claim ( paste_id ):
+                    matches = []
+                for (regex,file,directory),found in matches:
+                    Logger ().match( 'Found a matching paste: ' + paste_url.rsplit('/')[-1] + ' (' + file + '): '+ found[:50] )
+                    self.metrics.inc('matches_total', category=directory)
+                    self.save_result( paste_id=paste_id,paste_txt=None,file=os.path.join(self.data_dir,file),directory=os.path.join(self.data_dir,directory),paste_file=spool )
+                self.commit_claim ( paste_id, len(matches) )
+                self.processed ( paste_id, 'matched' if matches else 'clean' )
+                return bool(matches)
+            finally:
+                self.writer.release(spool)
+        except KeyboardInterrupt:
+            raise
+        except Exception as inst:
+            with self.lock:
+                self.totalerrors += 1
+            Logger ().warn ( 'Error checking big paste {:s}, error is {:s}.'.format(paste_id,str(inst)))
+            self.processed ( paste_id )
+        return False
+
+## concurrent mode: a bounded pool of fetch workers paced by one global RateLimiter feeds a single
+## scanner thread through a bounded queue, so slow matches never hold up the network
+    def pace ( self, delay ):
+        if self.rate is None:
+            self.rate = RateController(delay, max_rate=self.max_rate)
+            if self.resumed_rate:
+                self.rate.restore(self.resumed_rate)
+        self.start_checkpoints()
+
+    def start_workers ( self, delay ):
+        self.pace(delay)
+        if self.workers <= 1 or hasattr(self, 'fetch_pool'):
+            return
+        self.limiter = RateLimiter(lambda: self.rate.interval()*random.uniform(0.7,1.2))
+        self.fetch_pool = concurrent.futures.ThreadPoolExecutor(max_workers=self.workers)
+        self.fetch_futures = []
+        self.scan_queue = queue.Queue(maxsize=self.scan_queue_size)
+        self.scanner = threading.Thread(target=self.scan_worker, name='scanner', daemon=True)
+        self.scanner.start()
+
+    def dispatch_paste ( self, paste_id ):
+        self.fetch_futures.append(self.fetch_pool.submit(self.fetch_worker, paste_id))
+
+    def fetch_worker ( self, paste_id ):
+        if self.kill_now == True:
+            return
+        delaytime = self.limiter.wait()
+        if self.kill_now == True:
+            return
+        if self.deadline is not None and time.time() > self.deadline:
+            self.defer ( paste_id )
+            return
+        start = time.time()
+        paste_txt = self.fetch_paste ( paste_id )
+        tooktime,times = self.check_stat(start,'fetch_paste')
+        if times > 10:
+            Logger(self.verbose).warn('{:s} took {:.2f}s to fetch, which is {:.2f} times of average'.format(paste_id,tooktime,times))
+        Logger(self.verbose).log('Paste {:s} fetched in {:.2f}s after waiting {:.2f}s for the rate limiter ...'.format(paste_id,tooktime,delaytime))
+        if paste_txt is not None and not isinstance(paste_txt, str):	# big paste still streaming, match it while reading
+            self.scan_paste ( paste_id, paste_txt )
+        elif paste_txt is not None:
+            self.scan_queue.put((paste_id, paste_txt))
+
+    def scan_worker ( self ):
+        while True:
+            paste_id, paste_txt = self.scan_queue.get()
+            try:
+                start = time.time()
+                self.scan_paste ( paste_id, paste_txt )
+                if self.scan_pool is not None:	# only submitted, scan_done accounts the time
+                    continue
+                tooktime,times = self.check_stat(start,'scan_paste')
+                if times >= 20:
+                    Logger(self.verbose).error('{:s} might be a giant paste that took {:.2f}s to scan, it is {:.2f} times of average'.format(paste_id,tooktime,times))
+                elif times > 10:
+                    Logger(self.verbose).warn('{:s} took {:.2f}s to scan, which is {:.2f} times of average'.format(paste_id,tooktime,times))
+            except SystemExit:	# scan_paste exits on kill_now, stop scanning but keep the queue accounting right
+                pass
+            finally:
+                self.scan_queue.task_done()
+
+    def drain_workers ( self ):
+## wait for the dispatched pastes of this refresh, returns the total time spent in the rate limiter
+        pending = self.fetch_futures
+        self.fetch_futures = []
+        while pending:
+            done,pending = concurrent.futures.wait(pending, timeout=1)
+            for future in done:
+                if future.exception() is not None:
+                    Logger().warn('Fetch worker failed: {:s}'.format(str(future.exception())))
+            if self.kill_now == True:
+                for future in pending:
+                    future.cancel()
+                exit()
+            if self.profile_requested:
+                self.dump_profile()
+        while self.scan_queue.unfinished_tasks:
+            if self.kill_now == True:
+                exit()
+            time.sleep(0.1)
+        self.wait_scans()
+        totaldelayed, self.limiter.total_delayed = self.limiter.total_delayed, 0
+        return totaldelayed
+
+## coordinator/worker mode: one coordinator polls the archive and publishes the new paste ids to the work
+## queue, workers on as many hosts claim and process them, each paced by its own rate controller
+    def publish ( self, pastes ):
+## the pastes are only marked as seen once published, so that a failure retries them at the next refresh
+        new = [paste.id for paste in pastes if paste.id not in self.seen]
+        try:
+            published = self.queue.publish(new)
+        except KeyboardInterrupt:
+            raise
+        except Exception as inst:
+            self.totalerrors += 1
+            Logger().error('Could not publish {:d} pastes to the work queue ({:s}), retrying at the next refresh.'.format(len(new),str(inst)))
+            return
+        for paste_id in new:
+            self.seen.add ( paste_id )
+        Logger(self.verbose).log('Published {:d} new pastes to the work queue: {:s}.'.format(published,self.queue.summary()), True)
+
+    def work ( self, refresh_time, delay, connection_timeout, verbose ):
+## worker mode: process the pastes claimed from the work queue instead of polling the archive
+        self.verbose = verbose
+        self.pace(delay)
+        last_conclude = time.time()
+        try:
+            while True:
+                if self.kill_now == True:
+                    exit()
+                if self.profile_requested:
+                    self.dump_profile()
+                try:
+                    claims = self.queue.claim(self.worker_id, self.queue_batch, self.queue_lease)
+                except KeyboardInterrupt:
+                    raise
+                except Exception as inst:
+                    self.totalerrors += 1
+                    Logger().error('Work queue unreachable ({:s}). Waiting {:.0f} seconds and trying again'.format(str(inst),connection_timeout))
+                    time.sleep(connection_timeout)
+                    continue
+                if not claims:
+                    Logger(self.verbose).log('The work queue is empty. Waiting {:d} seconds ...'.format(min(refresh_time,10)))
+                    time.sleep(min(refresh_time,10))
+                    continue
+                self.work_batch ( claims, delay )
+                if time.time() - last_conclude > refresh_time:
+                    self.conclude()
+                    last_conclude = time.time()
+        finally:	# stopped, the other workers may take the pastes not done yet at once
+            with self.lock:
+                claims,self.claims = self.claims,{}
+            for paste_id,token in claims.items():
+                try:
+                    self.queue.release(paste_id, token)
+                except KeyboardInterrupt:
+                    raise
+                except:
+                    pass
+
+    def work_batch ( self, claims, delay ):
+## fetch and match a batch of claimed pastes. A paste matched is completed, the writer completes it after its
+## results; the others, e.g. on a timeout or a 5xx, are given back to be retried by any worker
+        with self.lock:
+            self.claims.update(claims)
+        self.read_regexes()
+        self.start_workers(delay)
+        Logger(self.verbose).log('Claimed {:d} pastes, will process them at {:.2f} pastes/s ...'.format(len(claims),self.rate.rate()))
+        for n,(paste_id,token) in enumerate(claims):
+            if self.workers > 1:
+                self.dispatch_paste ( paste_id )
+                continue
+            start = time.time()
+            self.check_paste ( paste_id )
+            tooktime,times = self.check_stat(start,'check_paste')
+            if n + 1 < len(claims):
+                time.sleep(max(0, self.rate.interval()*random.uniform(0.7,1.2) - tooktime))
+            if self.kill_now == True:
+                exit()
+            if self.profile_requested:
+                self.dump_profile()
+        if self.workers > 1:
+            self.drain_workers()
+        else:
+            self.wait_scans()
+        with self.lock:
+            failed = [(paste_id, self.claims.pop(paste_id)) for paste_id,token in claims if paste_id in self.claims]
+        for paste_id,token in failed:
+            try:
+                self.queue.release(paste_id, token)
+            except KeyboardInterrupt:
+                raise
+            except Exception as inst:	# its lease expires anyway
+                Logger ().warn ( 'Could not give paste {:s} back to the work queue: {:s}.'.format(paste_id,str(inst)))
+
+    def save_result ( self, paste_id, paste_txt, file, directory, paste_file=None ):
         paste_url = self.PASTESRAW_URL + (paste_id if paste_id[0] == '/' else '/' + paste_id)
-        fn,ext = os.path.splitext(os.path.split(file)[1])
         timestamp = get_timestamp()
 
+        if paste_file is not None:	# big paste spooled by scan_stream, copied as is by the writer
+            if self.writer.result ( paste_id, paste_url, file, directory, paste_file, timestamp ):
+                with self.lock:	# called from the scanner thread and the scan pool's result thread too
+                    self.validpastes += 1
+            return
+
         if paste_txt == '':
-            content = urllib.request.urlopen(paste_url).read().strip()
+            content = self.http.get(paste_url).body.strip()
             paste_txt = PyQuery(content)('#paste_code').text()
             #paste_txt = PyQuery(url=paste_url)('#paste_code').text()
+        paste_txt = self.result_text ( file, paste_txt )
+        if paste_txt != '' and self.writer.result ( paste_id, paste_url, file, directory, paste_txt, timestamp ):
+            with self.lock:
+                self.validpastes += 1
+
+    @staticmethod
+    def result_text ( file, paste_txt ):
+## what is saved of a paste matching a rule logging to file, '' for nothing
+        fn,ext = os.path.splitext(os.path.split(file)[1])
         if fn == 'base64' and len(paste_txt) > 20:
             codes = ''
             r = re.findall(r'[\w\d+/=]{30,}',paste_txt)
@@ -416,27 +3310,19 @@ class Crawler:
                 pass
         else:
             paste_txt = paste_txt + os.linesep
-
-        if paste_txt != '':
-            self.validpastes += 1
-            with open ( file, 'a' ) as matching:
-                matching.write ( fn + '-' + timestamp + '-' + paste_url + os.linesep )
-            try:
-                os.mkdir(directory)
-            except KeyboardInterrupt:
-                raise
-            except:
-                pass
-            with open( directory + '/' + fn + '_' + timestamp.replace('/','_').replace(':','_').replace(' ','__') + '_' + paste_id.replace('/','') + '.txt', mode='w' ) as paste:
-                paste.write(paste_txt)
+        return paste_txt
 
 
     def start ( self, refresh_time, delay, ban_wait, flush_after_x_refreshes, connection_timeout, verbose ):
         count = 0
+        banned = 0	# consecutive ban pages
         self.verbose = verbose
+        self.pace(delay)
         while True:
             if self.kill_now == True:
                 exit()
+            if self.profile_requested:
+                self.dump_profile()
 
             start = time.time()
             status,pastes = self.get_pastes ()
@@ -446,19 +3332,41 @@ class Crawler:
 
             start_time = time.time()
             if status == self.OK:
-                delayed = 0
+                banned = 0
                 currpaste = 0
                 totaldelayed = 0
                 chkedpaste = 0
+                deferred_before = self.scheduler.counters['deferred']	# pastes left to a next refresh before this one
                 numofpastes = len(pastes) or 0
-                Logger(self.verbose).log('Retreived {:d} pastes, will process using delay factor of {:.2f} ...'.format(numofpastes,self.delayfactor),True)
+                self.rate.archive(numofpastes, sum(1 for paste in pastes if paste.id not in self.seen), self.repoll)
+                self.repoll = False
+                Logger(self.verbose).log('Retreived {:d} pastes, will process them at {:.2f} pastes/s ...'.format(numofpastes,self.rate.rate()),True)
+                if self.queue is not None:	# coordinator, the workers process them
+                    self.publish ( pastes )
+                    pastes = []
+                else:
+                    backlog = self.take_backlog ( pastes )
+                    if backlog:
+                        Logger(self.verbose).log('{:d} pastes still pending from the last refresh or run are scheduled too.'.format(len(backlog)),True)
+                        pastes = backlog + pastes
+                        numofpastes = len(pastes)
+                    pastes = self.scheduler.order ( [paste for paste in pastes if paste.id not in self.seen] ) + [paste for paste in pastes if paste.id in self.seen]
+                    if self.scheduler.policy != 'page':	# what is left at the next poll waits for it, ranked with the new pastes
+                        self.deadline = start_time + self.rate.deadline(refresh_time)
                 self.read_regexes()
+                self.start_workers(delay)
                 for paste in pastes:
                     currpaste += 1
-                    paste_id = PyQuery ( paste ).attr('href')
-                    self.new_checked_ids.append ( paste_id )
-                    if paste_id not in self.prev_checked_ids:
+                    paste_id = paste.id
+                    if paste_id not in self.seen and self.workers <= 1 and self.deadline is not None and time.time() > self.deadline:
+                        self.defer ( paste_id )
+                    elif paste_id not in self.seen and self.workers > 1:
                         chkedpaste += 1
+                        self.seen.add ( paste_id )
+                        self.dispatch_paste ( paste_id )
+                    elif paste_id not in self.seen:
+                        chkedpaste += 1
+                        self.seen.add ( paste_id )
                         start = time.time()
                         #Logger().log('Start processing paste {:s}'.format(paste_id))
                         self.check_paste ( paste_id )
@@ -467,48 +3375,73 @@ class Crawler:
                             Logger(self.verbose).error('{:s} might be a giant paste that took {:.2f}s to check, it is {:.2f} times of average'.format(paste_id,tooktime,times))
                         elif times > 10:
                             Logger(self.verbose).warn('{:s} took {:.2f}s to check, which is {:.2f} times of average'.format(paste_id,tooktime,times))
-                        delaytime = delay*random.uniform(0.6,1.1)*self.delayfactor
+                        delaytime = max(0, self.rate.interval()*random.uniform(0.7,1.2) - tooktime)	# pastes start interval apart, like with workers
                         totaldelayed += delaytime
                         Logger(self.verbose).log('Paste {:02d}/{:02d} done; Waiting {:.2f} seconds for next paste ...'.format(currpaste,numofpastes,delaytime))
                         if currpaste < numofpastes:
                             time.sleep(delaytime)
 
                     if currpaste == numofpastes:
+                        if self.workers > 1:
+                            totaldelayed = self.drain_workers()
+                        else:
+                            self.wait_scans()
                         Logger(self.verbose).log('Average/Total waiting time is {:.2f}s/{:.2f}m for the pastes'.format(totaldelayed/numofpastes,totaldelayed/60), True)
-                        if chkedpaste < numofpastes:
+                        deferred = self.scheduler.counters['deferred'] - deferred_before
+                        if deferred:
+                            Logger(self.verbose).warn('Out of time for this refresh, {:d} pastes of lower priority are left to the next one.'.format(deferred))
+                        elif chkedpaste < numofpastes:
                             Logger(self.verbose).log('Good job! You caught up all new pastes since last update! {:d} pastes are already checked'.format(numofpastes-chkedpaste), True)
-                            self.delayfactor = self.max_delayfactor if self.delayfactor >= self.max_delayfactor else (self.delayfactor + 0.04*fabs(numofpastes-chkedpaste))	# slow down a little bit
                         else:
-                            self.delayfactor = self.min_delayfactor if self.delayfactor <= self.min_delayfactor else (self.delayfactor - 0.24)	# speed up a little bit
-                    count += 1
+                            Logger(self.verbose).warn('No paste of this refresh was seen before, some were probably missed; refreshing sooner.')
                     if self.kill_now == True:	# caught kill signal
                         exit()
+                    if self.profile_requested:
+                        self.dump_profile()
 
-                if count == flush_after_x_refreshes:
-                    self.prev_checked_ids = self.new_checked_ids
+                self.seen.commit()
+                count += 1
+                if count >= flush_after_x_refreshes:
+                    Logger(self.verbose).log('{:d} expired paste ids are flushed, {:d} are kept.'.format(self.seen.prune(),len(self.seen)), True)
+                    if self.queue is not None:
+                        Logger(self.verbose).log('{:d} processed pastes are flushed from the work queue.'.format(self.queue.prune(self.seen.ttl)), True)
                     count = 0
-                else:
-                    self.prev_checked_ids += self.new_checked_ids
-                self.new_checked_ids = []
 
                 elapsed_time = time.time() - start_time
-                sleep_time = ceil(max(0,(refresh_time*random.gauss(1,0.2) - elapsed_time)))
+                sleep_time = ceil(max(0,(self.rate.refresh(refresh_time)*random.gauss(1,0.2) - elapsed_time)))
+                if self.scheduler.counters['deferred'] > deferred_before:	# pastes are waiting, poll again once the pace allows another request
+                    sleep_time = 0
+                    self.repoll = True
+                    if self.workers > 1:
+                        self.limiter.wait()
+                    else:	# the pause between two pastes of the loop above
+                        time.sleep(self.rate.interval()*random.uniform(0.7,1.2))
                 if sleep_time > 0:
                     Logger(self.verbose).log('Waiting {:d} seconds to refresh...'.format(sleep_time), True)
                     time.sleep ( sleep_time )
                 else:
                     Logger(self.verbose).log('refresh_time={:d}, elapsed_time={:.2f}, sleep_time={:.2f}'.format(refresh_time,elapsed_time,sleep_time), False)
+            elif status == self.NOT_MODIFIED:
+                sleep_time = ceil(max(0,self.rate.refresh(refresh_time)*random.gauss(1,0.2)))
+                Logger(self.verbose).log('Archive is not modified since last refresh. Waiting {:d} seconds to refresh...'.format(sleep_time), True)
+                time.sleep ( sleep_time )
             elif status == self.ACCESS_DENIED:
                 self.totalerrors += 1
-                delayed += 1
-                self.delayfactor = 1
-                Logger ().warn ( 'Damn! It looks like you have been banned (probably temporarily)' )
-                for n in range ( 0, ceil(ban_wait*random.gauss(1+delayed*0.2,0.2)) if _ <= 60 else 60 ):	# max wait 60m
-                    Logger (self.verbose).log ( 'Please wait ' + str ( ban_wait - n ) + ' more minute' + ( 's' if ( ban_wait - n ) > 1 else '' ) )
+                banned += 1
+                self.rate.banned()
+                wait = min(60, ceil(ban_wait*random.gauss(1+banned*0.2,0.2)))	# max wait 60m
+                Logger ().warn ( 'Damn! It looks like you have been banned (probably temporarily), slowing down to {:.2f} pastes/s'.format(self.rate.rate()) )
+                for n in range ( 0, wait ):
+                    Logger (self.verbose).log ( 'Please wait ' + str ( wait - n ) + ' more minute' + ( 's' if ( wait - n ) > 1 else '' ) )
                     time.sleep ( 60 )
+                    if self.kill_now == True:
+                        exit()
+                    if self.profile_requested:
+                        self.dump_profile()
             elif status == self.CONNECTION_FAIL:
                 self.totalerrors += 1
-                Logger().error ( 'Connection down. Waiting {:d} seconds and trying again'.format(connection_timeout) )
+                self.rate.error()
+                Logger().error ( 'Connection down. Waiting {:.0f} seconds and trying again'.format(connection_timeout) )
                 time.sleep(connection_timeout)
             elif status == self.OTHER_ERROR:
                 self.totalerrors += 1
@@ -520,20 +3453,94 @@ class Crawler:
 def parse_input():
     parser = OptionParser()
     parser.add_option('-r', '--refresh-time', help='Set the refresh time (default: 200)', dest='refresh_time', type='int', default=200)
-    parser.add_option('-d', '--delay-time', help='Set the delay time (default: 5)', dest='delay', type='float', default=5)
+    parser.add_option('-d', '--delay-time', help='Set the initial delay between pastes, adapted by the rate controller (default: 5)', dest='delay', type='float', default=5)
     parser.add_option('-b', '--ban-wait-time', help='Set the ban wait time (default: 30)', dest='ban_wait', type='int', default=30)
-    parser.add_option('-f', '--flush-after-x-refreshes', help='Set the number of refreshes after which memory is flushed (default: 100)', dest='flush_after_x_refreshes', type='int', default=100)
+    parser.add_option('-f', '--flush-after-x-refreshes', help='Set the number of refreshes after which expired paste ids are flushed (default: 100)', dest='flush_after_x_refreshes', type='int', default=100)
+    parser.add_option('--max-rate', help='Set the most pastes fetched per second, the rate controller adapts the pace below it (default: 2)', dest='max_rate', type='float', default=2)
     parser.add_option('-c', '--connection-timeout', help='Set the connection timeout waiting time (default: 60)', dest='connection_timeout', type='float', default=60)
     parser.add_option('-V', '--verbose', help='enable debug mode for verbose output',dest='verbose', action="store_true")
+    parser.add_option('--data-dir', help='Set the directory the matches and the crawl state are saved to; each worker needs its own, by default the first data/worker-N not used by another worker on this host (default: data)', dest='data_dir', default=None)
+    parser.add_option('--seen-db', help='Set the sqlite file remembering checked paste ids across restarts, empty to keep them in memory only (default: seen.db in the data directory)', dest='seen_db', default=None)
+    parser.add_option('--seen-ttl', help='Set the number of hours a checked paste id is remembered (default: 48)', dest='seen_ttl', type='float', default=48)
+    parser.add_option('--seen-max', help='Set the maximum number of checked paste ids kept in memory (default: 200000)', dest='seen_max', type='int', default=200000)
+    parser.add_option('--storage', help='Set how matching pastes are saved: files writes one file per match under data/<directory>, store appends them deduplicated and compressed to the paste store (default: files)', dest='storage', type='choice', choices=Crawler.STORAGES, default='files')
+    parser.add_option('--store-path', help='Set the directory of the paste store (default: store in the data directory)', dest='store_path', default=None)
+    parser.add_option('--store-codec', help='Set the compression of new paste store segments: zstd or gzip (default: zstd if installed, else gzip)', dest='store_codec', type='choice', choices=('zstd','gzip'), default=None)
+    parser.add_option('--writer-queue', help='Set the number of writes that may wait for the result writer before the crawler blocks (default: 1000)', dest='writer_queue', type='int', default=1000)
+    parser.add_option('--writer-batch', help='Set the maximum number of writes committed together (default: 64)', dest='writer_batch', type='int', default=64)
+    parser.add_option('--writer-fsync', help='Set when written results are synced to disk: none leaves it to the OS, batch fsyncs once per batch (default: none)', dest='writer_fsync', type='choice', choices=ResultWriter.FSYNC, default='none')
+    parser.add_option('--archive-snapshots', help='Keep every archive page fetched in this directory, e.g. for the archive benchmark (default: none)', dest='archive_snapshots', default=None)
+    parser.add_option('--metrics-port', help='Serve Prometheus metrics on this port, 0 to disable (default: 0)', dest='metrics_port', type='int', default=0)
+    parser.add_option('--metrics-host', help='Set the address the metrics endpoint listens on (default: 127.0.0.1)', dest='metrics_host', default='127.0.0.1')
+    parser.add_option('--role', help='Set what this node does: standalone polls the archive and processes the pastes, coordinator polls the archive and publishes the new pastes to the work queue, worker processes the pastes of the work queue (default: standalone)', dest='role', type='choice', choices=Crawler.ROLES, default='standalone')
+    parser.add_option('--queue', help='Set the work queue of a coordinator and its workers: a sqlite file, or the http:// address of a coordinator serving it (default: data/queue.db)', dest='queue_path', default='data/queue.db')
+    parser.add_option('--queue-port', help='coordinator: Serve the work queue to workers on other hosts on this port, 0 to disable (default: 0)', dest='queue_port', type='int', default=0)
+    parser.add_option('--queue-host', help='coordinator: Set the address the work queue is served on, another one than the loopback needs a queue token (default: 127.0.0.1)', dest='queue_host', default='127.0.0.1')
+    parser.add_option('--queue-token', help='Set the secret a coordinator serving the work queue and its remote workers share, better given in the PASTEBIN_QUEUE_TOKEN environment variable than on the command line (default: $PASTEBIN_QUEUE_TOKEN)', dest='queue_token', default=os.environ.get('PASTEBIN_QUEUE_TOKEN', ''))
+    parser.add_option('--queue-batch', help='worker: Set the number of pastes claimed at once (default: 10)', dest='queue_batch', type='int', default=10)
+    parser.add_option('--queue-lease', help='worker: Set the seconds a claimed paste is reserved before other workers may take it over (default: 600)', dest='queue_lease', type='float', default=600)
+    parser.add_option('--checkpoint', help='Set the file the crawl state is saved to and resumed from: totals, pacing and the pastes not processed yet, empty to disable (default: checkpoint.json in the data directory, checkpoint-<role>.json for a coordinator or worker)', dest='checkpoint', default=None)
+    parser.add_option('--checkpoint-interval', help='Set the seconds between checkpoints, one is also written at exit (default: 60)', dest='checkpoint_interval', type='float', default=60)
+    parser.add_option('--schedule', help='Set the order pastes are fetched in: page keeps the archive order; priority ranks them by their chance to match and to be deleted, learned from the archive rows, and leaves what does not fit in the interval between two polls to the next one (default: page)', dest='schedule', type='choice', choices=Scheduler.POLICIES, default='page')
+    parser.add_option('--schedule-urgency', help='Set the weight of the deletion risk against the chance to match in the priority schedule (default: 2)', dest='schedule_urgency', type='float', default=2.0)
+    parser.add_option('--base-url', help='Crawl another site than pastebin.com, e.g. a local fake_pastebin.py (default: {:s})'.format(Crawler.PASTEBIN_URL), dest='base_url', default=None)
+    parser.add_option('-t', '--http-timeout', help='Set the socket timeout of HTTP requests in seconds (default: 30)', dest='http_timeout', type='float', default=30)
+    parser.add_option('--fetch-mode', help='Set how pastes are fetched: raw reads the raw endpoint and falls back to html, html extracts them from the paste page (default: raw)', dest='fetch_mode', type='choice', choices=Crawler.FETCH_MODES, default='raw')
+    parser.add_option('--stream-window', help='Set the size in KB of the windows big pastes are matched by (default: 256)', dest='stream_window', type='int', default=256)
+    parser.add_option('--stream-overlap', help='Set the overlap in KB between consecutive windows of big pastes, longer matches may be missed (default: 4)', dest='stream_overlap', type='int', default=4)
+    parser.add_option('--stop-categories', help='Stop matching a big paste once all these comma separated directories are hit, it is still downloaded in full to be saved (default: none)', dest='stop_categories', default='')
+    parser.add_option('-w', '--workers', help='Set the number of pastes fetched concurrently, 1 fetches them one by one (default: 1)', dest='workers', type='int', default=1)
+    parser.add_option('--scan-queue', help='Set the number of fetched pastes that may wait for the scanner (default: 100)', dest='scan_queue', type='int', default=100)
+    parser.add_option('-p', '--scan-processes', help='Set the number of processes matching pastes, 0 matches them in the crawler process (default: 0)', dest='scan_processes', type='int', default=0)
+    parser.add_option('--scan-depth', help='Set the number of pastes that may be queued for the scanning processes (default: 32)', dest='scan_depth', type='int', default=32)
+    parser.add_option('--rule-budget', help='Set the seconds a rule may spend on a paste before it is aborted, 0 for no limit; only enforced with -w 1 or --scan-processes (default: 2)', dest='rule_budget', type='float', default=2)
+    parser.add_option('--profile-rules', help='Time every rule separately instead of matching them in a single pass', dest='profile_rules', action='store_true', default=False)
+    parser.add_option('--profile-sample', help='Set the share of the pastes whose rules are timed one by one for the per-rule profile without --profile-rules (default: 0.01)', dest='profile_sample', type='float', default=0.01)
+    parser.add_option('--profile-interval', help='Set the seconds between dumps of the per-rule profile, also dumped on SIGUSR1 (default: 3600)', dest='profile_interval', type='float', default=3600)
+    parser.add_option('--no-prefilter', help='Match every paste against the rules, even empty or recently seen content', dest='prefilter', action='store_false', default=True)
+    parser.add_option('--skip-binary', help='Do not match binary pastes (NUL or control characters), although a terminal log may hold credentials', dest='skip_binary', action='store_true', default=False)
+    parser.add_option('--no-decode', help='Do not decode the base64/hex blobs of pastes before matching them', dest='decode_blobs', action='store_false', default=True)
+    parser.add_option('--duplicate-cache', help='Set the number of recently matched pastes whose content is recognized and not matched again, 0 to disable (default: 10000)', dest='duplicate_cache', type='int', default=10000)
+    parser.add_option('--rule-engine', help='Set the regex matching engine: auto, python or hyperscan (default: auto)', dest='rule_engine', type='choice', choices=RuleSet.ENGINES, default='auto')
     (options, args) = parser.parse_args()
-    return options.refresh_time, options.delay, options.ban_wait, options.flush_after_x_refreshes, options.connection_timeout, options.verbose
+    options.data_lock = None	# held by a worker as long as it runs
+    if options.role == 'worker':	# workers on one host never share their files
+        if options.data_dir is None:
+            options.data_dir,options.data_lock = worker_data_dir()
+        else:
+            os.makedirs(options.data_dir, exist_ok=True)
+            options.data_lock = lock_file(os.path.join(options.data_dir, 'lock'))
+            if options.data_lock is None:
+                parser.error('the data directory {:s} is used by another worker'.format(options.data_dir))
+    if options.role == 'coordinator' and options.queue_port and not options.queue_token and not (options.queue_host in ('localhost', '::1') or options.queue_host.startswith('127.')):
+        parser.error('serving the work queue on {:s} needs a queue token, anyone reaching the port could drain it'.format(options.queue_host or 'every interface'))
+    options.data_dir = options.data_dir or 'data'
+    for name,default in (('seen_db','seen.db'), ('store_path','store'), ('checkpoint','checkpoint.json' if options.role == 'standalone' else 'checkpoint-{:s}.json'.format(options.role))):
+        if getattr(options, name) is None:
+            setattr(options, name, os.path.join(options.data_dir, default))
+    return options
 
 
 if __name__ == "__main__":
     
     try:
-#        refresh_time, delay, ban_wait, flush_after_x_refreshes, connection_timeout, verbose = parse_input()
-        Crawler ().start (*parse_input())
-#        Crawler ().start (refresh_time=refresh_time,delay=delay,ban_wait=ban_wait,flush_after_x_refreshes=flush_after_x_refreshes,connection_timeout=connection_timeout,verbose=verbose)
+        options = parse_input()
+        crawler = Crawler (rule_engine=options.rule_engine,workers=options.workers,scan_queue=options.scan_queue,http_timeout=options.http_timeout,fetch_mode=options.fetch_mode,seen_db=options.seen_db,seen_ttl=options.seen_ttl,seen_max=options.seen_max,
+                           stream_window=options.stream_window,stream_overlap=options.stream_overlap,stop_categories=[c.strip() for c in options.stop_categories.split(',') if c.strip()],
+                           scan_processes=options.scan_processes,scan_depth=options.scan_depth,
+                           rule_budget=options.rule_budget,profile_rules=options.profile_rules,profile_sample=options.profile_sample,profile_interval=options.profile_interval,
+                           base_url=options.base_url, storage=options.storage, store_path=options.store_path,
+                           store_codec=options.store_codec, writer_queue=options.writer_queue, writer_batch=options.writer_batch,
+                           writer_fsync=options.writer_fsync, max_rate=options.max_rate,
+                           archive_snapshots=options.archive_snapshots, metrics_port=options.metrics_port, metrics_host=options.metrics_host,
+                           role=options.role, queue_path=options.queue_path, queue_port=options.queue_port, queue_host=options.queue_host, queue_token=options.queue_token,
+                           queue_batch=options.queue_batch, queue_lease=options.queue_lease,
+                           prefilter=options.prefilter, decode_blobs=options.decode_blobs, duplicate_cache=options.duplicate_cache, skip_binary=options.skip_binary,
+                           checkpoint=options.checkpoint, checkpoint_interval=options.checkpoint_interval,
+                           schedule=options.schedule, schedule_urgency=options.schedule_urgency, data_dir=options.data_dir)
+        if options.role == 'worker':
+            crawler.work (refresh_time=options.refresh_time,delay=options.delay,connection_timeout=options.connection_timeout,verbose=options.verbose)
+        else:
+            crawler.start (refresh_time=options.refresh_time,delay=options.delay,ban_wait=options.ban_wait,flush_after_x_refreshes=options.flush_after_x_refreshes,connection_timeout=options.connection_timeout,verbose=options.verbose)
     except KeyboardInterrupt:
-        Logger (self.verbose).log ( 'Bye! Hope you found what you were looking for :)', True )
+        Logger ().log ( 'Bye! Hope you found what you were looking for :)', True )
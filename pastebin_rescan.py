@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+#coding: utf-8
+
+## Runs a set of rules over the pastes already saved, so that a rule added to regexes.txt also covers the
+## past: every <file>_<timestamp>_<paste id>.txt under data/ (the old data/res big pastes included) and every
+## body of the paste store. The bodies are read through mmap by a pool of processes, one per core, and the
+## matches in a category the paste was not saved under yet are written as the crawler would have, with the
+## paste's original timestamp. Progress is saved to data/rescan.json, an interrupted rescan goes on from there.
+
+from optparse import OptionParser
+import codecs
+import hashlib
+import json
+import mmap
+import multiprocessing
+import os
+import signal
+import sys
+import time
+
+from pastebin_crawler import Crawler, RuleSet, Prefilter, PasteStore, ResultWriter
+from pastebin_store import parse_filename
+
+
+rescan_process = None	# (RuleSet, Prefilter, window, overlap, segment maps) of each scanning process
+
+def rescan_init(rules, engine, window, overlap, decode):
+    global rescan_process
+    signal.signal(signal.SIGINT, signal.SIG_IGN)	# the main process decides when scanning stops
+    rescan_process = (RuleSet(rules, engine=engine), Prefilter(decode=decode, duplicates=0), window, overlap, {})
+
+def read_source(source, maps):
+## the text of a saved paste: ('file', path) or ('store', segment file, codec, offset, length, raw length)
+    if source[0] == 'store':
+        name = source[1]
+        if name not in maps:
+            f = open(name, 'rb')
+            maps[name] = (f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        return PasteStore.read_frame(maps[name][1], *source[2:])
+    with open(source[1], 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return ''
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            return m[:].decode('utf-8', 'replace')
+
+def file_chunks(path, size):
+## a saved file as text chunks of size bytes, decoded on the fly from its mmap
+    decoder = codecs.getincrementaldecoder('utf-8')('replace')
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        for offset in range(0, len(m), size):
+            yield decoder.decode(m[offset:offset+size])
+        yield decoder.decode(b'', True)
+
+def rescan_paste(task):
+## runs in a pool process: (paste id, {rule index: matched text}, bytes read, seconds, error)
+    paste_id,source,size = task
+    ruleset,prefilter,window,overlap,maps = rescan_process
+    start = time.perf_counter()
+    try:
+        if size > window:	# matched window by window, a saved file is never read at once
+            chunks = file_chunks(source[1], window) if source[0] == 'file' else [read_source(source, maps)]
+            found = {ruleset.rules.index(rule):text for rule,text in ruleset.scan_stream(chunks, window=window, overlap=overlap)}
+        else:
+            paste_txt = read_source(source, maps)
+            verdict,texts,matches = prefilter.prepare(paste_txt, 0)
+            found = ruleset.search_texts(texts)[0] if matches is None else {}
+        return paste_id, found, size, time.perf_counter() - start, None
+    except Exception as inst:
+        return paste_id, {}, size, time.perf_counter() - start, str(inst)
+
+class Rescan:
+## The corpus is listed once at startup, and the listing is saved next to the state. Paste ids are not ordered
+## in time, so a resume walks that same listing rather than the corpus of the day, with the pastes saved since
+## appended to it. The pool returns the results in the order of the listing, so everything up to the last
+## paste handed back is done and its position is all a resume needs.
+    def __init__(self, rules, store=None, state='data/rescan.json', processes=0, engine='auto', window=256, overlap=4, decode=True):
+        self.rules = rules
+        self.store = store	# PasteStore read and written instead of data/ files, None if there is none
+        self.state_path = state
+        self.processes = processes or os.cpu_count() or 1
+        self.engine = engine
+        self.window = window*1024
+        self.overlap = overlap*1024
+        self.decode = decode
+        self.digest = hashlib.sha256('\n'.join(','.join(rule) for rule in rules).encode('utf-8')).hexdigest()	# a resume needs the same rules
+        self.totals = {'pastes':0, 'bytes':0, 'matches':0, 'errors':0, 'scan_time':0.0, 'elapsed':0.0}
+        self.done = None	# last paste id done
+        self.listing = None	# paste ids in the order they are scanned, saved to the .ids file next to the state
+        self.position = 0	# number of pastes of the listing done
+        self.maps = {}
+
+    def corpus(self, root='data'):
+## {paste id: [timestamp, categories saved, sources]} of every saved paste, sources being the copies of its
+## body, the ones not rewritten by the base64 rule first
+        pastes = {}
+        def add(paste_id, timestamp, category, source, size, rewritten):
+            paste = pastes.setdefault(paste_id, [timestamp, set(), []])
+            paste[0] = min(paste[0], timestamp)
+            paste[1].add(category)
+            paste[2].append((rewritten, source, size))
+        store = os.path.normpath(self.store.path) if self.store is not None else None
+        for directory,dirs,files in os.walk(root):
+            dirs[:] = [d for d in dirs if os.path.normpath(os.path.join(directory, d)) != store]
+            if directory == root:	# URL lists, the seen index, checkpoints
+                continue
+            for name in files:
+                parsed = parse_filename(name)
+                if parsed is None:
+                    continue
+                file,timestamp,paste_id = parsed
+                path = os.path.join(directory, name)
+                add(paste_id, timestamp, os.path.relpath(directory, root), ('file', path), os.path.getsize(path), file == 'base64')
+        if self.store is not None:
+            for timestamp,paste_id,category,file,digest in self.store.records():
+                try:
+                    source = ('store',) + self.store.locate(digest)
+                except (KeyError, ValueError):
+                    continue
+                add(paste_id, timestamp, category, source, source[-1], file == 'base64')
+        for paste in pastes.values():
+            paste[2] = min(paste[2], key=lambda copy: copy[0])[1:]
+        return pastes
+
+    def resume(self, restart=False):
+        if restart or not os.path.exists(self.state_path):
+            return
+        try:
+            with open(self.state_path, 'r') as f:
+                state = json.load(f)
+            if state['rules'] != self.digest:
+                print('{:s} was saved for other rules, starting over'.format(self.state_path))
+                return
+            with open(self.state_path + '.ids', 'r') as f:
+                listing = f.read().split()
+            if len(listing) != state['listed']:
+                raise ValueError('the listing has {:d} pastes instead of {:d}'.format(len(listing), state['listed']))
+            self.listing = listing
+            self.position = state['position']
+            self.done = state['done']
+            self.totals.update(state['totals'])
+        except (OSError, ValueError, KeyError, TypeError) as inst:
+            print('Ignoring the unreadable {:s}: {:s}'.format(self.state_path, str(inst)))
+            return
+        print('Resuming after paste {:s}: {:d} pastes, {:.1f} MB and {:d} new matches done before'.format(
+            self.done or '-', self.totals['pastes'], self.totals['bytes']/1024/1024, self.totals['matches']))
+
+    def write(self, path, text):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def save(self, writer):
+## the matches of the pastes up to self.position are on disk before the state says so
+        writer.flush()
+        if self.store is not None:
+            self.store.sync()
+        state = {'saved':time.time(), 'rules':self.digest, 'listed':len(self.listing), 'position':self.position, 'done':self.done, 'totals':self.totals}
+        self.write(self.state_path, json.dumps(state, separators=(',',':')))
+
+    def record(self, writer, paste_id, paste, found):
+## writes the matches of categories the paste was not saved under, returns how many
+        timestamp,categories,source = paste
+        new = 0
+        paste_txt = None
+        for i in sorted(found):
+            regex,file,directory = self.rules[i]
+            if directory in categories:
+                continue
+            if paste_txt is None:
+                paste_txt = read_source(source[0], self.maps)
+            content = Crawler.result_text('data/' + file, paste_txt)
+            if content == '':
+                continue
+            paste_url = Crawler.PASTESRAW_URL + '/' + paste_id
+            if not writer.result(paste_id, paste_url, 'data/' + file, 'data/' + directory, content, timestamp):
+                continue
+            print('Found a matching paste: {:s} ({:s}): {:s}'.format(paste_id, file, found[i][:50].replace('\n',' ')))
+            new += 1
+        return new
+
+    def progress(self, done, total, started, before):
+        elapsed = time.time() - started
+        t = self.totals
+        rate = (t['pastes'] - before[0]) / elapsed if elapsed else 0
+        eta = (total - done) / rate if rate else 0
+        return '{:d}/{:d} pastes ({:.1f}%), {:.1f} MB, {:d} new matches, {:d} errors; {:.1f} MB/s, {:.0f} pastes/s, {:.1f} cores busy, {:.0f}s left'.format(
+            done, total, done*100/total if total else 100, t['bytes']/1024/1024, t['matches'], t['errors'],
+            (t['bytes'] - before[1])/1024/1024/elapsed if elapsed else 0, rate, (t['scan_time'] - before[2])/elapsed if elapsed else 0, eta)
+
+    def run(self, writer, pastes, progress=10, checkpoint=60):
+        if self.listing is None:
+            self.listing = sorted(pastes)
+        else:	# saved since the listing was taken, or by a rescan of other rules
+            listed = set(self.listing)
+            self.listing += sorted(paste_id for paste_id in pastes if paste_id not in listed)
+        self.write(self.state_path + '.ids', '\n'.join(self.listing) + '\n')
+        skipped = sum(1 for paste_id in self.listing[:self.position] if paste_id in pastes)
+        order = [(n, paste_id) for n,paste_id in enumerate(self.listing) if n >= self.position and paste_id in pastes]	# removed since, skipped
+        total = skipped + len(order)
+        started = last_progress = last_checkpoint = time.time()
+        before = (self.totals['pastes'], self.totals['bytes'], self.totals['scan_time'])
+        elapsed_before = self.totals['elapsed']
+        print('Rescanning {:d} pastes ({:d} done before) with {:d} rules on {:d} processes'.format(total, skipped, len(self.rules), self.processes))
+        sys.stdout.flush()
+        pool = multiprocessing.get_context('spawn').Pool(self.processes, initializer=rescan_init,
+                                                          initargs=(self.rules, self.engine, self.window, self.overlap, self.decode))
+        tasks = ((paste_id, pastes[paste_id][2][0], pastes[paste_id][2][1]) for n,paste_id in order)
+        done = skipped
+        try:
+            for (n,listed),(paste_id,found,size,elapsed,error) in zip(order, pool.imap(rescan_paste, tasks, chunksize=8)):
+                done += 1
+                self.totals['pastes'] += 1
+                self.totals['bytes'] += size
+                self.totals['scan_time'] += elapsed
+                if error is not None:
+                    self.totals['errors'] += 1
+                    print('Error rescanning paste {:s}, error is {:s}'.format(paste_id, error))
+                elif found:
+                    self.totals['matches'] += self.record(writer, paste_id, pastes[paste_id], found)
+                self.done = paste_id
+                self.position = n + 1
+                now = time.time()
+                self.totals['elapsed'] = elapsed_before + now - started
+                if checkpoint and now - last_checkpoint >= checkpoint:
+                    self.save(writer)
+                    last_checkpoint = now
+                if progress and now - last_progress >= progress:
+                    print(self.progress(done, total, started, before))
+                    sys.stdout.flush()
+                    last_progress = now
+            pool.close()
+        except KeyboardInterrupt:
+            print('Interrupted, run again to resume after paste {:s}'.format(self.done or '-'))
+            raise
+        finally:
+            pool.terminate()
+            pool.join()
+            self.save(writer)
+        print(self.progress(done, total, started, before))
+
+    def close(self):
+        for f,m in self.maps.values():
+            m.close()
+            f.close()
+        self.maps = {}
+
+def interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+def parse_input():
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('--regexes', help='Set the rules to run, in the format of regexes.txt (default: regexes.txt)', dest='regexes', default='regexes.txt')
+    parser.add_option('--category', help='Only run the rules saving to this directory, can be repeated', dest='categories', action='append', default=[])
+    parser.add_option('-j', '--processes', help='Set the number of scanning processes (default: one per core)', dest='processes', type='int', default=0)
+    parser.add_option('--rule-engine', help='Set the rule engine: auto, python or hyperscan (default: auto)', dest='rule_engine', type='choice', choices=RuleSet.ENGINES, default='auto')
+    parser.add_option('--stream-window', help='Set the KB above which a saved file is matched window by window (default: 256)', dest='stream_window', type='int', default=256)
+    parser.add_option('--stream-overlap', help='Set the KB consecutive windows overlap by, longer matches may be missed (default: 4)', dest='stream_overlap', type='int', default=4)
+    parser.add_option('--no-decode', help='Do not match the base64 and hex blobs decoded from the pastes', dest='decode_blobs', action='store_false', default=True)
+    parser.add_option('--storage', help='Set where new matches are saved: files or store (default: store if --store-path exists, else files)', dest='storage', type='choice', choices=Crawler.STORAGES, default=None)
+    parser.add_option('--store-path', help='Set the directory of the paste store, also rescanned (default: data/store)', dest='store_path', default='data/store')
+    parser.add_option('--state', help='Set the file keeping the progress of the rescan (default: data/rescan.json)', dest='state', default='data/rescan.json')
+    parser.add_option('--restart', help='Ignore the saved progress and rescan everything', dest='restart', action='store_true', default=False)
+    parser.add_option('--progress', help='Set the seconds between progress lines (default: 10)', dest='progress', type='float', default=10)
+    parser.add_option('--checkpoint-interval', help='Set the seconds between saves of the progress (default: 60)', dest='checkpoint_interval', type='float', default=60)
+    (options, args) = parser.parse_args()
+    return options
+
+
+if __name__ == "__main__":
+    options = parse_input()
+    with open(options.regexes, 'r') as f:
+        rules,errors = Crawler.validate_regexes(f.readlines())
+    if errors:
+        sys.exit('\n'.join('{:s}: {:s}'.format(options.regexes, error) for error in errors))
+    if options.categories:
+        rules = [rule for rule in rules if rule[2] in options.categories]
+    if not rules:
+        sys.exit('No rules to run')
+    storage = options.storage or ('store' if os.path.isdir(options.store_path) else 'files')
+    try:
+        store = PasteStore(options.store_path, readonly=storage != 'store') if storage == 'store' or os.path.isdir(options.store_path) else None
+    except RuntimeError as inst:	# the crawler is still running
+        sys.exit(str(inst))
+    writer = ResultWriter(store=store if storage == 'store' else None)
+    rescan = Rescan(rules, store=store, state=options.state, processes=options.processes, engine=options.rule_engine,
+                    window=options.stream_window, overlap=options.stream_overlap, decode=options.decode_blobs)
+    rescan.resume(options.restart)
+    signal.signal(signal.SIGTERM, interrupt)	# stopped like by ^C, the progress is saved
+    try:
+        rescan.run(writer, rescan.corpus(), progress=options.progress, checkpoint=options.checkpoint_interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        writer.close()
+        rescan.close()
+        if store is not None:
+            store.close()
+    print(writer.summary())
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+#coding: utf-8
+
+## Command line access to the paste store written by pastebin_crawler.py --storage store: list the saved
+## matches, print a paste, export them to the one-file-per-match layout of data/ or import that layout.
+
+from optparse import OptionParser
+import os
+import re
+import sys
+
+from pastebin_crawler import PasteStore
+
+
+FILENAME = re.compile(r'^(.*)_(\d{4}_\d\d_\d\d__\d\d_\d\d_\d\d)_([^_]+)\.txt$')	# <file>_<timestamp>_<paste id>.txt, see Crawler.save_result
+
+def filename_timestamp(timestamp):
+    return timestamp.replace('/','_').replace(':','_').replace(' ','__')
+
+def parse_filename(name):
+## (file, timestamp, paste id) of a file saved by Crawler.save_result, None for any other file
+    m = FILENAME.match(name)
+    if not m:
+        return None
+    file,timestamp,paste_id = m.groups()
+    return file, timestamp[:10].replace('_','/') + ' ' + timestamp[12:].replace('_',':'), paste_id
+
+def matching(store, options):
+    pattern = re.compile(options.grep, re.IGNORECASE) if options.grep else None
+    for record in store.records():
+        timestamp,paste_id,category,file,digest = record
+        if options.category and category != options.category:
+            continue
+        if options.paste_id and paste_id != options.paste_id.strip('/'):
+            continue
+        if options.since and timestamp < options.since:
+            continue
+        if pattern is not None and not pattern.search(store.get(digest)):
+            continue
+        yield record
+
+def cmd_stats(store, options, args):
+    print(store.summary())
+    categories = {}
+    for timestamp,paste_id,category,file,digest in store.records():
+        categories[category] = categories.get(category, 0) + 1
+    for category,count in sorted(categories.items(), key=lambda item: item[1], reverse=True):
+        print('  {:20s} {:8d} matches'.format(category, count))
+
+def cmd_query(store, options, args):
+    for record in matching(store, options):
+        print('\t'.join(record))
+
+def cmd_show(store, options, args):
+## args are digests or paste ids
+    records = list(store.records())
+    for key in args:
+        digests = [digest for timestamp,paste_id,category,file,digest in records if paste_id == key.strip('/')] or [key]
+        try:
+            sys.stdout.write(store.get(digests[-1]))
+        except (KeyError, ValueError):
+            sys.stderr.write('{:s} is not in the store\n'.format(key))
+
+def cmd_export(store, options, args):
+## write the matches to the layout of --storage files, under args[0] (default: data)
+    root = args[0] if args else 'data'
+    count = 0
+    for timestamp,paste_id,category,file,digest in matching(store, options):
+        directory = os.path.join(root, category)
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, file + '_' + filename_timestamp(timestamp) + '_' + paste_id + '.txt'), 'w', encoding='utf-8', errors='surrogatepass') as paste:
+            paste.write(store.get(digest))
+        count += 1
+    print('{:d} pastes exported to {:s}'.format(count, root))
+
+def cmd_import(store, options, args):
+## add the <file>_<timestamp>_<paste id>.txt files of the data/<directory> folders given in args
+    count = skipped = 0
+    for root in args or ['data']:
+        for directory,dirs,files in os.walk(root):
+            dirs[:] = [d for d in dirs if os.path.join(directory, d) != os.path.normpath(store.path)]
+            for name in sorted(files):
+                parsed = parse_filename(name)
+                if parsed is None:
+                    skipped += 1
+                    continue
+                file,timestamp,paste_id = parsed
+                with open(os.path.join(directory, name), 'r', encoding='utf-8', errors='replace') as paste:
+                    store.save(paste_id, os.path.relpath(directory, root), file, [paste.read()], timestamp)
+                count += 1
+                if options.remove:
+                    os.remove(os.path.join(directory, name))
+    print('{:d} pastes imported, {:d} files skipped; {:s}'.format(count, skipped, store.summary()))
+
+COMMANDS = {
+    'stats': cmd_stats,
+    'query': cmd_query,
+    'show': cmd_show,
+    'export': cmd_export,
+    'import': cmd_import,
+}
+
+def parse_input():
+    parser = OptionParser(usage='%prog [options] {:s} [args]'.format('|'.join(sorted(COMMANDS))))
+    parser.add_option('--store-path', help='Set the directory of the paste store (default: data/store)', dest='store_path', default='data/store')
+    parser.add_option('--store-codec', help='Set the compression of new segments when importing: zstd or gzip (default: zstd if installed, else gzip)', dest='store_codec', type='choice', choices=('zstd','gzip'), default=None)
+    parser.add_option('--category', help='query/export: Only the matches saved under this directory', dest='category', default=None)
+    parser.add_option('--paste-id', help='query/export: Only the matches of this paste', dest='paste_id', default=None)
+    parser.add_option('--since', help='query/export: Only the matches saved since this timestamp, e.g. "2019/01/31 12:00:00"', dest='since', default=None)
+    parser.add_option('--grep', help='query/export: Only the pastes matching this regex', dest='grep', default=None)
+    parser.add_option('--remove', help='import: Remove the files once imported', dest='remove', action='store_true', default=False)
+    (options, args) = parser.parse_args()
+    if not args or args[0] not in COMMANDS:
+        parser.error('choose one command: {:s}'.format(', '.join(sorted(COMMANDS))))
+    return options, args[0], args[1:]
+
+
+if __name__ == "__main__":
+    options, name, args = parse_input()
+    try:	# only import writes, the others may run next to a crawler
+        store = PasteStore(options.store_path, codec=options.store_codec, readonly=name != 'import')
+    except RuntimeError as inst:
+        sys.exit(str(inst))
+    try:
+        COMMANDS[name](store, options, args)
+    finally:
+        store.close()
@@ -0,0 +1,43 @@
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pastebin_crawler import Crawler
+from fake_pastebin import FakePastebin, BAN_PAGE, synthetic_corpus
+
+
+def archive(corpus):
+    fake = FakePastebin(corpus)
+    fake.published = len(corpus)
+    return fake.archive_page()
+
+
+class ArchiveTest(unittest.TestCase):
+
+    def test_parse_archive_lists_every_row(self):
+        corpus = synthetic_corpus(FakePastebin.archive_size, random.Random(1), big_ratio=0)
+        pastes = Crawler.parse_archive(archive(corpus))
+        self.assertEqual([paste.id for paste in pastes], ['/' + p['id'] for p in reversed(corpus)])
+        self.assertEqual([paste.syntax for paste in pastes], [p['syntax'] for p in reversed(corpus)])
+        self.assertTrue(all(paste.age is not None and paste.age >= 0 for paste in pastes))
+
+    def test_ban_page(self):
+        self.assertTrue(Crawler.is_ban_page(BAN_PAGE))
+        self.assertTrue(Crawler.is_ban_page(b'<html><body>Pastebin.com has blocked your IP</body></html>'))
+
+    def test_paste_titled_like_the_ban_page(self):
+        corpus = synthetic_corpus(10, random.Random(2), big_ratio=0)
+        corpus[3]['title'] = 'Pastebin.com - Access Denied Warning: blocked your IP (unatural browsing behavior)'
+        page = archive(corpus)
+        self.assertFalse(Crawler.is_ban_page(page))
+        self.assertEqual(len(Crawler.parse_archive(page)), 10)
+
+    def test_not_an_archive_page(self):
+        self.assertEqual(Crawler.parse_archive(b'<html><body>maintenance</body></html>'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import atexit
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pastebin_crawler import ArchiveEntry, Crawler
+
+
+def row(paste_id):
+    return ArchiveEntry(paste_id, 'Untitled', 'None', 30, 2048)
+
+
+class CheckpointTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.tmp.name)	# the log files
+        self.path = os.path.join(self.tmp.name, 'checkpoint.json')
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def crawler(self, role='standalone'):
+        crawler = Crawler(role=role, data_dir=self.tmp.name, seen_db=os.path.join(self.tmp.name, 'seen.db'), checkpoint=self.path,
+                          checkpoint_interval=0, schedule='priority')
+        atexit.unregister(crawler.checkpoint)	# the temporary directory is gone by then
+        self.addCleanup(crawler.writer.close)
+        self.addCleanup(crawler.seen.close)
+        return crawler
+
+    def test_resume(self):
+        crawler = self.crawler()
+        crawler.pace(0)
+        crawler.totalpastes, crawler.validpastes, crawler.totalerrors = 120, 7, 3
+        self.assertEqual(crawler.take_backlog([row('/a'), row('/b'), row('/c')]), [])
+        for paste_id in ('/a', '/b', '/c'):
+            crawler.seen.add(paste_id)
+        crawler.processed('/a', 'matched')
+        crawler.rate.capacity = 0.25
+        crawler.checkpoint()
+        resumed = self.crawler()
+        self.assertEqual((resumed.totalpastes, resumed.validpastes, resumed.totalerrors), (120, 7, 3))
+        self.assertEqual(list(resumed.pending.items()), [('/b', 0), ('/c', 0)])
+        self.assertEqual(resumed.scheduler.rates['*'], crawler.scheduler.rates['*'])
+        resumed.pace(0)
+        self.assertEqual(resumed.rate.capacity, 0.25)
+        backlog = resumed.take_backlog([row('/c'), row('/d')])	# /b scrolled off the archive page
+        self.assertEqual([paste.id for paste in backlog], ['/b'])
+        self.assertNotIn('/c', resumed.seen)	# committed as seen before it was done
+        self.assertEqual(list(resumed.pending.items()), [('/b', 1), ('/c', 0), ('/d', 0)])
+
+    def test_pending_pastes_are_given_up(self):
+        crawler = self.crawler()
+        crawler.take_backlog([row('/a')])
+        for attempt in range(Crawler.PENDING_RETRIES):
+            self.assertEqual([paste.id for paste in crawler.take_backlog([])], ['/a'])
+        self.assertEqual(crawler.take_backlog([]), [])
+        self.assertEqual(len(crawler.pending), 0)
+
+    def test_checkpoint_of_another_role_is_ignored(self):
+        crawler = self.crawler()
+        crawler.totalpastes = 5
+        crawler.checkpoint()
+        with open(self.path) as f:
+            self.assertEqual(json.load(f)['role'], 'standalone')
+        crawler.role = 'coordinator'
+        crawler.checkpoint()
+        self.assertEqual(self.crawler().totalpastes, 0)
+
+    def test_unreadable_checkpoint_is_ignored(self):
+        with open(self.path, 'w') as f:
+            f.write('{"saved": 1, "totals": ')	# torn, e.g. written by hand
+        crawler = self.crawler()
+        self.assertEqual((crawler.totalpastes, len(crawler.pending)), (0, 0))
+        crawler.checkpoint()
+        self.assertFalse(os.path.exists(self.path + '.tmp'))
+        self.assertEqual(self.crawler().totalpastes, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
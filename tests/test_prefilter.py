@@ -0,0 +1,81 @@
+import base64
+import gzip
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pastebin_crawler import Prefilter, RuleSet
+
+
+SECRET = 'db_password=hunter2hunter2 and some more words to make it a long enough blob'
+
+def matched(prefilter, ruleset, paste_txt):
+    verdict,texts,matches = prefilter.prepare(paste_txt, ruleset.version)
+    if matches is not None:
+        return verdict, {rule[1]:found for rule,found in matches}, set()
+    found,decoded = ruleset.search_texts(texts)
+    prefilter.scanned(paste_txt, ruleset.version, [(ruleset.rules[i], found[i]) for i in sorted(found)], 0.0, len(decoded))
+    return verdict, {ruleset.rules[i][1]:text for i,text in found.items()}, {ruleset.rules[i][1] for i in decoded}
+
+
+class PrefilterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.ruleset = RuleSet([[r'password=\w+', 'password.txt', 'password'], [r'end of paste$', 'end.txt', 'end'],
+                                [r'paste\s+db_password', 'span.txt', 'span']], engine='python')
+
+    def test_blobs_are_matched_on_their_own(self):
+        paste_txt = 'config: ' + base64.b64encode(SECRET.encode()).decode() + '\nend of paste'
+        verdict,found,decoded = matched(Prefilter(), self.ruleset, paste_txt)
+        self.assertEqual(found, {'password.txt':'password=hunter2hunter2', 'end.txt':'end of paste'})
+        self.assertEqual(decoded, {'password.txt'})
+
+    def test_no_match_across_the_paste_and_a_blob(self):
+        paste_txt = 'x ' + base64.b64encode(SECRET.encode()).decode() + ' end of paste'
+        verdict,found,decoded = matched(Prefilter(), self.ruleset, paste_txt)
+        self.assertNotIn('span.txt', found)
+        self.assertIn('end.txt', found)
+
+    def test_decoded_matches_are_counted(self):
+        prefilter = Prefilter()
+        matched(prefilter, self.ruleset, 'password=visible and ' + base64.b64encode(SECRET.encode()).decode())
+        matched(prefilter, self.ruleset, 'nothing but ' + base64.b64encode(gzip.compress(SECRET.encode())).decode())
+        self.assertEqual(prefilter.counters['decoded_matches'], 1)
+        self.assertEqual(prefilter.counters['compressed'], 1)
+
+    def test_unpadded_url_safe_and_glued_blobs(self):
+        secret = (SECRET + ' ~~~ ???').encode()	# encodes to - and _ in the url-safe alphabet
+        for prefix in ('', 'a', 'token', 'Authorization:Bearer'):
+            for end in range(len(secret) - 3, len(secret) + 1):
+                blob = base64.urlsafe_b64encode(secret[:end]).decode().rstrip('=')
+                verdict,found,decoded = matched(Prefilter(duplicates=0), self.ruleset, prefix + blob + ' trailing text')
+                self.assertEqual(found.get('password.txt'), 'password=hunter2hunter2', (prefix, blob))
+
+    def test_binary_pastes_are_matched_unless_skipped(self):
+        paste_txt = '\x1b[32mlogin ok\x1b[0m\n' * 40 + '\x1b[1mpassword=s3cret\x1b[0m\x00'
+        verdict,found,decoded = matched(Prefilter(), self.ruleset, paste_txt)
+        self.assertEqual(verdict, 'binary')
+        self.assertEqual(found, {'password.txt':'password=s3cret'})
+        prefilter = Prefilter(skip_binary=True)
+        verdict,found,decoded = matched(prefilter, self.ruleset, paste_txt)
+        self.assertEqual((verdict, found), ('binary', {}))
+        self.assertEqual(prefilter.counters['skipped'], 1)
+        self.assertIn('1 pastes', prefilter.summary())
+
+    def test_duplicates_reuse_the_matches(self):
+        prefilter = Prefilter()
+        matched(prefilter, self.ruleset, 'password=once, end of paste')
+        verdict,found,decoded = matched(prefilter, self.ruleset, 'password=once, end of paste')
+        self.assertEqual(verdict, 'duplicate')
+        self.assertEqual(found, {'password.txt':'password=once', 'end.txt':'end of paste'})
+        self.assertEqual(prefilter.counters['skipped'], 1)
+
+    def test_random_blobs_are_not_text(self):
+        blob = base64.b64encode(bytes(range(256)) * 4).decode()
+        self.assertEqual(Prefilter().prepare('data ' + blob, 0)[1], ['data ' + blob])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pastebin_crawler import RateController
+
+
+class RateControllerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = [1000.0]
+        self.rate = self.controller()
+
+    def controller(self, **kwargs):
+        return RateController(delay=2, clock=lambda: self.clock[0], **kwargs)
+
+    def test_probes_up_to_the_ceiling(self):
+        for n in range(1000):
+            self.rate.success(0.5)
+        self.assertEqual(self.rate.capacity, self.rate.max_rate)
+        self.rate.success(0.5)
+        self.assertEqual(self.rate.capacity, self.rate.max_rate)
+
+    def test_no_probe_beyond_the_turnover(self):
+        self.rate.archive(100, 0)
+        self.clock[0] += 100
+        self.rate.archive(100, 10)	# 0.1 paste/s, 0.15/s with the headroom
+        self.rate.success(0.5)
+        self.assertEqual(self.rate.capacity, 0.5)
+        self.assertAlmostEqual(self.rate.rate(), 0.15)
+        self.assertAlmostEqual(self.rate.interval(), 1/0.15)
+
+    def test_throttling_backs_off_once_per_cooldown(self):
+        self.rate.throttled(429)
+        self.rate.throttled(429)	# the same burst
+        self.assertAlmostEqual(self.rate.capacity, 0.35)
+        self.clock[0] += self.rate.cooldown
+        self.rate.throttled(403)
+        self.assertAlmostEqual(self.rate.capacity, 0.245)
+        self.assertEqual(self.rate.decisions['back off'], 2)
+
+    def test_ban_caps_the_rate_and_relaxes(self):
+        self.rate.banned()
+        self.assertAlmostEqual(self.rate.ban_ceiling, 0.4)
+        self.assertAlmostEqual(self.rate.capacity, 0.25)
+        self.rate.banned()	# within the cooldown, still a cut
+        self.assertAlmostEqual(self.rate.capacity, 0.125)
+        self.assertAlmostEqual(self.rate.ceiling(), 0.2)
+        self.clock[0] += 3600
+        self.assertAlmostEqual(self.rate.ceiling(), 0.3)
+        for n in range(100):
+            self.rate.success(0.5)
+        self.assertAlmostEqual(self.rate.capacity, 0.3)
+
+    def test_min_rate(self):
+        for n in range(20):
+            self.rate.banned()
+        self.assertEqual(self.rate.capacity, self.rate.min_rate)
+
+    def test_slow_answers_slow_down(self):
+        for n in range(10):
+            self.rate.success(0.2)
+        self.rate.success(20)
+        self.assertAlmostEqual(self.rate.capacity, (0.5 + 10*0.01)*0.8)
+        self.assertEqual(self.rate.decisions['slow down'], 1)
+
+    def test_errors_slow_down(self):
+        self.rate.error()
+        self.rate.error()
+        self.rate.error()
+        self.assertEqual(self.rate.capacity, 0.5)
+        self.rate.error()	# over 30%
+        self.assertAlmostEqual(self.rate.capacity, 0.4)
+
+    def test_overrun_doubles_the_turnover(self):
+        self.rate.archive(50, 0)
+        self.clock[0] += 100
+        self.rate.archive(50, 50)
+        self.assertAlmostEqual(self.rate.turnover, 1.0)
+        self.assertEqual(self.rate.decisions['overrun'], 1)
+
+    def test_refresh_before_half_the_page_turns_over(self):
+        self.assertEqual(self.rate.refresh(200), 200)
+        self.rate.archive(100, 0)
+        self.clock[0] += 100
+        self.rate.archive(100, 50)
+        self.assertAlmostEqual(self.rate.refresh(200), 100)
+        self.clock[0] += 1
+        self.rate.archive(100, 99)
+        self.assertEqual(self.rate.refresh(200), 5)
+
+    def test_state_round_trip(self):
+        self.rate.banned()
+        self.rate.success(0.5)
+        restored = self.controller()
+        restored.restore(self.rate.state())
+        self.assertEqual(restored.state(), self.rate.state())
+        self.assertEqual(restored.last_decision, 'resumed')
+        lower = self.controller(max_rate=0.1)
+        lower.restore(dict(self.rate.state(), capacity=3))
+        self.assertEqual(lower.capacity, 0.1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pastebin_crawler import ResultWriter
+from pastebin_rescan import Rescan
+
+
+RULES = [[r'token=\w+', 'tokens.txt', 'tokens']]
+
+
+class RescanTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.tmp.name)	# the rescan writes under data/ as the crawler does
+        self.state = os.path.join('data', 'rescan.json')
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def saved(self, *paste_ids):
+        os.makedirs(os.path.join('data', 'passwords'), exist_ok=True)
+        for paste_id in paste_ids:
+            with open(os.path.join('data', 'passwords', 'passwords_2024_01_01__00_00_00_{:s}.txt'.format(paste_id)), 'w') as f:
+                f.write('password=x token={:s}\n'.format(paste_id))
+
+    def interrupted(self, listing, position):
+## the state of a rescan stopped after the first position pastes of listing
+        rescan = Rescan(RULES, state=self.state)
+        os.makedirs('data', exist_ok=True)
+        rescan.write(self.state + '.ids', '\n'.join(listing) + '\n')
+        rescan.write(self.state, json.dumps({'saved':0, 'rules':rescan.digest, 'listed':len(listing), 'position':position,
+                                             'done':listing[position-1], 'totals':dict(rescan.totals, pastes=position)}))
+
+    def run_rescan(self, rules=RULES):
+        rescan = Rescan(rules, state=self.state, processes=1)
+        rescan.resume()
+        writer = ResultWriter(root='data')
+        try:
+            rescan.run(writer, rescan.corpus('data'), progress=0, checkpoint=0)
+        finally:
+            writer.close()
+            rescan.close()
+        listed = []
+        if os.path.exists(os.path.join('data', 'tokens.txt')):
+            with open(os.path.join('data', 'tokens.txt')) as f:
+                listed = [ResultWriter.line_id(line) for line in f]
+        return rescan, listed
+
+    def test_resume_walks_the_saved_listing(self):
+        self.saved('a', 'b', 'd', 'e')	# c was removed and e saved since the listing was taken
+        self.interrupted(['c', 'a', 'd', 'b'], 2)
+        rescan,listed = self.run_rescan()
+        self.assertEqual(sorted(listed), ['b', 'd', 'e'])
+        self.assertEqual(rescan.listing, ['c', 'a', 'd', 'b', 'e'])
+        self.assertEqual((rescan.position, rescan.done, rescan.totals['pastes']), (5, 'e', 5))
+        with open(self.state) as f:
+            self.assertEqual(json.load(f)['listed'], 5)
+
+    def test_torn_listing_starts_over(self):
+        self.saved('a', 'b')
+        self.interrupted(['a', 'b'], 1)
+        with open(self.state + '.ids', 'w') as f:
+            f.write('a\n')
+        rescan,listed = self.run_rescan()
+        self.assertEqual(sorted(listed), ['a', 'b'])
+        self.assertEqual(rescan.totals['pastes'], 2)
+
+    def test_other_rules_start_over(self):
+        self.saved('a', 'b')
+        self.interrupted(['a', 'b'], 2)
+        rescan,listed = self.run_rescan(RULES + [[r'password=\w+', 'passwords.txt', 'passwords']])
+        self.assertEqual(sorted(listed), ['a', 'b'])
+
+
+if __name__ == '__main__':
+    unittest.main()
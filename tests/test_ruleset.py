@@ -0,0 +1,144 @@
+import os
+import random
+import re
+import string
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pastebin_crawler
+from pastebin_crawler import Crawler, RuleSet
+
+
+WORDS = ['key', 'board', 'pass', 'password', 'serial', 'license', 'login', 'admin', 'token', 'id', 'mail',
+         'select', 'from', 'where', 'the', 'data', 'hack', 'leak', 'secret']
+
+TEMPLATES = [
+    r'\b{0}\b', r'{0}\s+{1}', r'({0}|{1})_key\b', r'{0}=\w+', r'^{0}', r'{1}$', r'{0}(?=\s*{1})',
+    r'(?<!x){0}', r'({0})\W+\1', r'[a-z]+@{0}\.com', r'{0}.*?{1}', r'(?i:{0}){1}?', r'\d{{2,}}{0}',
+]
+
+def shipped_rules():
+    with open(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), Crawler.REGEXES_FILE)) as f:
+        return Crawler.parse_regexes(f.readlines())
+
+def fuzzed_rules(rnd, count):
+    rules = []
+    for n in range(count):
+        regex = rnd.choice(TEMPLATES).format(rnd.choice(WORDS), rnd.choice(WORDS))
+        rules.append([regex, 'fuzz{:d}.txt'.format(n), 'fuzz{:d}'.format(n % 5)])
+    return rules
+
+def fuzzed_text(rnd, words, sep=None):
+    parts = []
+    for _ in range(words):
+        p = rnd.random()
+        if p < 0.6:
+            parts.append(rnd.choice(WORDS).upper() if rnd.random() < 0.1 else rnd.choice(WORDS))
+        elif p < 0.8:
+            parts.append(''.join(rnd.choice(string.ascii_lowercase + string.digits) for _ in range(rnd.randint(1, 8))))
+        else:
+            parts.append(rnd.choice(['=', '_', '@', '.com', '|', 'x', '\n', '  ', '-', '12']))
+    if sep is None:
+        sep = rnd.choice(['', ' ', '_']) if rnd.random() < 0.2 else ' '
+    return sep.join(parts)
+
+def chunked(rnd, text):
+    start = 0
+    while start < len(text):
+        size = rnd.randint(1, 200)
+        yield text[start:start+size]
+        start += size
+
+def expected(rules, text):
+## the per-rule loop RuleSet replaces
+    found = []
+    for rule in rules:
+        r = re.search(rule[0], text, re.IGNORECASE)
+        if r:
+            found.append((rule, r[0]))
+    return found
+
+
+class RuleSetTest(unittest.TestCase):
+
+    def check(self, ruleset, rules, rnd, pastes=300):
+        for _ in range(pastes):
+            text = fuzzed_text(rnd, rnd.randint(0, 60))
+            self.assertEqual(ruleset.scan(text), expected(rules, text), text)
+
+    def test_scan_matches_each_rule(self):
+        rnd = random.Random(1)
+        for _ in range(20):
+            rules = shipped_rules() + fuzzed_rules(rnd, rnd.randint(1, 30))
+            self.check(RuleSet(rules, engine='python'), rules, rnd, pastes=50)
+
+    def test_scan_without_literals(self):
+        rnd = random.Random(2)
+        saved = pastebin_crawler.sre_parse
+        pastebin_crawler.sre_parse = None	# as if the private parser were gone
+        try:
+            rules = shipped_rules() + fuzzed_rules(rnd, 20)
+            ruleset = RuleSet(rules, engine='python')
+            self.assertTrue(all(literals is None for literals in ruleset.literals))
+            self.assertFalse(any(ruleset.combinable))
+        finally:
+            pastebin_crawler.sre_parse = saved
+        self.check(ruleset, rules, rnd)
+
+    def test_rules_tried_at_their_literals(self):
+        rnd = random.Random(4)
+        rules = fuzzed_rules(rnd, 40)
+        ruleset = RuleSet(rules, engine='python')
+        self.assertEqual(RuleSet.leading_literals(r'(Data|the)_key\b'), {'data', 'the'})
+        self.assertEqual(RuleSet.leading_literals(r'\bkey\bboard'), {'key'})
+        self.assertIsNone(RuleSet.leading_literals(r'(|key)board'))
+        self.assertIsNone(RuleSet.leading_literals(r'(?<!x)key'))
+        ruleset.ANCHOR_SPAN = 100	# searches on past the common literals
+        self.check(ruleset, rules, rnd)
+        for text in ('STRASSE ' + fuzzed_text(rnd, 40), 'straße ' + fuzzed_text(rnd, 40)):	# casefolded to the same length or not
+            self.assertEqual(ruleset.scan(text), expected(rules, text), text)
+
+    def test_sampled_searches_are_timed(self):
+        rules = shipped_rules()
+        text = 'my password is key'
+        for sample,timed in ((0.0, 0), (1.0, len(rules))):
+            ruleset = RuleSet(rules, engine='python', sample=sample)
+            timings = []
+            self.assertEqual(ruleset.search(text, timings=timings), RuleSet(rules, engine='python').search(text))
+            self.assertEqual(len(timings), len(ruleset.candidates(text)) if timed else 0)
+
+    def test_disabled_rules_are_skipped(self):
+        rules = shipped_rules()
+        ruleset = RuleSet(rules, engine='python', disabled=[0])
+        self.assertEqual([rule for rule,found in ruleset.scan('my password is key')], [rules[1]])
+
+    def test_scan_stream_ignores_the_cut(self):
+        ruleset = RuleSet([[r'\bkey\b', 'key.txt', 'key'], [r'key$', 'end.txt', 'end'], [r'keyb\w*', 'word.txt', 'word']], engine='python')
+        text = 'x' * 12 + ' key' + 'board tail'	# the first window of 16 ends between key and board
+        found = ruleset.scan_stream(iter([text]), window=16, overlap=8)
+        self.assertEqual(found, ruleset.scan(text))
+        self.assertEqual(found, [(ruleset.rules[2], 'keyboard')])
+
+    def test_scan_stream_never_ends_a_match_at_the_context(self):
+        ruleset = RuleSet([[r'\w+$', 'tail.txt', 'tail'], [r'key\d+', 'key.txt', 'key']], engine='python')
+        for n in range(40):
+            text = 'a b ' * n + 'key' + '1' * 30 + ' c tail'	# matches longer than the overlap
+            found = {rule[1]:matched for rule,matched in ruleset.scan_stream(iter([text]), window=16, overlap=4)}
+            self.assertEqual(found.get('tail.txt'), 'tail', text)
+            self.assertIn(found.get('key.txt'), (None, 'key' + '1' * 30), text)	# missed maybe, never cut short
+
+    def test_scan_stream_matches_scan(self):
+        rnd = random.Random(3)
+        templates = [t for t in TEMPLATES if '*' not in t and '+' not in t and ',}' not in t]	# matches shorter than the overlap
+        for _ in range(30):
+            rules = shipped_rules() + [[rnd.choice(templates).format(rnd.choice(WORDS), rnd.choice(WORDS)), 'fuzz{:d}.txt'.format(n), 'fuzz{:d}'.format(n)] for n in range(20)]
+            ruleset = RuleSet(rules, engine='python')
+            for _ in range(10):
+                text = fuzzed_text(rnd, rnd.randint(0, 400), sep=' ')
+                self.assertEqual(ruleset.scan_stream(chunked(rnd, text), window=64, overlap=24), ruleset.scan(text), text)
+
+
+if __name__ == '__main__':
+    unittest.main()
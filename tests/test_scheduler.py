@@ -0,0 +1,81 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pastebin_crawler import ArchiveEntry, RateController, Scheduler
+
+
+def row(paste_id, title='Untitled', syntax='None', age=30, size=2048):
+    return ArchiveEntry(paste_id, title, syntax, age, size)
+
+
+class SchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = [1000.0]
+        self.scheduler = Scheduler('priority', clock=lambda: self.clock[0])
+
+    def learn(self, title, outcome, count):
+        for n in range(count):
+            paste_id = '/{:s}{:d}'.format(title.replace(' ', ''), n)
+            self.scheduler.order([row(paste_id, title=title)])
+            self.scheduler.outcome(paste_id, outcome)
+
+    def test_page_keeps_the_archive_order(self):
+        scheduler = Scheduler()
+        self.assertEqual(scheduler.policy, 'page')
+        pastes = [row('/a', 'db dump'), row('/b'), row('/c', 'combo list')]
+        self.assertEqual(scheduler.order(pastes), pastes)
+
+    def test_priority_learns_from_outcomes(self):
+        self.learn('db dump', 'matched', 30)
+        self.learn('Untitled', 'clean', 30)
+        pastes = [row('/x1'), row('/x2'), row('/leak', 'db dump')]
+        self.assertEqual([paste.id for paste in self.scheduler.order(pastes)], ['/leak', '/x1', '/x2'])
+        self.assertEqual(self.scheduler.counters['promoted'], 1)
+
+    def test_pending_rows_keep_their_listing(self):
+        self.learn('db dump', 'matched', 30)
+        self.learn('Untitled', 'clean', 30)
+        self.scheduler.order([row('/old'), row('/leak', 'db dump')])
+        pending = [ArchiveEntry('/leak', None, None, None, None), ArchiveEntry('/old', None, None, None, None)]
+        self.assertEqual([paste.id for paste in self.scheduler.order([row('/new')] + pending)][0], '/leak')
+
+    def test_deferred_outcomes(self):
+        self.scheduler.order([row('/a'), row('/b'), row('/c')])
+        for paste_id in ('/a', '/b', '/c'):
+            self.scheduler.deferred(paste_id)
+        self.scheduler.order([ArchiveEntry('/a', None, None, None, None), row('/b')])
+        self.scheduler.outcome('/a', 'clean')
+        self.scheduler.outcome('/b', 'gone')
+        self.assertEqual((self.scheduler.counters['deferred_clean'], self.scheduler.counters['deferred_gone']), (1, 1))
+        self.assertIn('of the deferred 1 fetched later and 1 gone', self.scheduler.summary())
+
+    def test_state_round_trip(self):
+        self.learn('db dump', 'matched', 5)
+        restored = Scheduler('priority')
+        restored.restore(self.scheduler.state())
+        self.assertEqual(restored.rates['*'], [5, 0, 0])
+
+
+class DeadlineTest(unittest.TestCase):
+
+    def test_deadline_follows_the_measured_interval(self):
+        clock = [0.0]
+        rate = RateController(clock=lambda: clock[0])
+        self.assertEqual(rate.deadline(200), 200)	# nothing measured yet
+        for n in range(10):
+            rate.archive(50, 40)
+            clock[0] += 120
+        self.assertLess(rate.refresh(200), 120)	# the turnover asks for faster polls
+        self.assertAlmostEqual(rate.deadline(200), 120)
+        rate.archive(50, 5, repoll=True)	# an early re-poll is not a refresh interval
+        clock[0] += 1
+        rate.archive(50, 5, repoll=True)
+        self.assertAlmostEqual(rate.deadline(200), 120)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pastebin_crawler import SeenIndex
+
+
+class SeenIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'seen.db')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_survives_a_restart(self):
+        seen = SeenIndex(self.path)
+        for paste_id in ('/a', '/b', '/c'):
+            seen.add(paste_id)
+        seen.discard('/b')
+        seen.close()
+        seen = SeenIndex(self.path)
+        self.assertEqual(list(seen.entries), ['/a', '/c'])
+        seen.close()
+
+    def test_uncommitted_ids_are_lost(self):
+        seen = SeenIndex(self.path)
+        seen.add('/a')
+        seen.commit()
+        seen.add('/b')
+        seen.db.close()	# a crash before the next checkpoint
+        seen = SeenIndex(self.path)
+        self.assertIn('/a', seen)
+        self.assertNotIn('/b', seen)
+        seen.close()
+
+    def test_only_recent_entries_are_loaded(self):
+        seen = SeenIndex(self.path, ttl=60)
+        seen.add('/old')
+        seen.entries['/old'] = seen.pending['/old'] = time.time() - 120
+        seen.add('/new')
+        seen.close()
+        seen = SeenIndex(self.path, ttl=60, max_entries=10)
+        self.assertEqual(list(seen.entries), ['/new'])
+        seen.close()
+
+    def test_bounded_by_size(self):
+        seen = SeenIndex(self.path, max_entries=3)
+        for n in range(5):
+            seen.add('/p{:d}'.format(n))
+        self.assertEqual(list(seen.entries), ['/p2', '/p3', '/p4'])
+        seen.close()
+        seen = SeenIndex(self.path, max_entries=2)	# the newest ones on disk
+        self.assertEqual(list(seen.entries), ['/p3', '/p4'])
+        seen.close()
+
+    def test_prune_drops_expired_entries(self):
+        seen = SeenIndex(self.path, ttl=60)
+        seen.add('/old')
+        seen.entries['/old'] = seen.pending['/old'] = time.time() - 120
+        seen.add('/new')
+        seen.commit()
+        self.assertEqual(seen.prune(), 1)
+        self.assertEqual(list(seen.entries), ['/new'])
+        self.assertEqual(seen.db.execute('SELECT id FROM seen').fetchall(), [('/new',)])
+        seen.close()
+
+    def test_in_memory_only(self):
+        seen = SeenIndex('')
+        seen.add('/a')
+        seen.close()
+        self.assertIn('/a', seen)
+
+
+if __name__ == '__main__':
+    unittest.main()
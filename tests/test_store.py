@@ -0,0 +1,87 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pastebin_crawler import PasteStore
+
+
+BODY = ['user admin\n', 'password=hunter2\n' * 50, 'ünïcödé and a lone surrogate \udc80\n']
+
+
+class PasteStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'store')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def store(self, **kwargs):
+        store = PasteStore(self.path, codec='gzip', **kwargs)
+        self.addCleanup(store.close)
+        return store
+
+    def test_put_and_get(self):
+        store = self.store()
+        digest,new = store.put(BODY)
+        self.assertTrue(new)
+        self.assertEqual(store.get(digest), ''.join(BODY))
+        self.assertEqual(store.get(digest.hex()), ''.join(BODY))
+        self.assertEqual(store.put(lambda: iter(BODY)), (digest, False))
+
+    def test_duplicates_are_stored_once(self):
+        store = self.store()
+        first = store.save('/a', 'password', 'passwords.txt', BODY, timestamp='t1')
+        second = store.save('/b', 'password', 'passwords.txt', [''.join(BODY)], timestamp='t2')
+        self.assertEqual(first, second)
+        self.assertEqual(len(store.bodies), 1)
+        self.assertEqual(store.totals['deduplicated'], 1)
+        self.assertEqual([record[:2] for record in store.records()], [('t1', 'a'), ('t2', 'b')])
+
+    def test_reopened(self):
+        store = self.store()
+        digests = [store.put(['paste {:d}\n'.format(n)] * 20)[0] for n in range(5)]
+        store.close()
+        store = self.store()
+        self.assertEqual([store.get(digest) for digest in digests], ['paste {:d}\n'.format(n) * 20 for n in range(5)])
+        digest,new = store.put(['paste 5\n'])
+        self.assertTrue(new)
+        self.assertEqual(store.get(digest), 'paste 5\n')
+
+    def test_torn_index_record(self):
+        store = self.store()
+        kept = store.put(['kept\n'])[0]
+        store.close()
+        with open(os.path.join(self.path, 'bodies.idx'), 'ab') as f:
+            f.write(b'\x01' * (PasteStore.RECORD.size // 2))	# a crash in the middle of a record
+        store = self.store()
+        self.assertEqual(list(store.bodies), [kept])
+        digest = store.put(['after the crash\n'])[0]
+        store.close()
+        self.assertEqual(os.path.getsize(os.path.join(self.path, 'bodies.idx')), 2 * PasteStore.RECORD.size)
+        store = self.store(readonly=True)
+        self.assertEqual(store.get(kept), 'kept\n')
+        self.assertEqual(store.get(digest), 'after the crash\n')
+
+    def test_segments_roll_over(self):
+        store = self.store()
+        store.max_segment = 64
+        digests = [store.put([os.urandom(64).hex()])[0] for n in range(4)]
+        self.assertEqual(len(set(store.bodies[digest][0] for digest in digests)), 4)
+        self.assertTrue(all(len(store.get(digest)) == 128 for digest in digests))
+
+    def test_one_writer_at_a_time(self):
+        store = self.store()
+        digest = store.put(BODY)[0]
+        with self.assertRaises(RuntimeError):
+            PasteStore(self.path, codec='gzip')
+        reader = self.store(readonly=True)
+        self.assertEqual(reader.get(digest), ''.join(BODY))
+
+
+if __name__ == '__main__':
+    unittest.main()
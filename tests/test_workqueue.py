@@ -0,0 +1,173 @@
+import os
+import sys
+import tempfile
+import time
+import unittest
+import urllib.error
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pastebin_crawler import Crawler, RemoteQueue, WorkQueue
+from fake_pastebin import FakePastebin
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class WorkQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.queue = WorkQueue(os.path.join(self.tmp.name, 'queue.db'), max_attempts=2)
+
+    def tearDown(self):
+        self.queue.close()
+        self.tmp.cleanup()
+
+    def expire(self, paste_id):
+        self.queue.db.execute('UPDATE queue SET lease = 0 WHERE id = ?', (paste_id,))
+
+    def test_publish_once(self):
+        self.assertEqual(self.queue.publish(['/a', '/b']), 2)
+        self.assertEqual(self.queue.publish(['/b', '/c']), 1)
+        self.assertEqual(self.queue.counts()['pending'], 3)
+
+    def test_claims_are_exclusive(self):
+        self.queue.publish(['/a', '/b', '/c'])
+        first = self.queue.claim('w1', 2)
+        second = self.queue.claim('w2', 2)
+        self.assertEqual(len(first), 2)
+        self.assertEqual(len(second), 1)
+        self.assertFalse(set(first) & set(second))
+        self.assertEqual(self.queue.claim('w3', 2), [])
+
+    def test_expired_lease_is_fenced(self):
+        self.queue.publish(['/a'])
+        [(paste_id, token)] = self.queue.claim('w1', 1)
+        self.expire(paste_id)
+        [(taken, newer)] = self.queue.claim('w2', 1)
+        self.assertEqual(taken, paste_id)
+        self.assertGreater(newer, token)
+        self.assertFalse(self.queue.renew(paste_id, token))
+        self.assertFalse(self.queue.complete(paste_id, token, 1))
+        self.assertFalse(self.queue.release(paste_id, token))
+        self.assertTrue(self.queue.renew(paste_id, newer))
+        self.assertTrue(self.queue.complete(paste_id, newer, 1))
+        self.assertEqual(self.queue.counts()['done'], 1)
+
+    def test_release_and_give_up(self):
+        self.queue.publish(['/a'])
+        [(paste_id, token)] = self.queue.claim('w1', 1)
+        self.assertTrue(self.queue.release(paste_id, token))
+        [(paste_id, token)] = self.queue.claim('w2', 1)
+        self.expire(paste_id)
+        self.assertEqual(self.queue.claim('w3', 1), [])	# claimed max_attempts times
+        self.assertEqual(self.queue.counts()['failed'], 1)
+
+    def test_served_queue_needs_the_token(self):
+        self.queue.publish(['/a'])
+        url = 'http://127.0.0.1:{:d}'.format(self.queue.serve(0, '127.0.0.1', 's3cret'))
+        for token in ('', 'wrong'):
+            with self.assertRaises(urllib.error.HTTPError) as refused:
+                RemoteQueue(url, timeout=5, token=token).claim('w1', 1)
+            self.assertEqual(refused.exception.code, 401)
+        self.assertEqual(self.queue.counts()['pending'], 1)
+        self.assertEqual([paste_id for paste_id,token in RemoteQueue(url, timeout=5, token='s3cret').claim('w1', 1)], ['/a'])
+
+
+class ErrorPastebin(FakePastebin):
+## answers 500 for the pastes in errors
+    errors = set()
+
+    def handle(self, path, headers):
+        if any(path.endswith(paste_id) for paste_id in self.errors):
+            return 500, 'text/html; charset=utf-8', b'<html><body>Internal Server Error</body></html>', {}
+        return super().handle(path, headers)
+
+
+class WorkerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.tmp.name)	# the log files
+        corpus = [{'id':'paste{:d}'.format(n), 'title':'Untitled', 'syntax':'None', 'body':'user admin password=secret{:d}'.format(n)} for n in range(4)]
+        self.site = ErrorPastebin(corpus, missing_ratio=0, slow_ratio=0)
+        self.url = self.site.start()
+        self.queue_path = os.path.join(self.tmp.name, 'queue.db')
+        self.queue = WorkQueue(self.queue_path)
+        self.queue.publish(['/' + p['id'] for p in corpus])
+        self.crawlers = []
+
+    def tearDown(self):
+        for crawler in self.crawlers:
+            crawler.writer.close()
+            crawler.queue.close()
+        self.queue.close()
+        self.site.stop()
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def worker(self, name):
+        crawler = Crawler(role='worker', queue_path=self.queue_path, data_dir=os.path.join(self.tmp.name, name), seen_db='', checkpoint='',
+                          base_url=self.url, max_rate=1000, prefilter=False)
+        crawler.REGEXES_FILE = os.path.join(HERE, Crawler.REGEXES_FILE)
+        crawler.conclude_on_delete = False
+        crawler.worker_id = name
+        crawler.pace(0)
+        self.crawlers.append(crawler)
+        return crawler
+
+    def listed(self, name):
+        path = os.path.join(self.tmp.name, name, 'passwords.txt')
+        if not os.path.exists(path):
+            return []
+        with open(path) as f:
+            return [line.rstrip().rsplit('/', 1)[-1] for line in f]
+
+    def test_lease_expired_mid_batch(self):
+        first = self.worker('w1')
+        second = self.worker('w2')
+        claims = self.queue.claim('w1', 4, lease=600)
+        taken = claims[1][0]
+        fetch_paste = first.fetch_paste
+        def fetch_late(paste_id):
+            if paste_id == taken:	# w1 stalls past its lease on this one, w2 takes it over meanwhile
+                self.queue.db.execute('UPDATE queue SET lease = 0 WHERE id = ?', (paste_id,))
+                second.work_batch(self.queue.claim('w2', 4), 0)
+                second.writer.flush()
+            return fetch_paste(paste_id)
+        first.fetch_paste = fetch_late
+        first.work_batch(claims, 0)
+        first.writer.close()
+        second.writer.close()
+        self.assertEqual(self.listed('w2'), [taken.strip('/')])
+        self.assertEqual(sorted(self.listed('w1') + self.listed('w2')), sorted(paste_id.strip('/') for paste_id,token in claims))
+        self.assertEqual(self.queue.counts()['done'], 4)
+
+    def test_results_are_saved_once(self):
+        crawler = self.worker('w1')
+        claims = self.queue.claim('w1', 4)
+        crawler.work_batch(claims, 0)
+        crawler.writer.flush()
+        for paste_id,token in claims:	# processed again, e.g. after a crash before the claims were completed
+            crawler.save_result(paste_id, 'password=again', os.path.join(crawler.data_dir, 'passwords.txt'), os.path.join(crawler.data_dir, 'passwords'))
+        crawler.writer.close()
+        self.assertEqual(len(self.listed('w1')), 4)
+        self.assertEqual(len(os.listdir(os.path.join(self.tmp.name, 'w1', 'passwords'))), 4)
+
+    def test_failed_fetches_are_given_back(self):
+        ErrorPastebin.errors = {'paste2'}
+        try:
+            crawler = self.worker('w1')
+            crawler.fetch_mode = 'raw'
+            crawler.work_batch(self.queue.claim('w1', 4), 0)
+            crawler.writer.close()
+        finally:
+            ErrorPastebin.errors = set()
+        self.assertEqual(self.queue.counts(), {'pending':1, 'claimed':0, 'done':3, 'failed':0})
+        self.assertEqual(self.queue.claim('w2', 4)[0][0], '/paste2')
+        self.assertNotIn('paste2', self.listed('w1'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import os
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pastebin_crawler import PasteStore, ResultWriter
+
+
+class ResultWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.list = os.path.join(self.tmp.name, 'passwords.txt')
+        self.dir = os.path.join(self.tmp.name, 'passwords')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def writer(self, **kwargs):
+        writer = ResultWriter(root=self.tmp.name, **kwargs)
+        self.addCleanup(writer.close)
+        return writer
+
+    def lines(self):
+        with open(self.list) as f:
+            return [ResultWriter.line_id(line) for line in f]
+
+    def test_flush_waits_for_the_writes(self):
+        writer = self.writer(batch=4)
+        for n in range(10):
+            self.assertTrue(writer.result('/p{:d}'.format(n), 'https://pastebin.com/p{:d}'.format(n), self.list, self.dir, 'body {:d}'.format(n), '2024/01/01 00:00:00'))
+        writer.flush()
+        self.assertEqual(self.lines(), ['p{:d}'.format(n) for n in range(10)])
+        self.assertEqual(len(os.listdir(self.dir)), 10)
+
+    def test_after_runs_once_the_writes_are_done(self):
+        writer = self.writer(fsync='batch')
+        seen = []
+        done = threading.Event()
+        writer.result('/a', 'https://pastebin.com/a', self.list, self.dir, 'body', '2024/01/01 00:00:00')
+        writer.after(lambda: (seen.append(self.lines()), done.set()))
+        writer.result('/b', 'https://pastebin.com/b', self.list, self.dir, 'body', '2024/01/01 00:00:00')
+        self.assertTrue(done.wait(5))
+        writer.flush()
+        self.assertEqual(seen[0][:1], ['a'])
+        self.assertEqual(self.lines(), ['a', 'b'])
+
+    def test_after_is_skipped_when_a_write_failed(self):
+        writer = self.writer()
+        called = []
+        missing = os.path.join(self.tmp.name, 'missing', 'passwords.txt')	# its directory does not exist
+        writer.append(missing, 'missing-x-https://pastebin.com/x\n')
+        writer.after(called.append, 'x')
+        writer.flush()
+        writer.after(called.append, 'y')
+        writer.flush()
+        self.assertEqual(called, ['y'])
+        self.assertEqual(writer.totals['errors'], 1)
+
+    def test_failed_append_is_written_again(self):
+        writer = self.writer()
+        missing = os.path.join(self.tmp.name, 'missing', 'passwords.txt')
+        self.assertTrue(writer.result('/x', 'https://pastebin.com/x', missing, self.dir, 'body', '2024/01/01 00:00:00'))
+        writer.flush()
+        os.makedirs(os.path.dirname(missing))
+        self.assertTrue(writer.result('/x', 'https://pastebin.com/x', missing, self.dir, 'body', '2024/01/01 00:00:00'))
+        writer.flush()
+        with open(missing) as f:
+            self.assertEqual(len(f.readlines()), 1)
+
+    def test_saved_once_per_list(self):
+        with open(self.list, 'w') as f:
+            f.write('passwords-2024/01/01 00:00:00-https://pastebin.com/old\n')
+        writer = self.writer()
+        self.assertFalse(writer.result('/old', 'https://pastebin.com/old', self.list, self.dir, 'body', '2024/01/02 00:00:00'))
+        self.assertTrue(writer.result('/new', 'https://pastebin.com/new', self.list, self.dir, 'body', '2024/01/02 00:00:00'))
+        self.assertFalse(writer.result('/new', 'https://pastebin.com/new', self.list, self.dir, 'body', '2024/01/02 00:00:00'))
+        other = os.path.join(self.tmp.name, 'keys.txt')
+        self.assertTrue(writer.result('/new', 'https://pastebin.com/new', other, self.dir, 'body', '2024/01/02 00:00:00'))
+        writer.close()
+        self.assertEqual(self.lines(), ['old', 'new'])
+        self.assertEqual(writer.totals['skipped'], 2)
+
+    def test_spool_is_read_before_release(self):
+        writer = self.writer()
+        spool = tempfile.TemporaryFile(mode='w+', encoding='utf-8')
+        spool.write('big paste\n' * 1000)
+        writer.result('/big', 'https://pastebin.com/big', self.list, self.dir, spool, '2024/01/01 00:00:00')
+        writer.release(spool)
+        writer.flush()
+        self.assertTrue(spool.closed)
+        [name] = os.listdir(self.dir)
+        with open(os.path.join(self.dir, name)) as f:
+            self.assertEqual(f.read(), 'big paste\n' * 1000 + os.linesep)
+
+    def test_into_the_store(self):
+        store = PasteStore(os.path.join(self.tmp.name, 'store'), codec='gzip')
+        self.addCleanup(store.close)
+        writer = self.writer(store=store)
+        writer.result('/a', 'https://pastebin.com/a', self.list, self.dir, 'body', '2024/01/01 00:00:00')
+        writer.close()
+        [record] = store.records()
+        self.assertEqual(record[1:4], ('a', 'passwords', 'passwords'))
+        self.assertEqual(store.get(record[4]), 'body')
+        self.assertFalse(os.path.exists(self.dir))
+
+    def test_writes_after_close_are_inline(self):
+        writer = self.writer()
+        writer.close()
+        writer.result('/late', 'https://pastebin.com/late', self.list, self.dir, 'body', '2024/01/01 00:00:00')
+        self.assertEqual(self.lines(), ['late'])
+
+
+if __name__ == '__main__':
+    unittest.main()